@@ -0,0 +1,81 @@
+"""Per-turn prompt size and latency with and without context windowing.
+
+Builds a synthetic session (each turn: question, schema fetch, SQL call with a
+large result, final answer) and, for every turn, compares the unbounded
+history ADK would send against ``sql_agent.context.build_window`` with a
+summary refreshed every ``CONTEXT_SUMMARY_EVERY`` turns, as the background
+task does. Model latency is simulated as ``base + per_1k_tokens * tokens``
+so the run needs no API key; the windowing overhead itself is measured.
+
+Usage:
+    python benchmarks/context_window.py [--turns 50] [--base-ms 800] [--per-1k-ms 120]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import types  # noqa: E402
+
+from sql_agent import context  # noqa: E402
+
+_SCHEMA = "CREATE TABLE hospital_resource_timeseries (\n" + "".join(
+    f"  column_{i} FLOAT,\n" for i in range(60)
+) + ")"
+
+
+def _turn(i: int) -> list:
+    rows = repr([(f"PUNE_{h:03d}", f"Hospital {h}", 1000.0 + h * i) for h in range(50)])
+    return [
+        types.Content(role="user", parts=[types.Part(text=f"Question {i}: which hospitals have low oxygen?")]),
+        types.Content(role="model", parts=[types.Part.from_function_call(name="get_schema", args={"input": {}})]),
+        types.Content(role="user", parts=[types.Part.from_function_response(
+            name="get_schema", response={"schema_description": _SCHEMA})]),
+        types.Content(role="model", parts=[types.Part.from_function_call(
+            name="run_sql_query", args={"input": {"query": f"SELECT * FROM t WHERE x < {i}"}})]),
+        types.Content(role="user", parts=[types.Part.from_function_response(
+            name="run_sql_query", response={"raw_result": rows})]),
+        types.Content(role="model", parts=[types.Part(text=f"Answer {i}: 3 hospitals are below the threshold.")]),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--base-ms", type=float, default=800.0, help="simulated fixed model latency")
+    parser.add_argument("--per-1k-ms", type=float, default=120.0, help="simulated latency per 1k prompt tokens")
+    args = parser.parse_args()
+
+    history: list = []
+    summary, upto = None, 0
+    print(f"{'turn':>4} {'full tok':>9} {'window tok':>10} {'full ms':>8} {'window ms':>9} {'overhead ms':>11}")
+    window_latencies = []
+    for i in range(1, args.turns + 1):
+        history.extend(_turn(i))
+        # The model sees everything up to the new question plus tool traffic of this turn
+        full_tokens = context.estimate_tokens(history)
+        started = time.perf_counter()
+        window, _ = context.build_window(history, summary, upto)
+        overhead_ms = (time.perf_counter() - started) * 1000
+        window_tokens = context.estimate_tokens(window) + (len(summary) // 4 if summary else 0)
+        full_ms = args.base_ms + args.per_1k_ms * full_tokens / 1000
+        window_ms = args.base_ms + args.per_1k_ms * window_tokens / 1000 + overhead_ms
+        window_latencies.append(window_ms)
+        if i == 1 or i % 5 == 0:
+            print(f"{i:4d} {full_tokens:9d} {window_tokens:10d} {full_ms:8.0f} {window_ms:9.0f} {overhead_ms:11.2f}")
+
+        # Background refresh after the response, as schedule_summary_refresh does
+        turns = context.split_turns(history)
+        target = len(turns) - context.CONTEXT_KEEP_TURNS
+        if target - upto >= context.CONTEXT_SUMMARY_EVERY:
+            summary = context.extractive_summary(summary, turns[upto:target])
+            upto = target
+
+    tail = window_latencies[len(window_latencies) // 2:]
+    print(f"\nwindowed latency, second half of the session: min {min(tail):.0f} ms, max {max(tail):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
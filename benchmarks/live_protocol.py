@@ -0,0 +1,199 @@
+"""Round trips, session reads and latency per message: REST request chain vs /ws.
+
+Starts the app with uvicorn on a throwaway session database. The root agent is
+replaced by a fixed echo agent, a real ADK ``BaseAgent`` that emits one tool
+call, one tool result and the answer, so the real Runner and
+DatabaseSessionService do their usual work without a model or MySQL. The
+numbers therefore measure protocol and session overhead, which the REST chain
+pays on every message. Each client owns one session and sends messages one
+after another:
+
+- rest: what ``ui/src/App.jsx`` did per message, ``POST /sessions/ensure`` then ``POST /chat``
+- rest+history: the same plus ``GET /history`` to pick up the new messages (what /ws pushes)
+- ws: one ``chat`` frame on a socket bound once; latency to the ``response`` frame
+
+Session reads are counted by wrapping ``get_session`` in the server process.
+
+Usage:
+    python benchmarks/live_protocol.py [--messages 50] [--clients 8] [--agent-ms 0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from statistics import quantiles
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def serve(port: int, agent_ms: float) -> None:
+    """Server side: the real app with the echo agent installed as the runner's root agent."""
+    import uvicorn
+    from google.adk.agents import BaseAgent
+    from google.adk.events import Event
+    from google.adk.runners import Runner
+    from google.genai import types
+
+    import main
+    from server import runtime
+
+    class EchoAgent(BaseAgent):
+        async def _run_async_impl(self, ctx):
+            text = "".join(p.text for p in ctx.user_content.parts if p.text)
+            call = types.FunctionCall(name="run_sql_query", args={"query": "SELECT 1"})
+            yield Event(invocation_id=ctx.invocation_id, author=self.name, branch=ctx.branch,
+                        content=types.Content(role="model", parts=[types.Part(function_call=call)]))
+            if agent_ms:
+                await asyncio.sleep(agent_ms / 1000)
+            result = types.FunctionResponse(name="run_sql_query", response={"rows": [[1]]})
+            yield Event(invocation_id=ctx.invocation_id, author=self.name, branch=ctx.branch,
+                        content=types.Content(role="user", parts=[types.Part(function_response=result)]))
+            yield Event(invocation_id=ctx.invocation_id, author=self.name, branch=ctx.branch,
+                        content=types.Content(role="model", parts=[types.Part(text=f"echo: {text}")]))
+
+    service = runtime.get_session_service()
+    reads = {"get_session": 0}
+    original = service.get_session
+
+    async def counted(**kwargs):
+        reads["get_session"] += 1
+        return await original(**kwargs)
+
+    service.get_session = counted
+    runtime._runner = Runner(agent=EchoAgent(name="echo_agent"), app_name=runtime.APP_NAME, session_service=service)
+
+    @main.app.get("/bench/reads")
+    async def bench_reads():
+        return reads
+
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning", ws_ping_interval=None)
+
+
+async def _reads(http: httpx.AsyncClient, base: str) -> int:
+    return (await http.get(f"{base}/bench/reads")).json()["get_session"]
+
+
+async def _rest_client(base: str, user: str, messages: int, with_history: bool, out: dict) -> None:
+    async with httpx.AsyncClient(timeout=60) as http:
+        for i in range(messages):
+            started = time.perf_counter()
+            (await http.post(f"{base}/sessions/ensure", json={"user_id": user, "session_id": user})).raise_for_status()
+            response = await http.post(f"{base}/chat", json={"user_query": f"question {i}", "user_id": user,
+                                                              "session_id": user})
+            response.raise_for_status()
+            out["round_trips"] += 2
+            if with_history:
+                (await http.get(f"{base}/history/{user}/{user}")).raise_for_status()
+                out["round_trips"] += 1
+            out["latencies"].append(time.perf_counter() - started)
+
+
+async def _ws_client(base: str, user: str, messages: int, out: dict) -> None:
+    import websockets
+
+    async with websockets.connect(base.replace("http", "ws", 1) + "/ws", max_size=None) as ws:
+        await ws.send(json.dumps({"type": "bind", "user_id": user, "session_id": user}))
+        while json.loads(await ws.recv())["type"] != "bound":
+            pass
+        for i in range(messages):
+            started = time.perf_counter()
+            await ws.send(json.dumps({"type": "chat", "id": i, "text": f"question {i}"}))
+            out["round_trips"] += 1
+            while True:
+                frame = json.loads(await ws.recv())
+                out["frames"] += 1
+                if frame.get("id") == i and frame["type"] in ("response", "error"):
+                    if frame["type"] == "error":
+                        raise RuntimeError(frame)
+                    break
+            out["latencies"].append(time.perf_counter() - started)
+
+
+async def _run(mode: str, base: str, clients: int, messages: int) -> dict:
+    out = {"latencies": [], "round_trips": 0, "frames": 0}
+    prefix = f"{mode.replace('+', '_')}_{time.monotonic_ns()}"
+    async with httpx.AsyncClient(timeout=30) as http:
+        reads_before = await _reads(http, base)
+        started = time.perf_counter()
+        users = [f"{prefix}_{c}" for c in range(clients)]
+        if mode == "ws":
+            await asyncio.gather(*(_ws_client(base, u, messages, out) for u in users))
+        else:
+            await asyncio.gather(*(_rest_client(base, u, messages, mode == "rest+history", out) for u in users))
+        out["seconds"] = time.perf_counter() - started
+        out["reads"] = await _reads(http, base) - reads_before
+    return out
+
+
+def _wait_ready(base: str, proc: subprocess.Popen, timeout: float = 120) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            httpx.get(f"{base}/bench/reads", timeout=2).raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not come up")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50, help="messages per client")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients, one session each")
+    parser.add_argument("--agent-ms", type=float, default=0.0, help="simulated tool time inside the echo agent")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.port, args.agent_ms)
+        return
+
+    tmp = tempfile.mkdtemp(prefix="froncort-bench-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp}/sessions.db",
+        SHARED_CACHE_PATH=f"{tmp}/shared_cache.db",
+        ROUTING_LOG_PATH=f"{tmp}/routing_log.jsonl",
+        WARMUP_ON_STARTUP="false",
+        FEED_ENABLED="false",
+        RETENTION_ENABLED="false",
+        ANSWER_CACHE_ENABLED="false",
+        ADMISSION_USER_RATE="100000",
+        ADMISSION_USER_BURST="100000",
+        LOG_LEVEL="WARNING",
+        DEBUG="false",
+    )
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(args.port), "--agent-ms", str(args.agent_ms)],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        _wait_ready(base, proc)
+        # Unmeasured pass so imports, the sqlite file and the connection pools are warm
+        for mode in ("rest", "ws"):
+            asyncio.run(_run(mode, base, 2, 5))
+        total = args.clients * args.messages
+        print(f"{args.clients} clients x {args.messages} messages, echo agent {args.agent_ms:.0f} ms")
+        print(f"{'mode':<13} {'msg/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'trips/msg':>10} {'reads/msg':>10}")
+        for mode in ("rest", "rest+history", "ws"):
+            out = asyncio.run(_run(mode, base, args.clients, args.messages))
+            cuts = quantiles(out["latencies"], n=100)
+            print(f"{mode:<13} {total / out['seconds']:8.1f} {cuts[49] * 1000:8.1f} {cuts[98] * 1000:8.1f} "
+                  f"{out['round_trips'] / total:10.1f} {out['reads'] / total:10.1f}")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
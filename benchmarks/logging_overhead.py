@@ -0,0 +1,125 @@
+"""Per-request logging overhead, before and after the queue-based logging subsystem.
+
+Replays the log calls one ``/chat`` request makes: session ensure, about a
+dozen ADK events, one schema fetch and one SQL query with a 50-row result.
+It replays them in three configurations and reports the time spent on the
+request's own thread. Output goes to ``os.devnull``, so the numbers measure
+formatting and handler cost rather than terminal speed.
+
+- ``before``: the old code. ``basicConfig`` at DEBUG (the ``DEBUG=true``
+  default), f-strings built eagerly, ``str(event)`` and ``dir(session)``
+  for every record, and ``print`` of the full SQL result and schema.
+- ``after``: ``server.logs.setup()`` at the default INFO level.
+- ``after-debug``: the same at DEBUG, with ``chat-api.events`` sampled at
+  ``LOG_SAMPLE`` and large values capped.
+
+Usage:
+    python benchmarks/logging_overhead.py [--requests 300]
+"""
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from google.adk.events import Event  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from server import logs  # noqa: E402
+
+ROWS = str([(f"PUNE_{i:03d}", f"Hospital {i}", "govt", 120 + i, 31.5 + i, "2025-10-01 08:00:00") for i in range(50)])
+SCHEMA = "CREATE TABLE hospitals (\n" + ",\n".join(f"  column_{i} VARCHAR(50)" for i in range(300)) + "\n)"
+
+
+class _Session:
+    id = "session-1"
+    user_id = "user-1"
+    state = {"summary": "x" * 500}
+
+
+def _events(n: int = 12) -> list:
+    events = []
+    for i in range(n):
+        part = (types.Part(text="The ICU occupancy across govt hospitals is ... " * 20) if i % 3 == 0 else
+                types.Part(function_response=types.FunctionResponse(name="run_sql_query",
+                                                                      response={"raw_result": ROWS})))
+        events.append(Event(invocation_id="inv", author="sql_query_agent",
+                            content=types.Content(role="model", parts=[part])))
+    return events
+
+
+def request_before(logger: logging.Logger, events: list, session: _Session) -> None:
+    logger.debug(f"ensure_session_with_retries: {session.user_id}/{session.id}")
+    logger.debug(f"Session created successfully: {type(session)} - {dir(session)}")
+    logger.info(f"Session ensured for session_id: {session.id} - Session object: {type(session)}")
+    print("📘 Full database schema retrieved")
+    print("\n📄 Columns:\n", SCHEMA)
+    print("▶️ Running SQL query:", "SELECT hospital_id, hospital_name FROM hospitals WHERE ownership_type = 'govt'")
+    print("✅ Query executed successfully!")
+    print("Result:", ROWS)
+    logger.info(f"Agent run attempt 1 for session {session.id}")
+    for event in events:
+        logger.debug(f"Event: {event}")
+    logger.info(f"Got final response: {'The ICU occupancy ...'[:100]}...")
+
+
+def request_after(logger: logging.Logger, sql_logger: logging.Logger, event_logger: logging.Logger,
+                  session_logger: logging.Logger, events: list, session: _Session) -> None:
+    session_logger.debug("ensure_session_with_retries: %s/%s", session.user_id, session.id)
+    session_logger.debug("Session created: %s/%s", session.user_id, session.id)
+    session_logger.debug("Session ensured for session_id: %s", session.id)
+    sql_logger.debug("Full database schema retrieved (%d chars)", len(SCHEMA))
+    sql_logger.debug("Running SQL query: %s",
+                     logs.capped("SELECT hospital_id, hospital_name FROM hospitals WHERE ownership_type = 'govt'"))
+    sql_logger.debug("Query returned %d rows in %.1f ms", 50, 12.5)
+    logger.info("Agent run attempt %s for session %s", 1, session.id)
+    for event in events:
+        event_logger.debug("Event: %s", logs.capped(event))
+    logger.info("Got final response: %s", logs.capped("The ICU occupancy ...", 100))
+
+
+def _time(fn, requests: int) -> float:
+    fn()  # warm-up
+    started = time.perf_counter()
+    for _ in range(requests):
+        fn()
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    events, session = _events(), _Session()
+    logger = logging.getLogger("chat-api")
+    sink = open(os.devnull, "w", encoding="utf-8")
+    results = {}
+
+    logging.basicConfig(level=logging.DEBUG, format="%(asctime)s %(levelname)s %(message)s", stream=sink,
+                        force=True)
+    with contextlib.redirect_stdout(sink):
+        results["before"] = _time(lambda: request_before(logger, events, session), args.requests)
+
+    logs.setup(level="INFO", fmt="json", stream=sink)
+    loggers = [logging.getLogger(f"chat-api.{name}") for name in ("sql", "events", "session")]
+    results["after"] = _time(lambda: request_after(logger, *loggers, events, session), args.requests)
+    logging.getLogger().setLevel(logging.DEBUG)
+    results["after-debug"] = _time(lambda: request_after(logger, *loggers, events, session), args.requests)
+    drain_started = time.perf_counter()
+    logs.shutdown()
+    drain_ms = (time.perf_counter() - drain_started) * 1000
+
+    base = results["before"]
+    print(f"{'mode':<12} {'us/request':>11} {'vs before':>10}")
+    for mode, micros in results.items():
+        print(f"{mode:<12} {micros:11.1f} {micros / base:9.1%}")
+    print(f"\nlistener drain at shutdown: {drain_ms:.1f} ms; {logs.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Cached vs. uncached static-prefix tokens per request, measured offline.
+
+Assembles the real agent prefixes through ``server.prompt_cache`` (schema
+snapshot taken from ``data/mock_pune_50_hospitals.sql`` instead of MySQL),
+then replays ``--requests`` chat requests: each routes its question with
+``server.routing`` and issues the model calls the agents would make (three
+root calls plus the sub-agents that are not skipped), passing each call
+through the prompt-cache callback in local accounting mode. Halfway through
+the schema changes once, to show the cold misses a new prefix version costs.
+
+Usage:
+    python benchmarks/prompt_prefix.py [--requests 40] [--cached-price 0.25]
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from google.adk.models.llm_request import LlmRequest  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from server import prompt_cache, routing  # noqa: E402
+from sql_agent.agent import instruction_prompt as root_prompt  # noqa: E402
+from subagents.evaluate_result import instruction_prompt as evaluate_prompt  # noqa: E402
+from subagents.rewrite_prompt import instruction_prompt as rewrite_prompt  # noqa: E402
+
+QUESTIONS = [
+    "How many ICU beds are occupied at Ruby Hall Clinic?",
+    "Top 5 hospitals by total expenditure last month.",
+    "Compare staff cost against on-shift nurses per hospital by region.",
+    "List all suppliers with a lead time over 10 days.",
+]
+
+
+def _schema_from_sql() -> str:
+    with open(os.path.join(REPO_ROOT, "data", "mock_pune_50_hospitals.sql"), encoding="utf-8") as fh:
+        sql = fh.read()
+    return "\n\n".join(re.findall(r"CREATE TABLE.*?\);", sql, re.DOTALL))
+
+
+async def _call(agent: str, instruction: str, model: str, summary: str) -> None:
+    request = LlmRequest(model=model, config=types.GenerateContentConfig(system_instruction=instruction))
+    request.append_instructions([f'You are an agent. Your internal name is "{agent}".'])
+    if summary:
+        request.append_instructions([f"Summary of the earlier conversation:\n{summary}"])
+    await prompt_cache.before_model_callback(SimpleNamespace(agent_name=agent), request)
+
+
+async def _run(requests: int) -> list:
+    schema = prompt_cache.strip_sample_rows(_schema_from_sql())
+    rows = []
+    for i in range(requests):
+        if i == requests // 2:
+            schema += "\n\nCREATE TABLE staff_rosters (\n  hospital_id VARCHAR(50),\n  shift_date DATE\n);"
+        question = QUESTIONS[i % len(QUESTIONS)]
+        decision = routing.decide(question)
+        usage = prompt_cache.start()
+        summary = f"- Q: question {i - 1}" if i else ""
+        root = prompt_cache.assemble(routing.ROOT_AGENT, root_prompt, schema).text
+        for _ in range(3):
+            await _call(routing.ROOT_AGENT, root, decision.model_for(routing.ROOT_AGENT), summary)
+        for agent, prompt in ((routing.REWRITE_AGENT, rewrite_prompt), (routing.EVALUATE_AGENT, evaluate_prompt)):
+            model = decision.model_for(agent)
+            if model != routing.SKIP:
+                await _call(agent, prompt_cache.assemble(agent, prompt).text, model, "")
+        prompt_cache.finish(usage)
+        rows.append((i, decision.tier, prompt_cache.prefixes()[routing.ROOT_AGENT]["version"], usage))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--cached-price", type=float, default=0.25,
+                        help="price of a cached input token relative to an uncached one")
+    args = parser.parse_args()
+
+    rows = asyncio.run(_run(args.requests))
+    print(f"{'req':>4} {'tier':>8} {'root prefix':>15} {'calls':>5} {'prefix tok':>10} {'cached':>7} {'uncached':>8}")
+    for i, tier, version, usage in rows:
+        if i < 3 or abs(i - args.requests // 2) < 2 or i == len(rows) - 1:
+            print(f"{i:4d} {tier:>8} {version:>15} {usage.calls:5d} {usage.prefix_tokens:10d} "
+                  f"{usage.cached_tokens:7d} {usage.uncached_tokens:8d}")
+
+    stats = prompt_cache.prompt_cache_stats
+    total, cached = stats["prefix_tokens"], stats["cached_tokens"]
+    billed = stats["uncached_tokens"] + cached * args.cached_price
+    print(f"\nprefix tokens: {total}, served warm: {cached} ({cached / total:.1%}), cold: {stats['uncached_tokens']}")
+    print(f"prefix input cost at {args.cached_price:.2f}x for cached tokens: {billed / total:.1%} of uncached")
+    print(f"prefix mismatches (prefix not byte-identical): {stats['prefix_mismatches']}")
+    print("prefixes:", prompt_cache.prefixes())
+
+
+if __name__ == "__main__":
+    main()
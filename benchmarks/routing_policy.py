@@ -0,0 +1,157 @@
+"""Offline tuning of the model-routing policy against a stubbed model.
+
+Scores a labelled question set with ``server.routing`` and, for a grid of
+tier thresholds, estimates per-request latency and answer correctness with a
+stub model instead of calling Gemini:
+
+- latency: ``calls per agent x seconds per call`` for the routed model
+  (seconds per call are taken from ``--log`` when a routing log exists)
+- correctness: ``ACCURACY[root model][difficulty]`` plus a gain for the
+  rewrite step, which is lost when the router skips it
+
+The baseline is the pre-routing setup (flash root, pro rewrite and pro
+evaluate on every question). The fastest policy within ``--tolerance`` of the
+baseline's correctness is printed and, with ``--write-policy``, saved in the
+format ``ROUTING_POLICY_PATH`` loads.
+
+Usage:
+    python benchmarks/routing_policy.py [--questions q.jsonl] [--log .cache/routing_log.jsonl]
+                                        [--tolerance 0.01] [--write-policy routing_policy.json]
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+from itertools import product
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import routing  # noqa: E402
+
+FAST, STRONG, SKIP = routing.FAST_MODEL, routing.STRONG_MODEL, routing.SKIP
+
+# Stub model: seconds per call and probability of a correct final answer by difficulty
+SECONDS_PER_CALL = {FAST: 1.6, STRONG: 5.5}
+ACCURACY = {
+    FAST: {"simple": 0.97, "moderate": 0.86, "complex": 0.70},
+    STRONG: {"simple": 0.98, "moderate": 0.93, "complex": 0.88},
+}
+REWRITE_GAIN = {
+    SKIP: {"simple": 0.0, "moderate": 0.0, "complex": 0.0},
+    FAST: {"simple": 0.0, "moderate": 0.04, "complex": 0.07},
+    STRONG: {"simple": 0.01, "moderate": 0.06, "complex": 0.14},
+}
+# Root agent: schema, SQL and final answer turns
+CALLS = {routing.ROOT_AGENT: 3, routing.REWRITE_AGENT: 1, routing.EVALUATE_AGENT: 1}
+
+BASELINE_MODELS = {routing.ROOT_AGENT: FAST, routing.REWRITE_AGENT: STRONG, routing.EVALUATE_AGENT: STRONG}
+
+QUESTIONS = [
+    ("How many ICU beds are occupied at Ruby Hall Clinic?", "simple"),
+    ("Which hospitals have less than 500 liters of oxygen available?", "simple"),
+    ("List all suppliers with a lead time over 10 days.", "simple"),
+    ("Show the reorder level for surgical gloves.", "simple"),
+    ("How many ventilators are in use right now?", "simple"),
+    ("What is the region of Jehangir Hospital?", "simple"),
+    ("Which hospital has the highest ED occupancy?", "simple"),
+    ("Show on-shift doctors versus required doctors at each hospital.", "moderate"),
+    ("Average ED turnaround time over the last 6 hours by hospital.", "moderate"),
+    ("Top 5 hospitals by total expenditure last month.", "moderate"),
+    ("Which private hospitals have ICU occupancy above 90 percent?", "moderate"),
+    ("Monthly revenue trend for Sahyadri Hospital this year.", "moderate"),
+    ("Which items are below their reorder level and what do they cost per unit?", "moderate"),
+    ("Compare staff cost against on-shift nurses per hospital by region.", "complex"),
+    ("Rank regions by budget remaining relative to average daily admissions.", "complex"),
+    ("Correlate oxygen consumption with supply cost for government hospitals over time.", "complex"),
+    ("For every hospital, show ICU occupancy along with monthly maintenance cost and capacity.", "complex"),
+    ("Which vendors supply items whose unit cost grew the most, and their payment terms?", "complex"),
+]
+
+
+def _load_questions(path):
+    if not path:
+        return QUESTIONS
+    with open(path, encoding="utf-8") as fh:
+        rows = [json.loads(line) for line in fh if line.strip()]
+    return [(row["question"], row["difficulty"]) for row in rows]
+
+
+def _calibrate(log_path) -> None:
+    """Replace the stub's seconds per call with the mean observed per model."""
+    if not log_path or not os.path.exists(log_path):
+        return
+    seconds, calls = defaultdict(float), defaultdict(int)
+    with open(log_path, encoding="utf-8") as fh:
+        for line in fh:
+            entry = json.loads(line)
+            for agent, latency in entry.get("model_latency", {}).items():
+                model = entry["models"].get(agent)
+                if model in SECONDS_PER_CALL:
+                    seconds[model] += latency
+                    calls[model] += entry["model_calls"].get(agent, 1)
+    for model, n in calls.items():
+        SECONDS_PER_CALL[model] = seconds[model] / n
+    print(f"calibrated from {log_path}: " + ", ".join(f"{m} {s:.2f}s/call" for m, s in SECONDS_PER_CALL.items()))
+
+
+def _simulate(models: dict, difficulty: str):
+    latency = sum(SECONDS_PER_CALL[model] * CALLS[agent] for agent, model in models.items() if model != SKIP)
+    accuracy = ACCURACY[models[routing.ROOT_AGENT]][difficulty] + REWRITE_GAIN[models[routing.REWRITE_AGENT]][difficulty]
+    return latency, min(accuracy, 1.0)
+
+
+def _evaluate(policy, questions):
+    total_latency = total_accuracy = 0.0
+    tiers = defaultdict(int)
+    for question, difficulty in questions:
+        models = BASELINE_MODELS if policy is None else routing.decide(question, policy).models
+        if policy is not None:
+            tiers[routing.decide(question, policy).tier] += 1
+        latency, accuracy = _simulate(models, difficulty)
+        total_latency += latency
+        total_accuracy += accuracy
+    n = len(questions)
+    return total_latency / n, total_accuracy / n, dict(tiers)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", help="JSONL with question and difficulty (simple|moderate|complex)")
+    parser.add_argument("--log", default=routing.ROUTING_LOG_PATH, help="routing log used to calibrate latency")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="allowed correctness loss vs baseline")
+    parser.add_argument("--write-policy", help="save the chosen policy here")
+    args = parser.parse_args()
+
+    questions = _load_questions(args.questions)
+    _calibrate(args.log)
+
+    base_latency, base_accuracy, _ = _evaluate(None, questions)
+    print(f"{len(questions)} questions; baseline: {base_latency:.1f}s/request, {base_accuracy:.3f} correct\n")
+
+    print(f"{'simple<':>7} {'complex>=':>9} {'s/request':>9} {'correct':>7}  tiers")
+    best = None
+    for simple_below, complex_from in product([0.5, 1.0, 1.5, 2.0, 2.5], [1.5, 2.0, 2.5, 3.0, 4.0, 5.0]):
+        if complex_from < simple_below:
+            continue
+        policy = routing.load_policy("")
+        policy.update(simple_below=simple_below, complex_from=complex_from)
+        latency, accuracy, tiers = _evaluate(policy, questions)
+        print(f"{simple_below:7.1f} {complex_from:9.1f} {latency:9.1f} {accuracy:7.3f}  {tiers}")
+        if accuracy >= base_accuracy - args.tolerance and (best is None or latency < best[0]):
+            best = (latency, accuracy, policy)
+
+    if best is None:
+        print("\nno policy stays within the correctness tolerance")
+        return
+    latency, accuracy, policy = best
+    print(f"\nchosen: simple_below={policy['simple_below']} complex_from={policy['complex_from']}: "
+          f"{latency:.1f}s/request ({(1 - latency / base_latency) * 100:.0f}% faster), {accuracy:.3f} correct")
+    if args.write_policy:
+        with open(args.write_policy, "w", encoding="utf-8") as fh:
+            json.dump({k: policy[k] for k in ("weights", "simple_below", "complex_from", "tiers")}, fh, indent=2)
+        print(f"wrote {args.write_policy}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Startup-time benchmark for the FastAPI backend.
+
+Imports ``main`` in a fresh interpreter with ``-X importtime`` and reports the
+wall time of the import plus a per-module breakdown (self and cumulative
+microseconds, grouped by top-level package). With ``--warm`` it also runs the
+background warm-up in the same child process and reports each step.
+
+Usage:
+    python benchmarks/startup_time.py [--top 20] [--runs 3] [--warm]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from statistics import median
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+_CHILD = """
+import asyncio, json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+out = {"import_seconds": t1 - t0}
+if %(warm)r:
+    from server.runtime import warm_up
+    out["warm_up"] = asyncio.run(warm_up())
+print("@@BENCH@@" + json.dumps(out))
+"""
+
+
+def _run_child(warm: bool) -> tuple:
+    env = dict(os.environ, WARMUP_ON_STARTUP="false", PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD % {"warm": warm}],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    result = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("@@BENCH@@"):
+            result = json.loads(line[len("@@BENCH@@"):])
+    if result is None:
+        raise RuntimeError(f"child failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+    return result, proc.stderr
+
+
+def parse_importtime(stderr: str) -> list:
+    """Return ``(module, self_us, cumulative_us, depth)`` tuples from ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        m = _IMPORTTIME_LINE.match(line)
+        if m:
+            self_us, cum_us, indent, module = m.groups()
+            rows.append((module, int(self_us), int(cum_us), len(indent) // 2))
+    return rows
+
+
+def by_package(rows: list) -> dict:
+    totals = defaultdict(int)
+    for module, self_us, _, _ in rows:
+        totals[module.split(".")[0]] += self_us
+    return dict(totals)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=20, help="rows to show in each table")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to sample")
+    parser.add_argument("--warm", action="store_true", help="also run the background warm-up")
+    args = parser.parse_args()
+
+    import_times, rows, warm = [], [], None
+    for _ in range(args.runs):
+        result, stderr = _run_child(args.warm)
+        import_times.append(result["import_seconds"])
+        rows = parse_importtime(stderr)
+        warm = result.get("warm_up", warm)
+
+    print(f"import main: median {median(import_times) * 1000:.1f} ms over {args.runs} runs "
+          f"(min {min(import_times) * 1000:.1f} ms)")
+
+    print(f"\nTop {args.top} top-level packages by self time (last run):")
+    for package, us in sorted(by_package(rows).items(), key=lambda kv: -kv[1])[: args.top]:
+        print(f"  {us / 1000:9.1f} ms  {package}")
+
+    print(f"\nTop {args.top} modules by cumulative time (last run):")
+    for module, _, cum_us, depth in sorted(rows, key=lambda r: -r[2])[: args.top]:
+        print(f"  {cum_us / 1000:9.1f} ms  {'  ' * depth}{module}")
+
+    if warm is not None:
+        print(f"\nwarm-up: state={warm['state']} total={warm['warm_up_seconds']}s")
+        for step, info in warm["steps"].items():
+            status = "ok" if info["ok"] else f"error: {info.get('error')}"
+            print(f"  {step:15s} {info['seconds']:8.3f}s  {status}")
+
+
+if __name__ == "__main__":
+    main()
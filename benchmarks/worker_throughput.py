@@ -0,0 +1,124 @@
+"""Throughput of the gunicorn serving mode at 1, 2, 4 and 8 workers.
+
+Seeds a throwaway session database with one long conversation, then for each
+worker count starts ``gunicorn -c gunicorn.conf.py main:app`` against it and
+drives ``GET /history`` (session load, incremental extraction, JSON + gzip)
+with a fixed number of concurrent keep-alive clients. MySQL and the model are
+not needed. Numbers only scale up to the number of CPU cores on the host.
+
+Usage:
+    python benchmarks/worker_throughput.py [--workers 1 2 4 8] [--seconds 10] [--concurrency 32]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from statistics import quantiles
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+APP_NAME = "persistent_chatbot_app"
+
+
+async def _seed(db_url: str, messages: int) -> None:
+    from google.adk.events import Event
+    from google.adk.sessions import DatabaseSessionService
+    from google.genai import types
+
+    service = DatabaseSessionService(db_url=db_url)
+    session = await service.create_session(app_name=APP_NAME, user_id="bench", session_id="bench", state={})
+    for i in range(messages):
+        role, author = ("user", "user") if i % 2 == 0 else ("model", "sql_query_agent")
+        text = f"message {i}: " + "occupancy and oxygen figures for Pune hospitals " * 4
+        event = Event(author=author, invocation_id=f"inv{i // 2}",
+                      content=types.Content(role=role, parts=[types.Part(text=text)]))
+        await service.append_event(session, event)
+
+
+async def _drive(url: str, seconds: float, concurrency: int) -> list:
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def client() -> None:
+        async with httpx.AsyncClient(timeout=120, headers={"Accept-Encoding": "gzip"}) as http:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await http.get(url)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies
+
+
+def _wait_ready(base: str, proc: subprocess.Popen, workers: int, timeout: float = 180) -> None:
+    # Every worker must have booted (a distinct pid answered) before measuring
+    seen = set()
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            response = httpx.get(f"{base}/debug/startup", timeout=5)
+            seen.add(response.json()["pid"])
+            if len(seen) >= workers:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"only {len(seen)} of {workers} workers became reachable")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--messages", type=int, default=400, help="messages in the seeded session")
+    parser.add_argument("--warmup-seconds", type=float, default=5.0,
+                        help="unmeasured load first, so every worker has built its session index")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="froncort-bench-")
+    db_url = f"sqlite:///{tmp}/sessions.db"
+    asyncio.run(_seed(db_url, args.messages))
+    base = f"http://127.0.0.1:{args.port}"
+    url = f"{base}/history/bench/bench?limit=200"
+
+    print(f"cpu cores: {os.cpu_count()}, concurrency: {args.concurrency}, {args.seconds:.0f}s per run")
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for workers in args.workers:
+        env = dict(
+            os.environ,
+            DATABASE_URL=db_url,
+            SHARED_CACHE_PATH=f"{tmp}/shared_cache.db",
+            WEB_CONCURRENCY=str(workers),
+            BIND=f"127.0.0.1:{args.port}",
+            WARMUP_ON_STARTUP="false",
+            ACCESS_LOG="/dev/null",
+            DEBUG="false",
+        )
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+            cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_ready(base, proc, workers)
+            asyncio.run(_drive(url, args.warmup_seconds, args.concurrency))
+            latencies = asyncio.run(_drive(url, args.seconds, args.concurrency))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+        cuts = quantiles(latencies, n=100)
+        print(f"{workers:7d} {len(latencies) / args.seconds:9.1f} {cuts[49] * 1000:8.1f} {cuts[98] * 1000:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
 # functions/__init__.py
-from .db_tools import get_schema_tool, run_sql_query_tool
+from .db_tools import get_result_rows_tool, get_schema_tool, run_sql_query_tool
+from .preference_tools import get_user_priorities_tool, update_user_priority_tool
+from .resource_tools import get_active_alerts_tool, get_capacity_forecast_tool
 
-__all__ = ['get_schema_tool', 'run_sql_query_tool']
\ No newline at end of file
+__all__ = ['get_schema_tool', 'run_sql_query_tool', 'get_result_rows_tool', 'get_user_priorities_tool', 'update_user_priority_tool',
+           'get_active_alerts_tool', 'get_capacity_forecast_tool']
\ No newline at end of file
@@ -1,9 +1,17 @@
 # functions/db_tools.py
 from google.adk.tools.function_tool import FunctionTool
 from typing import Optional
-from langchain_community.utilities import SQLDatabase
 from dotenv import load_dotenv
+import logging
 import os
+import re
+import threading
+import time
+
+from server import answer_cache, deadline, query_log
+from server.logs import capped
+
+from .result_digest import DIGEST_MIN_ROWS, DIGEST_PREVIEW_ROWS, digest, result_store
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,34 +22,143 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "hospital_pass")
 DB_HOST = os.getenv("DB_HOST", "db")
 DB_PORT = os.getenv("DB_PORT", "3306")
 DB_NAME = os.getenv("DB_NAME", "hospital_data")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_WARM_CONNECTIONS = int(os.getenv("DB_WARM_CONNECTIONS", "2"))
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "3600"))
+SQL_MAX_EXECUTION_MS = int(os.getenv("SQL_MAX_EXECUTION_MS", "30000"))
+
+# "chat-api.sql" is its own category so it can be sampled (LOG_SAMPLE) separately
+logger = logging.getLogger("chat-api.sql")
 
 # Create MySQL connection string
 MYSQL_URI = f"mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-print(f"🔌 Trying to connect to: mysql+mysqlconnector://{DB_USER}:****@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+# The connection and the schema text are created on first use (or by warm_up)
+# so that importing this module never touches MySQL.
+_db = None
+_db_lock = threading.Lock()
+# table name -> (schema text, shared-cache generation, expiry as time.time())
+_schema_cache = {}
+
+
+def get_db():
+    """Return the shared SQLDatabase, connecting on first use."""
+    global _db
+    if _db is not None:
+        return _db
+    with _db_lock:
+        if _db is None:
+            # langchain is heavy to import; defer it until a query actually needs it
+            from langchain_community.utilities import SQLDatabase
+
+            logger.info("Connecting to mysql+mysqlconnector://%s:****@%s:%s/%s", DB_USER, DB_HOST, DB_PORT, DB_NAME)
+            try:
+                _db = SQLDatabase.from_uri(
+                    MYSQL_URI,
+                    engine_args={
+                        "pool_pre_ping": True,
+                        "pool_size": DB_POOL_SIZE,
+                        "pool_recycle": 1800,
+                    },
+                )
+            except Exception as e:
+                logger.error("MySQL connection failed: %s", e)
+                raise
+            logger.info("Connected to MySQL")
+    return _db
+
+
+def get_table_info(table_name: Optional[str] = None) -> str:
+    """Return schema text for one table (or the whole database).
+
+    Cached in the cross-process shared cache, so with several workers only the
+    first one to ask reflects the schema from MySQL. The in-process copy keeps
+    the shared cache's generation and expiry and is dropped when either moves
+    on, so ``clear_schema_cache()`` in any worker and ``SCHEMA_CACHE_TTL``
+    apply here too.
+    """
+    from server.shared_cache import get_shared_cache
+
+    key = table_name or ""
+    shared = get_shared_cache()
+    generation = shared.generation("schema")
+    cached = _schema_cache.get(key)
+    if cached is not None and cached[1] == generation and time.time() < cached[2]:
+        return cached[0]
+
+    def _reflect() -> str:
+        db = get_db()
+        return db.get_table_info([table_name]) if table_name else db.get_table_info()
+
+    schema = shared.get_or_set("schema", key or "*", _reflect, ttl=SCHEMA_CACHE_TTL)
+    # Expire with the shared entry; keeping the generation read before the lookup means an
+    # invalidation in between makes the next call re-read
+    expires_at = shared.expires_at("schema", key or "*") or time.time() + SCHEMA_CACHE_TTL
+    _schema_cache[key] = (schema, generation, expires_at)
+    return schema
+
+
+def clear_schema_cache() -> None:
+    """Forget the schema text in this process and in every other worker."""
+    from server.shared_cache import get_shared_cache
+
+    _schema_cache.clear()
+    get_shared_cache().invalidate("schema")
+
+
+def is_connected() -> bool:
+    return _db is not None
+
+
+def ping() -> None:
+    """Run a read-only ``SELECT 1`` on a pooled connection."""
+    with get_db()._engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+
+
+def pool_status() -> dict:
+    """Return checked-out/capacity numbers for the connection pool (empty before first use)."""
+    if _db is None:
+        return {}
+    pool = _db._engine.pool
+    checked_out = pool.checkedout() if hasattr(pool, "checkedout") else 0
+    capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0) if hasattr(pool, "size") else 0
+    return {"checked_out": checked_out, "capacity": capacity, "schema_cache_entries": len(_schema_cache)}
 
-# Try connecting to MySQL
-try:
-    db = SQLDatabase.from_uri(MYSQL_URI)
-    test = db.run("SELECT 1;")
-    print("✅ Connected to MySQL successfully!")
-    print("Test query result:", test)
-except Exception as e:
-    print("❌ Connection failed:", e)
-    raise e
+
+def warm_up(connections: int = DB_WARM_CONNECTIONS) -> dict:
+    """Pre-open pool connections and prefetch the full schema.
+
+    Args:
+        connections: Number of pooled connections to open concurrently
+
+    Returns:
+        Dictionary with the number of connections opened and the schema size
+    """
+    db = get_db()
+    opened = []
+    try:
+        for _ in range(max(1, min(connections, DB_POOL_SIZE))):
+            conn = db._engine.connect()
+            conn.exec_driver_sql("SELECT 1")
+            opened.append(conn)
+    finally:
+        for conn in opened:
+            conn.close()
+    schema = get_table_info()
+    return {"connections": len(opened), "schema_chars": len(schema)}
 
 
 # 🧩 Tool 1: Get schema
 def get_schema(input: Optional[dict] = None) -> dict:
     try:
         if not input or not input.get("table"):
-            schema = db.get_table_info()
-            print("📘 Full database schema retrieved")
+            schema = get_table_info()
+            logger.debug("Full database schema retrieved (%d chars)", len(schema))
             return {"schema_description": schema}
 
         table_name = input.get("table")
-        schema = db.get_table_info([table_name])
-        print(f"📘 Schema retrieved for table: {table_name}")
+        schema = get_table_info(table_name)
 
         lines = [
             line.strip()
@@ -53,29 +170,120 @@ def get_schema(input: Optional[dict] = None) -> dict:
         ]
         clean_schema = "\n".join(lines)
 
-        print("\n📄 Columns:\n", clean_schema)
+        logger.debug("Schema retrieved for table %s (%d columns)", table_name, len(lines))
         return {"schema_description": clean_schema}
 
     except Exception as ex:
-        print("❌ Error getting schema:", ex)
+        logger.warning("Error getting schema: %s", ex)
         return {"error": str(ex)}
 
 
+_QUERY_HEAD = re.compile(r"^\s*(?:\(\s*)*(with|select)\b", re.IGNORECASE)
+# Strings, quoted names and comments are skipped so parentheses and SELECT inside them do not count
+_SQL_TOKENS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|/\*.*?\*/|--[^\n]*|#[^\n]*|"
+                         r"[()]|\bselect\b", re.IGNORECASE | re.DOTALL)
+
+
+def with_time_limit(sql_query: str, limit_ms: int) -> str:
+    """Add MySQL's MAX_EXECUTION_TIME optimizer hint to the statement's first query block.
+
+    That is the first SELECT for ``SELECT ...`` and ``(SELECT ...) UNION ...``,
+    and the SELECT after the CTE list for ``WITH ... SELECT``.
+    """
+    head = _QUERY_HEAD.match(sql_query or "")
+    if head is None or "MAX_EXECUTION_TIME" in sql_query.upper():
+        return sql_query
+    after_ctes = head.group(1).casefold() == "with"
+    depth = 0
+    for token in _SQL_TOKENS.finditer(sql_query):
+        text = token.group(0)
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif text.casefold() == "select" and (depth == 0 or not after_ctes):
+            return f"{sql_query[:token.end()]} /*+ MAX_EXECUTION_TIME({limit_ms}) */{sql_query[token.end():]}"
+    return sql_query
+
+
+def execute_rows(sql_query: str) -> list:
+    """Run ``sql_query`` and return its rows as dicts (column -> value)."""
+    return list(get_db()._execute(sql_query, "all"))
+
+
+def format_rows(rows: list) -> str:
+    """Render rows exactly as ``SQLDatabase.run`` does (tuples, long strings truncated)."""
+    from langchain_community.utilities.sql_database import truncate_word
+
+    if not rows:
+        return ""
+    max_chars = get_db()._max_string_length
+    return str([tuple(truncate_word(value, length=max_chars) for value in row.values()) for row in rows])
+
+
+def _question(tool_context) -> Optional[str]:
+    content = getattr(tool_context, "user_content", None) if tool_context is not None else None
+    if content is not None and content.parts:
+        return "".join(p.text for p in content.parts if p.text) or None
+    from server import routing
+
+    decision = routing.current()
+    return decision.question if decision else None
+
+
 # 🧩 Tool 2: Run SQL query
-def run_sql_query(input: Optional[dict] = None) -> dict:
+def run_sql_query(input: Optional[dict] = None, tool_context=None) -> dict:
     sql_query = input.get("query") if input else None
-    print("▶️ Running SQL query:", sql_query)
+    logger.debug("Running SQL query: %s", capped(sql_query))
+
+    # Never let MySQL keep working past the request's deadline
+    limit_ms = SQL_MAX_EXECUTION_MS
+    budget = deadline.current()
+    if budget is not None:
+        left = budget.remaining()
+        if left <= 0:
+            deadline.deadline_stats["sql_calls_skipped"] += 1
+            return {"error": "request deadline exceeded before the query could run"}
+        limit_ms = max(1, min(limit_ms, int(left * 1000)))
+        budget.sql_calls += 1
 
+    # A cached final answer stays valid while the tables it read are unchanged; the
+    # watermarks are taken before the query so writes during the run are not missed
+    answer_cache.note_tables(query_log.tables_touched(sql_query))
+    started = time.perf_counter()
     try:
-        result = db.run(sql_query)
-        print("✅ Query executed successfully!")
-        print("Result:", result)
-        return {"raw_result": result}
+        rows = execute_rows(with_time_limit(sql_query, limit_ms))
+        duration_ms = (time.perf_counter() - started) * 1000
+        query_log.record(sql_query, duration_ms, len(rows), _question(tool_context))
+        logger.debug("Query returned %d rows in %.1f ms", len(rows), duration_ms)
+        if len(rows) < DIGEST_MIN_ROWS:
+            return {"raw_result": format_rows(rows)}
+        # Large results: statistics instead of rows; the rows stay retrievable by id
+        return {
+            "row_count": len(rows),
+            "digest": digest(rows),
+            "preview": format_rows(rows[:DIGEST_PREVIEW_ROWS]),
+            "result_id": result_store.put(rows),
+        }
     except Exception as ex:
-        print("❌ SQL execution error:", ex)
+        query_log.record(sql_query or "", (time.perf_counter() - started) * 1000, None,
+                         _question(tool_context), error=str(ex))
+        logger.warning("SQL execution error: %s", capped(ex))
         return {"error": str(ex)}
 
 
+# 🧩 Tool 5: Page through the rows behind a digest
+def get_result_rows(result_id: str, offset: int = 0, limit: int = 50) -> dict:
+    """Return raw rows of an earlier run_sql_query result that was summarized as a digest."""
+    rows = result_store.get(result_id)
+    if rows is None:
+        return {"error": f"result {result_id} is no longer available; run the query again"}
+    offset, limit = max(0, int(offset)), max(1, min(int(limit), 200))
+    page = rows[offset:offset + limit]
+    return {"row_count": len(rows), "offset": offset, "returned": len(page), "rows": format_rows(page)}
+
+
 # Create tool instances
 get_schema_tool = FunctionTool(get_schema)
-run_sql_query_tool = FunctionTool(run_sql_query)
\ No newline at end of file
+run_sql_query_tool = FunctionTool(run_sql_query)
+get_result_rows_tool = FunctionTool(get_result_rows)
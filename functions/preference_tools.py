@@ -0,0 +1,326 @@
+# functions/preference_tools.py
+"""Per-user preference store and the preference tools for the root agent.
+
+Preferences are short ``key: value`` pairs ("cost: low", "ownership: govt")
+kept in a ``user_preferences`` table in the session database (primary key
+``(user_id, pref_key)``, so loading one user is an index range scan).
+
+- Reads come from an in-process cache (one dict lookup); a user is loaded
+  from the table on first use and again after ``PREFERENCE_CACHE_TTL``, which
+  bounds how stale another worker's write can look.
+- Writes update the cache immediately and are queued; a background thread
+  persists them in batches, keeping only the latest value per key.
+- Every change recompiles the preferences into SQL filter hints (predicates
+  and orderings on the hospital schema), which ``before_model_callback``
+  hands to the agent with the preferences, so applying them needs no tool
+  call and no extra model turn.
+- ``/chat`` binds the request's user with ``begin`` and loads the user with
+  ``load`` in a worker thread before the run. The callback then reads the
+  cache only and never queries the table on the event loop.
+"""
+import asyncio
+import atexit
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.adk.tools.function_tool import FunctionTool
+
+from server import answer_cache
+
+PREFERENCE_CACHE_TTL = float(os.getenv("PREFERENCE_CACHE_TTL", "30"))
+PREFERENCE_FLUSH_INTERVAL = float(os.getenv("PREFERENCE_FLUSH_INTERVAL", "0.5"))
+PREFERENCE_BATCH_SIZE = int(os.getenv("PREFERENCE_BATCH_SIZE", "100"))
+PREFERENCE_MAX_PENDING = int(os.getenv("PREFERENCE_MAX_PENDING", "10000"))
+
+logger = logging.getLogger("chat-api")
+
+_CLEAR_VALUES = {"", "none", "null", "any", "no preference", "clear"}
+_UNSAFE = re.compile(r"[^\w\s.,&-]")
+
+# Synonyms mapped onto the values stored in the database
+_OWNERSHIP = {"govt": "govt", "government": "govt", "public": "govt", "private": "private",
+              "trust": "trust", "charitable": "trust", "ngo": "trust"}
+_LOW = {"low", "lowest", "cheap", "cheaper", "cheapest", "minimal", "min", "short", "shortest", "fast", "quick"}
+_HIGH = {"high", "highest", "expensive", "max", "long", "longest", "slow"}
+
+
+def _clean(text: Any, limit: int = 64) -> str:
+    return " ".join(_UNSAFE.sub("", str(text)).split()).casefold()[:limit]
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _direction(value: str) -> Optional[str]:
+    if value in _LOW:
+        return "ASC"
+    if value in _HIGH:
+        return "DESC"
+    return None
+
+
+def compile_hints(preferences: Dict[str, str]) -> List[Dict[str, str]]:
+    """Turn preferences into SQL hints: ``where`` predicates or ``order_by`` terms per table."""
+    hints: List[Dict[str, str]] = []
+
+    def add(kind: str, table: str, sql: str, key: str) -> None:
+        hints.append({"kind": kind, "table": table, "sql": sql, "source": f"{key}: {preferences[key]}"})
+
+    for key, value in sorted(preferences.items()):
+        if key == "ownership" and value in _OWNERSHIP:
+            add("where", "hospitals", f"hospitals.ownership_type = {_quote(_OWNERSHIP[value])}", key)
+        elif key == "region":
+            add("where", "hospitals", f"hospitals.region = {_quote(value.title())}", key)
+        elif key == "hospital":
+            add("where", "hospitals", f"hospitals.hospital_name LIKE {_quote('%' + value + '%')}", key)
+        elif key in ("vendor_type", "supplier_type"):
+            add("where", "suppliers", f"suppliers.vendor_type = {_quote(value)}", key)
+        elif key == "cost" and _direction(value):
+            add("order_by", "inventory_items", f"inventory_items.unit_cost {_direction(value)}", key)
+            add("order_by", "hospital_finance_monthly",
+                f"hospital_finance_monthly.total_expenditure {_direction(value)}", key)
+        elif key == "lead_time":
+            if value.isdigit():
+                add("where", "suppliers", f"suppliers.lead_time_days <= {int(value)}", key)
+            elif _direction(value):
+                add("order_by", "suppliers", f"suppliers.lead_time_days {_direction(value)}", key)
+        elif key == "payment_terms" and _direction(value):
+            add("order_by", "suppliers", f"suppliers.payment_terms_days {_direction(value)}", key)
+    return hints
+
+
+def parse_preference(text: str) -> Tuple[str, str]:
+    """Split "cost: low" (or "cost=low") into a normalised (key, value)."""
+    parts = re.split(r"[:=]", text, maxsplit=1)
+    key = _clean(parts[0], 32).replace(" ", "_")
+    return key, _clean(parts[1]) if len(parts) > 1 else ""
+
+
+class _Entry:
+    __slots__ = ("preferences", "hints", "loaded_at")
+
+    def __init__(self, preferences: Dict[str, str], loaded_at: float) -> None:
+        self.preferences = preferences
+        self.hints = compile_hints(preferences)
+        self.loaded_at = loaded_at
+
+
+class PreferenceStore:
+    """Write-through cache over the ``user_preferences`` table with batched persistence."""
+
+    def __init__(self, engine=None) -> None:
+        self._engine = engine
+        self._table = None
+        self._cache: Dict[str, _Entry] = {}
+        self._pending: Dict[Tuple[str, str], Tuple[Optional[str], float]] = {}
+        self._flushing: Dict[Tuple[str, str], Tuple[Optional[str], float]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self.stats = {"hits": 0, "loads": 0, "writes": 0, "flushed": 0, "flushes": 0, "flush_errors": 0,
+                      "last_flush_ms": 0.0}
+
+    def _db(self):
+        if self._engine is None:
+            from server.runtime import get_session_service
+
+            self._engine = get_session_service().db_engine
+        if self._table is None:
+            from sqlalchemy import Column, Float, MetaData, String, Table
+
+            metadata = MetaData()
+            self._table = Table(
+                "user_preferences", metadata,
+                Column("user_id", String(128), primary_key=True),
+                Column("pref_key", String(32), primary_key=True),
+                Column("pref_value", String(64), nullable=False),
+                Column("updated_at", Float, nullable=False),
+            )
+            metadata.create_all(self._engine)
+        return self._engine, self._table
+
+    def _load(self, user_id: str) -> _Entry:
+        engine, table = self._db()
+        with engine.connect() as conn:
+            rows = conn.execute(table.select().where(table.c.user_id == user_id)).fetchall()
+        preferences = {row.pref_key: row.pref_value for row in rows}
+        # Queued writes (and a batch being committed right now) are newer than the table
+        with self._lock:
+            for (pending_user, key), (value, _) in {**self._flushing, **self._pending}.items():
+                if pending_user == user_id:
+                    if value is None:
+                        preferences.pop(key, None)
+                    else:
+                        preferences[key] = value
+        self.stats["loads"] += 1
+        return _Entry(preferences, time.monotonic())
+
+    def fresh(self, user_id: str) -> bool:
+        entry = self._cache.get(user_id)
+        return entry is not None and time.monotonic() - entry.loaded_at < PREFERENCE_CACHE_TTL
+
+    def peek(self, user_id: str) -> Optional[_Entry]:
+        """The cached entry, however old, without touching the table."""
+        return self._cache.get(user_id)
+
+    def get(self, user_id: str) -> _Entry:
+        entry = self._cache.get(user_id)
+        if entry is not None and time.monotonic() - entry.loaded_at < PREFERENCE_CACHE_TTL:
+            self.stats["hits"] += 1
+            return entry
+        entry = self._cache[user_id] = self._load(user_id)
+        return entry
+
+    def set(self, user_id: str, key: str, value: Optional[str]) -> _Entry:
+        """Update one preference (``value=None`` removes it) and queue the write."""
+        current = self.get(user_id)
+        preferences = dict(current.preferences)
+        if value is None:
+            preferences.pop(key, None)
+        else:
+            preferences[key] = value
+        entry = self._cache[user_id] = _Entry(preferences, current.loaded_at)
+        with self._lock:
+            if len(self._pending) >= PREFERENCE_MAX_PENDING:
+                logger.warning("preference write queue is full (%d), waking the flusher", len(self._pending))
+                self._wake.set()
+            self._pending[(user_id, key)] = (value, time.time())
+            self.stats["writes"] += 1
+            if len(self._pending) >= PREFERENCE_BATCH_SIZE:
+                self._wake.set()
+        self._ensure_flusher()
+        return entry
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, name="preference-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wake.wait(PREFERENCE_FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Persist queued writes in one transaction; returns the number written."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._flushing = batch
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        try:
+            engine, table = self._db()
+            with engine.begin() as conn:
+                for (user_id, key), (value, updated_at) in batch.items():
+                    conn.execute(table.delete().where((table.c.user_id == user_id) & (table.c.pref_key == key)))
+                    if value is not None:
+                        conn.execute(table.insert().values(user_id=user_id, pref_key=key, pref_value=value,
+                                                           updated_at=updated_at))
+        except Exception as exc:
+            logger.warning("preference flush of %d writes failed, will retry: %s", len(batch), exc)
+            self.stats["flush_errors"] += 1
+            with self._lock:
+                # Keep anything written since; it is newer than the failed batch
+                self._pending = {**batch, **self._pending}
+                self._flushing = {}
+            return 0
+        with self._lock:
+            self._flushing = {}
+        self.stats["flushes"] += 1
+        self.stats["flushed"] += len(batch)
+        self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return len(batch)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"in_use": self.pending(), "capacity": PREFERENCE_MAX_PENDING, "cached_users": len(self._cache),
+                **self.stats}
+
+
+preference_store = PreferenceStore()
+atexit.register(preference_store.flush)
+
+# The user of the current /chat request; ADK's callback and tool contexts have no public user accessor
+_current_user: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("preference_user", default=None)
+
+
+def begin(user_id: Optional[str]) -> None:
+    """Make ``user_id`` the user of the run that follows (set before the run task starts)."""
+    _current_user.set(user_id)
+
+
+async def load(user_id: Optional[str]) -> None:
+    """Load ``user_id``'s preferences in a worker thread unless the cached copy is fresh."""
+    if not user_id or preference_store.fresh(user_id):
+        return
+    try:
+        await asyncio.to_thread(preference_store.get, user_id)
+    except Exception as exc:
+        logger.warning("preferences unavailable for %s: %s", user_id, exc)
+
+
+def _user_id(user_id: Optional[str]) -> Optional[str]:
+    # Trust the request's user over whatever the model passes
+    return _current_user.get() or user_id
+
+
+def format_preferences(preferences: Dict[str, str], hints: List[Dict[str, str]]) -> str:
+    lines = [f"- {key}: {value}" for key, value in sorted(preferences.items())]
+    lines += [f"- {h['table']}: {'WHERE' if h['kind'] == 'where' else 'ORDER BY'} {h['sql']}" for h in hints]
+    return "\n".join(lines)
+
+
+# 🧩 Tool 3: Get user preferences
+def get_user_priorities(user_id: Optional[str] = None) -> dict:
+    """Return the user's saved preferences and the SQL filter hints compiled from them."""
+    uid = _user_id(user_id)
+    if not uid:
+        return {"error": "user_id is required"}
+    try:
+        entry = preference_store.get(uid)
+    except Exception as ex:
+        return {"error": str(ex)}
+    return {"preferences": entry.preferences, "sql_hints": entry.hints}
+
+
+# 🧩 Tool 4: Save a user preference
+def update_user_priority(preference: str, user_id: Optional[str] = None) -> dict:
+    """Save a preference given as "key: value" (e.g. "cost: low"); "key: none" removes it."""
+    uid = _user_id(user_id)
+    key, value = parse_preference(preference or "")
+    if not uid or not key:
+        return {"error": "user_id and a preference like 'cost: low' are required"}
+    # The reply confirms a change to this user's state; it must not be replayed to others
+    answer_cache.note_uncacheable("preferences changed")
+    try:
+        entry = preference_store.set(uid, key, None if value in _CLEAR_VALUES else value)
+    except Exception as ex:
+        return {"error": str(ex)}
+    return {"status": "saved", "preferences": entry.preferences, "sql_hints": entry.hints}
+
+
+def before_model_callback(callback_context, llm_request) -> None:
+    """ADK hook: put the user's preferences and SQL hints after the static prompt prefix."""
+    uid = _current_user.get()
+    # Loaded by ``load`` before the run; a stale copy is fine for the rest of the run
+    entry = preference_store.peek(uid) if uid else None
+    if entry is not None and entry.preferences:
+        llm_request.append_instructions([
+            "User preferences (already loaded, apply the SQL hints when relevant):\n"
+            + format_preferences(entry.preferences, entry.hints)
+        ])
+    return None
+
+
+get_user_priorities_tool = FunctionTool(get_user_priorities)
+update_user_priority_tool = FunctionTool(update_user_priority)
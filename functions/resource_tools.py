@@ -0,0 +1,64 @@
+# functions/resource_tools.py
+"""Agent tools served from the in-memory resource feed instead of SQL."""
+from typing import Optional
+
+from google.adk.tools.function_tool import FunctionTool
+
+from server import alerts, answer_cache, forecast
+from server.resource_feed import TABLE
+
+
+# 🧩 Tool 6: Active resource alerts
+def get_active_alerts(severity: Optional[str] = None, hospital: Optional[str] = None,
+                      rule: Optional[str] = None) -> dict:
+    """Return the hospitals currently breaching resource thresholds (oxygen, ICU, beds, ED, ventilators, staff).
+
+    Args:
+        severity: "critical" or "warning" to filter, or omit for all
+        hospital: part of a hospital name or id to filter, or omit for all
+        rule: one rule name (oxygen_low, icu_full, beds_full, ed_full, ventilators_exhausted,
+            ed_critical_spike, ed_wait_long, doctor_shortfall), or omit for all
+    """
+    if not alerts.feed.hospital_ids:
+        return {"error": "the alert engine has no resource data yet; query hospital_resource_timeseries instead"}
+    answer_cache.note_tables([TABLE])
+    found = alerts.engine.alerts(severity=severity, hospital=hospital, rule=rule)
+    return {
+        "as_of": alerts.engine.as_of(),
+        "count": len(found),
+        "alerts": [{k: a[k] for k in ("rule", "severity", "hospital_name", "display", "description", "since")}
+                   for a in found],
+    }
+
+
+get_active_alerts_tool = FunctionTool(get_active_alerts)
+
+
+# 🧩 Tool 7: Capacity forecasts
+def get_capacity_forecast(hospital: Optional[str] = None, resource: Optional[str] = None,
+                          within_hours: Optional[float] = None) -> dict:
+    """Projected beds, ICU beds, ventilators and oxygen per hospital, from trends over recent snapshots.
+
+    Args:
+        hospital: part of a hospital name or id; omit to list the hospitals projected to run out
+            of a resource within ``within_hours``
+        resource: "beds", "icu", "ventilators" or "oxygen", or omit for all
+        within_hours: horizon of the question in hours (e.g. 12 for "tonight", 24 for "tomorrow");
+            defaults to 24 when listing hospitals
+    """
+    if resource and resource not in forecast.RESOURCES:
+        return {"error": f"unknown resource {resource!r}; use one of {', '.join(forecast.RESOURCES)}"}
+    if not alerts.feed.hospital_ids:
+        return {"error": "no resource snapshots loaded yet; query hospital_resource_timeseries instead"}
+    answer_cache.note_tables([TABLE])
+    if hospital:
+        found = forecast.forecaster.forecast(hospital, resource, within_hours)
+        if not found:
+            return {"error": f"no hospital matches {hospital!r}"}
+        return {"hospitals": found[:5], "matched": len(found)}
+    horizon = within_hours if within_hours is not None else 24.0
+    at_risk = forecast.forecaster.at_risk(horizon, resource)
+    return {"as_of": alerts.engine.as_of(), "within_hours": horizon, "count": len(at_risk), "at_risk": at_risk[:25]}
+
+
+get_capacity_forecast_tool = FunctionTool(get_capacity_forecast)
@@ -0,0 +1,183 @@
+# functions/result_digest.py
+"""Compact NumPy digest of a SQL result set, handed to the model instead of the rows.
+
+Questions across all hospitals return one row per hospital (or per hospital
+and timestamp), and the model used to add, average and rank those rows
+itself. ``digest()`` does that arithmetic up front, one vectorised pass per
+column:
+
+- numeric columns: count, nulls, sum, mean, std, min, quartiles, max, the
+  top and bottom ``k`` rows (named by the result's label column), a
+  histogram and IQR outlier flags;
+- text columns: distinct count and the most common values;
+- date/time columns: first and last value.
+
+The rows themselves stay in a small in-process store under a ``result_id``,
+so ``get_result_rows`` can page through them when the digest is not enough.
+"""
+import datetime
+import decimal
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+DIGEST_MIN_ROWS = int(os.getenv("DIGEST_MIN_ROWS", "20"))
+DIGEST_TOP_K = int(os.getenv("DIGEST_TOP_K", "5"))
+DIGEST_HISTOGRAM_BINS = int(os.getenv("DIGEST_HISTOGRAM_BINS", "5"))
+DIGEST_PREVIEW_ROWS = 5
+RESULT_STORE_SIZE = int(os.getenv("RESULT_STORE_SIZE", "64"))
+
+_NUMERIC = (int, float, decimal.Decimal)
+_TEMPORAL = (datetime.date, datetime.datetime, datetime.time)
+
+
+def _num(value: float) -> Any:
+    """Plain Python number, integral when exact, otherwise rounded to 3 decimals."""
+    value = float(value)
+    if not np.isfinite(value):
+        return None
+    return int(value) if value.is_integer() and abs(value) < 2 ** 53 else round(value, 3)
+
+
+def _kind(values: List[Any]) -> str:
+    present = [v for v in values if v is not None]
+    if not present:
+        return "empty"
+    if all(isinstance(v, _NUMERIC) and not isinstance(v, bool) for v in present):
+        return "numeric"
+    if all(isinstance(v, _TEMPORAL) for v in present):
+        return "temporal"
+    return "text"
+
+
+def label_column(columns: List[str], kinds: Dict[str, str]) -> Optional[str]:
+    """The column that best names a row: ``*_name``, then ``*_id``, then the first text column."""
+    text = [c for c in columns if kinds[c] == "text"]
+    for suffix in ("_name", "_id"):
+        for column in text:
+            if column.casefold().endswith(suffix):
+                return column
+    return text[0] if text else None
+
+
+def _numeric_summary(values: np.ndarray, labels: Optional[np.ndarray], top_k: int) -> Dict[str, Any]:
+    present = ~np.isnan(values)
+    data = values[present]
+    summary: Dict[str, Any] = {"type": "numeric", "count": int(data.size), "nulls": int(values.size - data.size)}
+    if not data.size:
+        return summary
+    q1, median, q3 = np.percentile(data, [25, 50, 75])
+    summary.update(
+        sum=_num(data.sum()), mean=_num(data.mean()), std=_num(data.std()),
+        min=_num(data.min()), p25=_num(q1), median=_num(median), p75=_num(q3), max=_num(data.max()),
+    )
+    names = labels[present] if labels is not None else np.arange(values.size)[present]
+
+    def ranked(order: np.ndarray) -> List[List[Any]]:
+        return [[str(names[i]), _num(data[i])] for i in order]
+
+    if data.size > top_k:
+        top = np.argpartition(-data, top_k - 1)[:top_k]
+        bottom = np.argpartition(data, top_k - 1)[:top_k]
+        summary["top"] = ranked(top[np.argsort(-data[top], kind="stable")])
+        summary["bottom"] = ranked(bottom[np.argsort(data[bottom], kind="stable")])
+    if np.unique(data).size > DIGEST_HISTOGRAM_BINS:
+        counts, edges = np.histogram(data, bins=DIGEST_HISTOGRAM_BINS)
+        summary["histogram"] = [[_num(edges[i]), _num(edges[i + 1]), int(c)] for i, c in enumerate(counts)]
+    iqr = q3 - q1
+    if iqr > 0:
+        low, high = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+        flagged = np.flatnonzero((data < low) | (data > high))
+        if flagged.size:
+            flagged = flagged[np.argsort(-np.abs(data[flagged] - median))][:top_k]
+            summary["outliers"] = {
+                "rule": f"outside [{_num(low)}, {_num(high)}] (1.5 x IQR)",
+                "count": int(np.count_nonzero((data < low) | (data > high))),
+                "rows": [[str(names[i]), _num(data[i]), "high" if data[i] > high else "low"] for i in flagged],
+            }
+    return summary
+
+
+def _text_summary(values: List[Any], top_k: int) -> Dict[str, Any]:
+    present = np.array([str(v) for v in values if v is not None], dtype=object)
+    summary: Dict[str, Any] = {"type": "text", "count": int(present.size), "nulls": len(values) - int(present.size)}
+    if present.size:
+        uniques, counts = np.unique(present, return_counts=True)
+        order = np.argsort(-counts, kind="stable")[:top_k]
+        summary["distinct"] = int(uniques.size)
+        if uniques.size == present.size:
+            # Every value is unique (names, ids): counts say nothing
+            return summary
+        summary["most_common"] = [[str(uniques[i]), int(counts[i])] for i in order]
+    return summary
+
+
+def _temporal_summary(values: List[Any]) -> Dict[str, Any]:
+    present = [v for v in values if v is not None]
+    return {"type": "temporal", "count": len(present), "nulls": len(values) - len(present),
+            "first": min(present).isoformat() if present else None,
+            "last": max(present).isoformat() if present else None}
+
+
+def digest(rows: List[Dict[str, Any]], top_k: int = DIGEST_TOP_K) -> Dict[str, Any]:
+    """Column statistics, rankings, distributions and outliers for ``rows`` (dicts of column -> value)."""
+    columns = list(rows[0].keys()) if rows else []
+    values = {c: [row.get(c) for row in rows] for c in columns}
+    kinds = {c: _kind(values[c]) for c in columns}
+    label = label_column(columns, kinds)
+    labels = np.array([str(v) for v in values[label]], dtype=object) if label else None
+
+    summaries: Dict[str, Any] = {}
+    for column in columns:
+        if kinds[column] == "numeric":
+            array = np.array([np.nan if v is None else float(v) for v in values[column]], dtype=float)
+            summaries[column] = _numeric_summary(array, labels, top_k)
+        elif kinds[column] == "temporal":
+            summaries[column] = _temporal_summary(values[column])
+        elif kinds[column] == "text":
+            summaries[column] = _text_summary(values[column], top_k)
+        else:
+            summaries[column] = {"type": "empty", "count": 0, "nulls": len(rows)}
+    return {"row_count": len(rows), "label_column": label, "columns": summaries}
+
+
+class ResultStore:
+    """Bounded LRU of recent result sets, so the model can ask for raw rows later."""
+
+    def __init__(self, size: int = RESULT_STORE_SIZE) -> None:
+        self.size = size
+        self._rows: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, rows: List[Dict[str, Any]]) -> str:
+        result_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._rows[result_id] = rows
+            while len(self._rows) > self.size:
+                self._rows.popitem(last=False)
+        return result_id
+
+    def get(self, result_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            rows = self._rows.get(result_id)
+            if rows is not None:
+                self._rows.move_to_end(result_id)
+            return rows
+
+
+result_store = ResultStore()
+
+
+def result_text(outcome: Dict[str, Any]) -> str:
+    """The part of a ``run_sql_query`` response to show a sub-agent: raw rows, error, or the digest."""
+    if "raw_result" in outcome:
+        return outcome["raw_result"]
+    if "error" in outcome:
+        return outcome["error"]
+    return json.dumps({k: outcome[k] for k in ("row_count", "digest", "preview") if k in outcome},
+                      separators=(",", ":"))
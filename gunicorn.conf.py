@@ -0,0 +1,20 @@
+# gunicorn.conf.py
+# Production serving mode: several uvicorn workers under gunicorn. Each worker
+# lazily builds its own runner and pools (server/runtime.py); caches that must
+# agree across workers live in the SQLite-backed shared cache (server/shared_cache.py).
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count(), 4))))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Agent runs take tens of seconds; don't let gunicorn kill a busy worker
+timeout = int(os.getenv("WORKER_TIMEOUT", "180"))
+graceful_timeout = int(os.getenv("WORKER_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+# Recycle workers now and then to bound memory growth from long-lived caches
+max_requests = int(os.getenv("WORKER_MAX_REQUESTS", "2000"))
+max_requests_jitter = 200
+# Don't preload: each worker must open its own MySQL/SQLite connections after fork
+preload_app = False
+accesslog = os.getenv("ACCESS_LOG", "-")
@@ -2,46 +2,59 @@ import os
 import asyncio
 import logging
 import traceback
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TYPE_CHECKING
 
+# The ADK runner, session service and the SQL agent tree (sql_agent/agent.py)
+# are built lazily in server.runtime so importing this module stays cheap and
+# never depends on MySQL being reachable.
+from server.runtime import APP_NAME, WARMUP_ON_STARTUP, get_runner, get_session_service, readiness, warm_up
+from server.resource_feed import FEED_ENABLED
+from server.retention import RETENTION_ENABLED
+from server import admission, answer_cache, deadline, health, live, logs, prompt_cache, routing, sql_examples, trace
+from server.history import etag_matches, history_index, make_etag, paginate
 
-# Google ADK imports (keeps same behavior as your previous file)
-
-from google.adk.runners import Runner
-from google.adk.sessions import DatabaseSessionService
-from google.genai import types
-
-
-# ---- IMPORTANT CHANGE ----
-# Import the SQL agent you already implemented in sql_agent/agent.py
-# In your agent file you named it `root_agent` earlier — import and reuse it.
-from sql_agent.agent import root_agent as chatbot_agent
-# --------------------------
+if TYPE_CHECKING:
+    from google.adk.runners import Runner
+    from google.genai import types
 
 load_dotenv()
 DEBUG = os.getenv("DEBUG", "true").lower() in ("1", "true", "yes")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-DATABASE_URL = db_url = "sqlite:///./my_chatbot_data.db"
 
-logging.basicConfig(level=logging.DEBUG if DEBUG else logging.INFO,
-                    format="%(asctime)s %(levelname)s %(message)s")
+# Queue-based JSON logging; LOG_LEVEL (default INFO) is independent of DEBUG
+logs.setup()
 logger = logging.getLogger("chat-api")
+session_logger = logging.getLogger("chat-api.session")
+event_logger = logging.getLogger("chat-api.events")
+
 
-# Initialize the session service with the database URL
-session_service = DatabaseSessionService(db_url=DATABASE_URL)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_task = asyncio.create_task(warm_up()) if WARMUP_ON_STARTUP else None
+    feed_task = None
+    if FEED_ENABLED:
+        # Importing alerts/forecast subscribes them to the feed before the first tick
+        from server import alerts, forecast, resource_feed  # noqa: F401
 
-# NOTE:
-# Previously you created a new Agent here. We now reuse your `chatbot_agent` imported above.
-# chatbot_agent is your SQL agent (root_agent) that has tools: get_schema_tool, run_sql_query_tool, etc.
+        feed_task = asyncio.create_task(resource_feed.poll_forever())
+    retention_task = None
+    if RETENTION_ENABLED:
+        from server import retention
 
-APP_NAME = "persistent_chatbot_app"
-runner = Runner(agent=chatbot_agent, app_name=APP_NAME, session_service=session_service)
+        retention_task = asyncio.create_task(retention.maintain_forever())
+    yield
+    for task in (warm_task, feed_task, retention_task):
+        if task is not None and not task.done():
+            task.cancel()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 origins = ["http://localhost:3000", "http://127.0.0.1:3000", "http://localhost:3003", "http://127.0.0.1:3003", "*", ]
 app.add_middleware(
     CORSMiddleware,
@@ -49,7 +62,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 class ChatRequest(BaseModel):
     user_query: str
@@ -62,13 +77,13 @@ class EnsureSessionRequest(BaseModel):
 
 async def simple_ensure_session(app_name: str, user_id: str, session_id: str):
     try:
-        session = await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        session = await get_session_service().get_session(app_name=app_name, user_id=user_id, session_id=session_id)
         if session is not None:
             return session
     except Exception as e:
-        logger.debug(f"Session not found: {e}")
+        session_logger.debug("Session not found: %s", e)
     try:
-        session = await session_service.create_session(
+        session = await get_session_service().create_session(
             app_name=app_name,
             user_id=user_id,
             session_id=session_id,
@@ -78,100 +93,72 @@ async def simple_ensure_session(app_name: str, user_id: str, session_id: str):
             raise RuntimeError("create_session returned None")
         return session
     except Exception as e:
-        logger.error(f"Failed to create session: {e}")
+        logger.error("Failed to create session: %s", e)
         raise e
 
-def _extract_messages_from_state(state: Optional[Dict[str, Any]]) -> List[Dict[str, str]]:
-    messages = []
-    if not state:
-        return messages
-    raw = state.get("messages") or state.get("history") or []
-    if not isinstance(raw, list):
-        return messages
-    for m in raw:
-        sender = None
-        text = None
-        if isinstance(m, dict):
-            if "sender" in m and "text" in m:
-                sender, text = m.get("sender"), m.get("text")
-            else:
-                role = m.get("role") or m.get("author")
-                parts = m.get("parts") or []
-                if role:
-                    sender = "user" if role == "user" else "bot"
-                if parts and isinstance(parts, list):
-                    p0 = parts[0]
-                    if isinstance(p0, dict):
-                        text = p0.get("text") or p0.get("content")
-                    elif isinstance(p0, str):
-                        text = p0
-        if sender and text:
-            messages.append({"sender": sender, "text": text})
-    return messages
-
 async def ensure_session_with_retries(app_name: str, user_id: str, session_id: str, 
                                      max_retries: int = 5, base_delay: float = 0.1):
     if not user_id or not session_id:
         raise ValueError("user_id and session_id are required")
 
-    logger.debug(f"ensure_session_with_retries: {user_id}/{session_id}")
+    session_logger.debug("ensure_session_with_retries: %s/%s", user_id, session_id)
     try:
-        session = await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        session = await get_session_service().get_session(app_name=app_name, user_id=user_id, session_id=session_id)
         if session is not None:
-            logger.debug("Session exists, returning existing session")
+            session_logger.debug("Session exists, returning existing session")
             return session
         else:
-            logger.debug("get_session returned None")
+            session_logger.debug("get_session returned None")
     except Exception as e:
-        logger.debug(f"Session doesn't exist: {e}")
+        session_logger.debug("Session doesn't exist: %s", e)
     last_exception = None
     for attempt in range(max_retries):
         try:
-            logger.debug(f"Creating session, attempt {attempt + 1}")
-            session = await session_service.create_session(
+            session_logger.debug("Creating session, attempt %s", attempt + 1)
+            session = await get_session_service().create_session(
                 app_name=app_name, 
                 user_id=user_id, 
                 session_id=session_id,
                 state={}  
             )
             if session is None:
-                logger.warning(f"create_session returned None on attempt {attempt + 1}")
+                logger.warning("create_session returned None on attempt %s", attempt + 1)
                 raise RuntimeError("create_session returned None")
-            logger.debug(f"Session created successfully: {type(session)} - {dir(session)}")
+            session_logger.debug("Session created: %s/%s", user_id, session_id)
             await asyncio.sleep(base_delay * (2 ** attempt))
             try:
-                verification_session = await session_service.get_session(
+                verification_session = await get_session_service().get_session(
                     app_name=app_name, 
                     user_id=user_id, 
                     session_id=session_id
                 )
                 if verification_session is not None:
-                    logger.debug("Session verified after creation")
+                    session_logger.debug("Session verified after creation")
                     return verification_session
                 else:
                     logger.warning("Verification returned None, continuing to retry")
                     raise RuntimeError("Session verification returned None")
             except Exception as verify_exc:
-                logger.warning(f"Session verification failed: {verify_exc}")
+                logger.warning("Session verification failed: %s", verify_exc)
                 raise verify_exc
         except Exception as create_exc:
             last_exception = create_exc
-            logger.debug(f"Session creation attempt {attempt + 1} failed: {create_exc}")
+            session_logger.debug("Session creation attempt %s failed: %s", attempt + 1, create_exc)
             try:
-                existing_session = await session_service.get_session(
+                existing_session = await get_session_service().get_session(
                     app_name=app_name, 
                     user_id=user_id, 
                     session_id=session_id
                 )
                 if existing_session is not None:
-                    logger.debug("Found existing session after creation failure")
+                    session_logger.debug("Found existing session after creation failure")
                     return existing_session
                 else:
-                    logger.debug("get_session returned None after creation failure")
+                    session_logger.debug("get_session returned None after creation failure")
             except Exception as get_exc:
-                logger.debug(f"Failed to get session after creation failure: {get_exc}")
+                session_logger.debug("Failed to get session after creation failure: %s", get_exc)
             if attempt == max_retries - 1:
-                logger.error(f"All retry attempts exhausted. Last exception: {create_exc}")
+                logger.error("All retry attempts exhausted. Last exception: %s", create_exc)
                 raise create_exc
             await asyncio.sleep(base_delay * (2 ** attempt))
     if last_exception:
@@ -179,35 +166,45 @@ async def ensure_session_with_retries(app_name: str, user_id: str, session_id: s
     else:
         raise RuntimeError(f"Failed to ensure session after {max_retries} attempts - unknown error")
 
-async def run_agent_with_session_recovery(runner: Runner, user_id: str, session_id: str, 
-                                        message: types.Content, max_attempts: int = 3):
+async def run_agent_with_session_recovery(runner: "Runner", user_id: str, session_id: str, 
+                                        message: "types.Content", max_attempts: int = 3):
     for attempt in range(max_attempts):
         try:
-            logger.info(f"Agent run attempt {attempt + 1} for session {session_id}")
+            logger.info("Agent run attempt %s for session %s", attempt + 1, session_id)
             final_response = ""
             async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=message):
-                logger.debug(f"Event: {event}")
+                # Sampled (LOG_SAMPLE) and capped; str(event) is only built if the record is kept
+                event_logger.debug("Event: %s", logs.capped(event))
+                # Tool and sub-agent calls become stage progress on /ws
+                live.progress_from_event(event)
                 if event.is_final_response():
                     final_response = event.content.parts[0].text
-                    logger.info(f"Got final response: {final_response[:100]}...")
+                    logger.info("Got final response: %s", logs.capped(final_response, 100))
             return final_response
         except ValueError as ve:
             if "Session not found" in str(ve) and attempt < max_attempts - 1:
-                logger.warning(f"Session not found on attempt {attempt + 1}, recreating session: {ve}")
+                budget = deadline.current()
+                if budget is not None and budget.remaining() <= 0.2 * (attempt + 1):
+                    # A retry could not finish inside the request deadline; don't start one
+                    deadline.deadline_stats["retries_skipped"] += 1
+                    raise ve
+                logger.warning("Session not found on attempt %s, recreating session: %s", attempt + 1, ve)
                 await asyncio.sleep(0.2 * (attempt + 1))
                 try:
-                    session = await ensure_session_with_retries(APP_NAME, user_id, session_id)
-                    logger.info(f"Session recreated: {session}")
+                    session = await deadline.bound(
+                        ensure_session_with_retries(APP_NAME, user_id, session_id), "session recreate"
+                    )
+                    logger.info("Session recreated: %s", session.id)
                     await asyncio.sleep(0.5)
                 except Exception as recreate_exc:
-                    logger.error(f"Failed to recreate session: {recreate_exc}")
+                    logger.error("Failed to recreate session: %s", recreate_exc)
                     if attempt == max_attempts - 1:
                         raise recreate_exc
                 continue  
             else:
                 raise ve
         except Exception as e:
-            logger.error(f"Unexpected error in agent run: {e}")
+            logger.error("Unexpected error in agent run: %s", e)
             raise e
     raise RuntimeError("Agent run failed after all recovery attempts")
 
@@ -224,48 +221,272 @@ async def ensure_session_endpoint(req: EnsureSessionRequest):
         raise HTTPException(status_code=500, detail=str(exc))
 
 @app.get("/history/{user_id}/{session_id}")
-async def history(user_id: str, session_id: str):
+async def history(user_id: str, session_id: str, request: Request,
+                  before: Optional[int] = None, after: Optional[int] = None, limit: Optional[int] = None):
     try:
-        s = await session_service.get_session(APP_NAME, user_id, session_id)
-        state = s.state or {}
-        msgs = _extract_messages_from_state(state)
-        return {"messages": msgs}
+        entry = await history_index.load(user_id, session_id)
     except Exception as exc:
         logger.debug("history: session missing or error: %s", exc)
         return {"messages": []}
+    if entry is None:
+        return {"messages": []}
+    etag = make_etag(entry.version, before, after, limit)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    page = paginate(entry.messages, before=before, after=after, limit=limit)
+    return JSONResponse(page, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+async def _chat_pipeline(user_id: str, session_id: str, user_query: str, priority: int = admission.DEFAULT,
+                         session: Any = None) -> str:
+    if session is None:
+        # /ws passes the session it ensured at bind time; REST looks it up per request
+        trace.notify("session", "start")
+        session = await deadline.bound(
+            ensure_session_with_retries(APP_NAME, user_id, session_id), "session ensure"
+        )
+        if session is None:
+            raise RuntimeError("Failed to create or retrieve session - session is None")
+        trace.notify("session", "end")
+        session_logger.debug("Session ensured for session_id: %s", session_id)
+    from google.genai import types
+
+    message = types.Content(role="user", parts=[types.Part(text=user_query)])
+    # Waits for a run slot (urgent roles first) or raises admission.Rejected
+    trace.notify("queue", "start")
+    async with admission.slot(priority) as waited:
+        trace.notify("queue", "end")
+        if waited > 0.05:
+            logger.info("Admitted after %.2fs in queue for session %s", waited, session_id)
+        return await run_agent_with_session_recovery(
+            get_runner(), user_id, session_id, message
+        )
+
+async def append_turn(user_id: str, session_id: str, question: str, answer: str, session: Any = None) -> None:
+    """Record a question answered without an agent run, so history and context still see it."""
+    from google.adk.events import Event
+    from google.genai import types
+
+    from sql_agent.agent import root_agent
+
+    if session is None:
+        session = await ensure_session_with_retries(APP_NAME, user_id, session_id)
+    invocation_id = Event.new_id()
+    for author, role, text in (("user", "user", question), (root_agent.name, "model", answer)):
+        event = Event(invocation_id=invocation_id, author=author,
+                      content=types.Content(role=role, parts=[types.Part(text=text)]))
+        try:
+            await get_session_service().append_event(session, event)
+        except ValueError as exc:
+            if "stale session" not in str(exc):
+                raise
+            # A held session (/ws) fell behind a run in another tab or worker: reload it once
+            fresh = await ensure_session_with_retries(APP_NAME, user_id, session_id)
+            session.last_update_time = fresh.last_update_time
+            await get_session_service().append_event(session, event)
+    history_index.invalidate(user_id, session_id)
+
+def _too_many_requests(exc: "admission.Rejected") -> Tuple[int, Dict[str, Any]]:
+    return 429, {"error": "Too many requests, please retry shortly", "reason": exc.reason,
+                 "retry_after": exc.retry_after}
 
 @app.post("/chat")
 async def chat_endpoint(req: ChatRequest, request: Request):
     if not req.user_id or not req.session_id:
         raise HTTPException(status_code=400, detail="user_id and session_id are required")
-    logger.info(f"Processing chat request for user_id={req.user_id}, session_id={req.session_id}")
+    status, body = await handle_chat(
+        req.user_id, req.session_id, req.user_query, role=admission.trusted_role(request.headers),
+        timeout=request.headers.get(deadline.DEADLINE_HEADER), is_disconnected=request.is_disconnected,
+    )
+    if status == 200:
+        live.session_changed(req.user_id, req.session_id)
+        return body
+    if status == 429:
+        return JSONResponse(status_code=429, content=body, headers={"Retry-After": str(body["retry_after"])})
+    if status == 499:
+        return Response(status_code=499)
+    if status == 504:
+        raise HTTPException(status_code=504, detail=body["error"])
+    if DEBUG:
+        return body
+    raise HTTPException(status_code=500, detail="Internal server error occurred")
+
+async def handle_chat(user_id: str, session_id: str, user_query: str, *, role: Optional[str] = None,
+                      timeout: Any = None, is_disconnected: Callable[[], Awaitable[bool]],
+                      session: Any = None) -> Tuple[int, Dict[str, Any]]:
+    """Answer one message for ``/chat`` and ``/ws``; returns an HTTP-style status and the body."""
+    logs.bind(user_id=user_id, session_id=session_id)
+    logger.info("Processing chat request for user_id=%s, session_id=%s", user_id, session_id)
+    if FEED_ENABLED:
+        # Threshold polling questions ("any hospital under 2 days of oxygen?") are
+        # answered from the in-memory alert set: no rate slot, model call or SQL
+        from server import alerts
+
+        fast_answer = alerts.answer(user_query)
+        if fast_answer is not None:
+            await append_turn(user_id, session_id, user_query, fast_answer, session)
+            logger.info("Answered from the alert engine for session %s", session_id)
+            return 200, {"response": fast_answer}
+    # Repeated questions are served from the answer cache while the tables they read are unchanged
+    cached, pending = await asyncio.to_thread(answer_cache.lookup, user_query, user_id)
+    if cached is not None:
+        await append_turn(user_id, session_id, user_query, cached, session)
+        logger.info("Answered from the answer cache for session %s", session_id)
+        return 200, {"response": cached}
     try:
-        session = await ensure_session_with_retries(APP_NAME, req.user_id, req.session_id)
-        if session is None:
-            raise RuntimeError("Failed to create or retrieve session - session is None")
-        logger.info(f"Session ensured for session_id: {req.session_id} - Session object: {type(session)}")
-        message = types.Content(role="user", parts=[types.Part(text=req.user_query)])
-        final_response = await run_agent_with_session_recovery(
-            runner, req.user_id, req.session_id, message
-        )
-        return {"response": final_response}
+        admission.check_rate(user_id)
+    except admission.Rejected as exc:
+        return _too_many_requests(exc)
+    priority = admission.priority_for(role, user_query)
+    # The agent's preference callback reads the cache only; load the user here, off the event loop
+    from functions import preference_tools
+
+    preference_tools.begin(user_id)
+    await preference_tools.load(user_id)
+    # The budget is inherited by the pipeline task, so model calls, SQL and session
+    # operations all see the same deadline; the task is cancelled if the client leaves.
+    budget = deadline.start(deadline.parse_timeout(None if timeout is None else str(timeout)))
+    # Picks per-agent models for this question; the agents' callbacks read it from the context
+    route = routing.start(user_query)
+    prefix_usage = prompt_cache.start()
+    # Tools of this run note the tables they read on the pending entry
+    answer_cache.begin(pending)
+    try:
+        with health.track_chat():
+            final_response = await deadline.run_cancellable(
+                _chat_pipeline(user_id, session_id, user_query, priority, session), budget, is_disconnected
+            )
+        deadline.record_outcome(budget, "completed")
+        routing.finish(route, "completed")
+        sql_examples.finish(route)
+        answer_cache.schedule_store(pending, final_response, route)
+        prompt_cache.finish(prefix_usage)
+        # Fold turns that left the verbatim window into the running summary, off the request path
+        from sql_agent.context import schedule_summary_refresh
+
+        schedule_summary_refresh(get_session_service(), APP_NAME, user_id, session_id)
+        return 200, {"response": final_response}
+    except admission.Rejected as exc:
+        routing.finish(route, "rejected")
+        prompt_cache.finish(prefix_usage)
+        logger.warning("Chat request shed (%s) for session %s", exc.reason, session_id)
+        return _too_many_requests(exc)
+    except deadline.ClientDisconnected:
+        deadline.record_outcome(budget, "cancelled_disconnect", deadline.average_llm_calls())
+        routing.finish(route, "cancelled_disconnect")
+        prompt_cache.finish(prefix_usage)
+        logger.info("Client disconnected after %.1fs, cancelled run for session %s", budget.elapsed(), session_id)
+        return 499, {}
+    except deadline.DeadlineExceeded as exc:
+        deadline.record_outcome(budget, "deadline_exceeded", deadline.average_llm_calls())
+        routing.finish(route, "deadline_exceeded")
+        prompt_cache.finish(prefix_usage)
+        logger.warning("Chat deadline exceeded for session %s: %s", session_id, exc)
+        return 504, {"error": str(exc)}
     except Exception as exc:
         logger.exception("Chat endpoint error: %s", exc)
-        tb = traceback.format_exc()
-        if DEBUG:
-            return {"error": str(exc), "traceback": tb}
-        else:
-            raise HTTPException(status_code=500, detail="Internal server error occurred")
+        routing.finish(route, "error")
+        prompt_cache.finish(prefix_usage)
+        # The /ws error frame carries this body as is, so the exception text is for DEBUG only
+        if not DEBUG:
+            return 500, {"error": "Internal server error occurred"}
+        return 500, {"error": str(exc), "traceback": traceback.format_exc()}
+
+@app.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    await websocket.accept()
+    await live.serve(websocket, answer=handle_chat,
+                     ensure=lambda user_id, session_id: ensure_session_with_retries(APP_NAME, user_id, session_id))
+
+@app.get("/healthz")
+async def healthz():
+    return await health.healthz()
+
+@app.get("/readyz")
+async def readyz():
+    status_code, body = await health.readyz()
+    return JSONResponse(status_code=status_code, content=body)
+
+@app.get("/alerts")
+async def active_alerts(severity: Optional[str] = None, hospital: Optional[str] = None, rule: Optional[str] = None):
+    if not FEED_ENABLED:
+        raise HTTPException(status_code=404, detail="resource feed is disabled (FEED_ENABLED=false)")
+    from server import alerts
+
+    found = alerts.engine.alerts(severity=severity, hospital=hospital, rule=rule)
+    return {"as_of": alerts.engine.as_of(), "count": len(found), "alerts": found}
 
 @app.get("/debug/db-test")
 async def test_db_connection():
-    try:
-        test_session = await session_service.create_session(
-            app_name=f"{APP_NAME}_test",
-            user_id="test_user",
-            session_id=f"test_session_{asyncio.get_event_loop().time()}",
-            state={"test": True}
-        )
-        return {"db_status": "connected", "test_session_id": test_session.session_id}
-    except Exception as exc:
-        return {"db_status": "error", "error": str(exc)}
+    # Kept for older frontends; served from the cached read-only probes so it
+    # no longer creates a throwaway session on every poll.
+    probed = await health.health_cache.get()
+    store = probed["checks"]["session_store"]
+    if store["ok"]:
+        return {"db_status": "connected", "cached": probed["cached"]}
+    return {"db_status": "error", "error": store.get("error")}
+
+@app.get("/debug/startup")
+async def startup_status():
+    return readiness.snapshot()
+
+@app.get("/debug/deadlines")
+async def deadline_status():
+    return {**deadline.deadline_stats, "avg_llm_calls_per_completed": deadline.average_llm_calls()}
+
+@app.get("/debug/admission")
+async def admission_status():
+    return admission.snapshot()
+
+@app.get("/debug/logging")
+async def logging_status():
+    return logs.snapshot()
+
+@app.get("/debug/alerts")
+async def alerts_status():
+    if not FEED_ENABLED:
+        return {"enabled": False}
+    from server import alerts
+
+    return alerts.engine.snapshot()
+
+@app.get("/debug/forecast")
+async def forecast_status():
+    if not FEED_ENABLED:
+        return {"enabled": False}
+    from server import forecast
+
+    return forecast.forecaster.snapshot()
+
+@app.get("/debug/routing")
+async def routing_status():
+    return routing.snapshot()
+
+@app.get("/debug/answer-cache")
+async def answer_cache_status():
+    return answer_cache.snapshot()
+
+@app.get("/debug/live")
+async def live_status():
+    return live.snapshot()
+
+@app.get("/debug/retention")
+async def retention_status(samples: int = 24):
+    from server import retention
+
+    return retention.snapshot(samples)
+
+@app.get("/debug/sql-examples")
+async def sql_examples_status():
+    return sql_examples.snapshot()
+
+@app.get("/debug/prompt-cache")
+async def prompt_cache_status():
+    return prompt_cache.snapshot()
+
+@app.get("/debug/trace/{session_id}")
+async def trace_view(session_id: str, format: str = "json", limit: int = 5):
+    # Step timelines recorded in AGENT_MODE=pipeline; format=text draws the critical path
+    traces = trace.recent(session_id, limit)
+    if format == "text":
+        return PlainTextResponse("\n\n".join(trace.render_text(t) for t in traces) or "no traces\n")
+    return {"traces": traces}
@@ -0,0 +1,4 @@
+# server/__init__.py
+from .runtime import APP_NAME, get_runner, get_session_service, readiness, warm_up
+
+__all__ = ['APP_NAME', 'get_runner', 'get_session_service', 'readiness', 'warm_up']
@@ -0,0 +1,266 @@
+# server/admission.py
+"""Admission control for agent runs: concurrency limit, per-user rate limit, priority queue.
+
+Every ``/chat`` passes two gates before its agent run starts:
+
+1. A per-user token bucket (``ADMISSION_USER_RATE`` runs per minute, bursts of
+   ``ADMISSION_USER_BURST``). An empty bucket is answered at once with 429
+   and the time until the next token.
+2. A slot among ``ADMISSION_MAX_CONCURRENT`` concurrent agent runs in this
+   worker. When none is free the request waits in a priority queue (lowest
+   number first, FIFO within a class). The priority comes from the
+   ``X-User-Role`` header: ED/ICU/emergency ahead of clinical staff, then
+   everyone else, then finance and reporting. Nothing here authenticates
+   that header, so it is read only when ``ADMISSION_TRUST_ROLE_HEADER`` is
+   set, meaning a proxy in front of the API sets it from the authenticated
+   user and strips any value sent by the client. Otherwise, and without a
+   role, questions about ICU, ED, ventilators or oxygen are treated as
+   clinical.
+
+Load is shed early rather than late. When the queue is full, a request that
+outranks the worst queued one takes its place and the evicted request gets a
+429. Otherwise the newcomer gets the 429. A request whose estimated wait
+exceeds its deadline or ``ADMISSION_MAX_WAIT`` is also refused immediately,
+instead of timing out after waiting. Each 429 carries a ``Retry-After``
+estimated from the recent run time and the queue ahead.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "20"))
+ADMISSION_USER_RATE = float(os.getenv("ADMISSION_USER_RATE", "20"))
+ADMISSION_USER_BURST = float(os.getenv("ADMISSION_USER_BURST", "5"))
+# Only behind a proxy that sets the role header itself; clients could otherwise claim any role
+ADMISSION_TRUST_ROLE_HEADER = os.getenv("ADMISSION_TRUST_ROLE_HEADER", "false").lower() in ("1", "true", "yes")
+ROLE_HEADER = "x-user-role"
+
+# Lower runs first
+CRITICAL, CLINICAL, DEFAULT, REPORTING = 0, 1, 2, 3
+PRIORITY_NAMES = {CRITICAL: "critical", CLINICAL: "clinical", DEFAULT: "default", REPORTING: "reporting"}
+ROLE_PRIORITIES = {
+    "ed": CRITICAL, "er": CRITICAL, "emergency": CRITICAL, "icu": CRITICAL, "critical_care": CRITICAL,
+    "doctor": CLINICAL, "nurse": CLINICAL, "clinical": CLINICAL, "ward": CLINICAL, "operations": CLINICAL,
+    "finance": REPORTING, "reports": REPORTING, "reporting": REPORTING, "analyst": REPORTING,
+}
+_URGENT = re.compile(r"\b(?:icu|ed|emergency|ventilators?|oxygen|critical|ambulances?)\b", re.IGNORECASE)
+
+
+class Rejected(Exception):
+    """The request was not admitted; answer 429 with ``retry_after`` seconds."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(f"request not admitted: {reason}")
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def trusted_role(headers: Any) -> Optional[str]:
+    """The role header of a request, when the deployment vouches for it; None otherwise."""
+    return headers.get(ROLE_HEADER) if ADMISSION_TRUST_ROLE_HEADER else None
+
+
+def priority_for(role: Optional[str], question: str = "") -> int:
+    """Priority class from the caller's (trusted) role, else from the question."""
+    if role:
+        known = ROLE_PRIORITIES.get(role.strip().casefold().replace("-", "_").replace(" ", "_"))
+        if known is not None:
+            return known
+    return CLINICAL if _URGENT.search(question or "") else DEFAULT
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float) -> None:
+        self.tokens = tokens
+        self.updated = updated
+
+
+class AdmissionController:
+    """Per-worker gate in front of agent runs. Runs on the event loop; no locks needed."""
+
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 rate_per_minute: float = ADMISSION_USER_RATE, burst: float = ADMISSION_USER_BURST) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.running = 0
+        self._queue: List[Tuple[int, int, "asyncio.Future[None]"]] = []
+        self._seq = itertools.count()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._run_seconds = 10.0  # EWMA of slot hold time, seeds the Retry-After estimate
+        self._waits: Dict[int, Deque[float]] = {p: deque(maxlen=500) for p in PRIORITY_NAMES}
+        self.stats: Dict[str, Any] = {
+            "admitted": 0, "admitted_immediately": 0, "queued": 0, "rate_limited": 0, "queue_full": 0,
+            "evicted": 0, "wait_exceeded": 0, "cancelled_while_queued": 0,
+        }
+
+    # -- per-user rate limit ---------------------------------------------------------------
+    def check_rate(self, user_id: str) -> None:
+        """Spend one token from ``user_id``'s bucket or raise ``Rejected``."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) > 10000:
+                self._prune(now)
+            bucket = self._buckets[user_id] = TokenBucket(self.burst, now)
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+        if bucket.tokens < 1:
+            self.stats["rate_limited"] += 1
+            raise Rejected("rate_limited", (1 - bucket.tokens) / self.rate)
+        bucket.tokens -= 1
+
+    def _prune(self, now: float) -> None:
+        # A bucket that has refilled is indistinguishable from a new one
+        full = [u for u, b in self._buckets.items() if b.tokens + (now - b.updated) * self.rate >= self.burst]
+        for user_id in full:
+            del self._buckets[user_id]
+
+    # -- concurrency slots -------------------------------------------------------------------
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, waiter in self._queue if not waiter.done())
+
+    def estimated_wait(self, priority: int) -> float:
+        """Seconds until a request of ``priority`` would get a slot, from recent run times."""
+        if self.running < self.max_concurrent and not self.queue_depth():
+            return 0.0
+        ahead = sum(1 for p, _, waiter in self._queue if p <= priority and not waiter.done())
+        return self._run_seconds * (ahead // self.max_concurrent + 1)
+
+    def _reject_retry(self) -> float:
+        return self._run_seconds * (self.queue_depth() / self.max_concurrent + 1)
+
+    def _dispatch(self) -> None:
+        while self._queue and self.running < self.max_concurrent:
+            _, _, waiter = heapq.heappop(self._queue)
+            if not waiter.done():
+                self.running += 1
+                waiter.set_result(None)
+
+    def _make_room(self, priority: int) -> None:
+        live = [entry for entry in self._queue if not entry[2].done()]
+        if len(live) < self.max_queue:
+            return
+        worst = max(live, key=lambda entry: (entry[0], entry[1]))
+        if worst[0] <= priority:
+            self.stats["queue_full"] += 1
+            raise Rejected("queue_full", self._reject_retry())
+        worst[2].set_exception(Rejected("evicted", self._reject_retry()))
+        self.stats["evicted"] += 1
+        self._queue.remove(worst)
+        heapq.heapify(self._queue)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = DEFAULT, max_wait: Optional[float] = None) -> AsyncIterator[float]:
+        """Hold one of the concurrent run slots; yields the seconds spent queued.
+
+        Raises:
+            Rejected: The queue is full, the request was evicted by a more urgent one,
+                or it could not be admitted within ``max_wait`` seconds
+        """
+        max_wait = ADMISSION_MAX_WAIT if max_wait is None else min(max_wait, ADMISSION_MAX_WAIT)
+        enqueued = time.monotonic()
+        if self.running < self.max_concurrent and not self.queue_depth():
+            self.running += 1
+            self.stats["admitted_immediately"] += 1
+        else:
+            if self.estimated_wait(priority) > max_wait:
+                self.stats["wait_exceeded"] += 1
+                raise Rejected("wait_exceeded", self._reject_retry())
+            self._make_room(priority)
+            waiter: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self.stats["queued"] += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), timeout=max_wait)
+            except asyncio.TimeoutError:
+                if waiter.done() and waiter.exception() is None:
+                    # Granted in the same tick the timeout fired; give the slot back
+                    self.running -= 1
+                    self._dispatch()
+                waiter.cancel()
+                self.stats["wait_exceeded"] += 1
+                raise Rejected("wait_exceeded", self._reject_retry()) from None
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                    self.running -= 1
+                    self._dispatch()
+                waiter.cancel()
+                self.stats["cancelled_while_queued"] += 1
+                raise
+        waited = time.monotonic() - enqueued
+        self._waits[priority].append(waited)
+        self.stats["admitted"] += 1
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self._run_seconds = 0.8 * self._run_seconds + 0.2 * (time.monotonic() - started)
+            self.running -= 1
+            self._dispatch()
+
+    def snapshot(self) -> Dict[str, Any]:
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, waiter in self._queue:
+            if not waiter.done():
+                depth[PRIORITY_NAMES[priority]] += 1
+        waits = {}
+        for priority, samples in self._waits.items():
+            if samples:
+                ordered = sorted(samples)
+                waits[PRIORITY_NAMES[priority]] = {
+                    "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+                    "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+                    "samples": len(ordered),
+                }
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "running": self.running,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": sum(depth.values()),
+            "queue_depth_by_priority": depth,
+            "max_queue": self.max_queue,
+            "wait": waits,
+            "avg_run_seconds": round(self._run_seconds, 2),
+            "tracked_users": len(self._buckets),
+            **self.stats,
+        }
+
+
+admission = AdmissionController()
+
+
+def check_rate(user_id: str) -> None:
+    if ADMISSION_ENABLED:
+        admission.check_rate(user_id)
+
+
+@asynccontextmanager
+async def slot(priority: int = DEFAULT) -> AsyncIterator[float]:
+    """Module-level gate used by ``/chat``: bounded by the request deadline, no-op when disabled."""
+    if not ADMISSION_ENABLED:
+        yield 0.0
+        return
+    from . import deadline
+
+    async with admission.slot(priority, deadline.remaining()) as waited:
+        yield waited
+
+
+def snapshot() -> Dict[str, Any]:
+    return admission.snapshot()
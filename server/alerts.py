@@ -0,0 +1,331 @@
+# server/alerts.py
+"""Threshold and rate-of-change alerts over the hospital resource feed.
+
+The engine subscribes to ``server.resource_feed``. On each feed tick it
+evaluates every rule for the hospitals that got new snapshots, one
+vectorised NumPy expression per rule. It keeps the set of active alerts in
+memory, so reading them costs a dict scan. Rules come in two kinds:
+
+- ``threshold``: a derived metric (oxygen days left, ICU occupancy, ...)
+  compared with a threshold. An alert clears only once the metric is back
+  past ``clear``, so a value hovering at the threshold does not flap.
+- ``rate``: the newest value against the mean of the previous ``window``
+  snapshots. It fires when the value is ``threshold`` (relative) and
+  ``min_delta`` (absolute) above that baseline, for example ED critical
+  cases spiking.
+
+``ALERT_RULES_PATH`` points at a JSON list of rules that replace or extend
+the defaults by name. ``answer()`` turns common polling questions ("any
+hospital under 2 days of oxygen?") into a reply straight from the engine, so
+``/chat`` can answer them without an agent run. Only questions with an
+explicit threshold or alert wording qualify; questions about one hospital,
+superlatives and resource counts still go to the agent.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import warnings
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .resource_feed import COLUMN_INDEX, ResourceFeed, feed, isoformat
+
+ALERT_RULES_PATH = os.getenv("ALERT_RULES_PATH", "")
+ALERT_FAST_PATH = os.getenv("ALERT_FAST_PATH", "true").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger("chat-api")
+
+
+def _col(values: np.ndarray, name: str) -> np.ndarray:
+    return values[..., COLUMN_INDEX[name]]
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    return np.divide(numerator, denominator, out=np.full(numerator.shape, np.nan), where=denominator > 0)
+
+
+# Derived metrics over any array whose last axis is the feed's columns: (metric, unit, label)
+METRICS: Dict[str, Tuple[Callable[[np.ndarray], np.ndarray], str, str]] = {
+    "oxygen_days": (lambda v: _ratio(_col(v, "available_oxygen_liters"),
+                                     _col(v, "estimated_daily_consumption_oxygen_liters")), "days", "oxygen left"),
+    "icu_occupancy": (lambda v: _ratio(_col(v, "icu_occupied_beds"), _col(v, "total_icu_beds")),
+                      "ratio", "ICU occupancy"),
+    "bed_occupancy": (lambda v: _ratio(_col(v, "occupied_beds"), _col(v, "total_beds")), "ratio", "bed occupancy"),
+    "ed_occupancy": (lambda v: _ratio(_col(v, "ed_occupied_beds"), _col(v, "ed_total_beds")),
+                     "ratio", "ED occupancy"),
+    "ventilator_utilization": (lambda v: _ratio(_col(v, "in_use_ventilators"), _col(v, "total_ventilators")),
+                               "ratio", "ventilators in use"),
+    "critical_cases_ed": (lambda v: _col(v, "critical_cases_ed"), "count", "ED critical cases"),
+    "ed_wait_minutes": (lambda v: _col(v, "avg_ed_tat_minutes_1h"), "minutes", "ED turnaround (1h)"),
+    "doctor_coverage": (lambda v: _ratio(_col(v, "on_shift_doctors"), _col(v, "required_doctors")),
+                        "ratio", "doctors on shift vs required"),
+}
+
+
+@dataclass
+class Rule:
+    name: str
+    metric: str
+    op: str = ">"
+    threshold: float = 0.0
+    severity: str = "warning"
+    kind: str = "threshold"
+    clear: Optional[float] = None
+    window: int = 6
+    min_delta: float = 0.0
+    description: str = ""
+
+    def breached(self, value: np.ndarray, limit: Optional[float] = None) -> np.ndarray:
+        limit = self.threshold if limit is None else limit
+        with np.errstate(invalid="ignore"):
+            return value < limit if self.op == "<" else value > limit
+
+
+DEFAULT_RULES = [
+    Rule("oxygen_low", "oxygen_days", "<", 2.0, "critical", clear=2.5,
+         description="under 2 days of oxygen at current consumption"),
+    Rule("icu_full", "icu_occupancy", ">", 0.9, "critical", clear=0.85, description="ICU above 90% occupied"),
+    Rule("beds_full", "bed_occupancy", ">", 0.9, "warning", clear=0.85, description="beds above 90% occupied"),
+    Rule("ed_full", "ed_occupancy", ">", 0.9, "warning", clear=0.85, description="ED above 90% occupied"),
+    Rule("ventilators_exhausted", "ventilator_utilization", ">", 0.9, "warning", clear=0.85,
+         description="over 90% of ventilators in use"),
+    Rule("ed_critical_spike", "critical_cases_ed", ">", 0.5, "critical", kind="rate", window=6, min_delta=3,
+         description="ED critical cases 50% above their recent average"),
+    Rule("ed_wait_long", "ed_wait_minutes", ">", 60, "warning", clear=50, description="ED turnaround over an hour"),
+    Rule("doctor_shortfall", "doctor_coverage", "<", 0.8, "warning", clear=0.9,
+         description="fewer than 80% of required doctors on shift"),
+]
+_SEVERITY_ORDER = {"critical": 0, "warning": 1, "info": 2}
+
+
+def load_rules(path: str = ALERT_RULES_PATH) -> List[Rule]:
+    """Defaults, with rules from ``path`` replacing (by name) or extending them."""
+    rules = {rule.name: rule for rule in DEFAULT_RULES}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as fh:
+            for spec in json.load(fh):
+                rule = Rule(**spec)
+                if rule.metric not in METRICS:
+                    raise ValueError(f"alert rule {rule.name}: unknown metric {rule.metric}")
+                rules[rule.name] = rule
+    return list(rules.values())
+
+
+def format_value(metric: str, value: float) -> str:
+    unit = METRICS[metric][1]
+    if unit == "ratio":
+        return f"{value:.0%}"
+    if unit == "days":
+        return f"{value:.1f} days"
+    if unit == "minutes":
+        return f"{value:.0f} min"
+    return f"{value:g}"
+
+
+class AlertEngine:
+    def __init__(self, source: ResourceFeed, rules: Optional[List[Rule]] = None) -> None:
+        self.feed = source
+        self.rules = rules if rules is not None else load_rules()
+        self.active: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"evaluations": 0, "hospitals_evaluated": 0, "fired": 0, "cleared": 0,
+                                      "last_eval_ms": 0.0, "fast_path_answers": 0}
+
+    def evaluate(self, source: ResourceFeed, updated: np.ndarray) -> None:
+        """Feed subscriber: re-evaluate every rule for the hospitals in ``updated``."""
+        started = time.perf_counter()
+        values = source.values[updated]            # (n, history, columns)
+        latest = values[:, -1]
+        stamps = source.times[updated, -1]
+        ids = [source.hospital_ids[i] for i in updated]
+        changes: List[Tuple[str, Rule, int, float, Optional[float]]] = []
+        for rule in self.rules:
+            metric = METRICS[rule.metric][0]
+            now = metric(latest)
+            baseline = None
+            if rule.kind == "rate":
+                with np.errstate(invalid="ignore"), warnings.catch_warnings():
+                    # A hospital without history yet has an all-NaN window; that is expected
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    baseline = np.nanmean(metric(values[:, -rule.window - 1:-1]), axis=1)
+                delta = now - baseline
+                relative = np.divide(delta, baseline, out=np.where(delta > 0, np.inf, 0.0), where=baseline > 0)
+                firing = rule.breached(relative) & (delta >= rule.min_delta)
+                clearing = np.isfinite(now) & ~firing
+            else:
+                firing = rule.breached(now)
+                clearing = np.isfinite(now) & ~rule.breached(now, rule.clear)
+            active = np.array([(rule.name, h) in self.active for h in ids], dtype=bool)
+            for i in np.flatnonzero(firing | (active & ~clearing)):
+                changes.append(("set", rule, int(i), float(now[i]),
+                                None if baseline is None else float(baseline[i])))
+            for i in np.flatnonzero(active & clearing & ~firing):
+                changes.append(("clear", rule, int(i), float(now[i]), None))
+        with self._lock:
+            for action, rule, i, value, baseline in changes:
+                key = (rule.name, ids[i])
+                if action == "clear":
+                    if self.active.pop(key, None) is not None:
+                        self.stats["cleared"] += 1
+                    continue
+                alert = self.active.get(key)
+                if alert is None:
+                    self.stats["fired"] += 1
+                    alert = self.active[key] = {
+                        "rule": rule.name, "severity": rule.severity, "hospital_id": ids[i],
+                        "hospital_name": source.names.get(ids[i], ids[i]), "metric": rule.metric,
+                        "description": rule.description, "since": isoformat(stamps[i]),
+                    }
+                alert.update(value=round(value, 4), display=format_value(rule.metric, value),
+                             threshold=rule.threshold, as_of=isoformat(stamps[i]))
+                if baseline is not None:
+                    alert["baseline"] = round(baseline, 2)
+        self.stats["evaluations"] += 1
+        self.stats["hospitals_evaluated"] += int(len(ids))
+        self.stats["last_eval_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    def alerts(self, severity: Optional[str] = None, hospital: Optional[str] = None,
+               rule: Optional[str] = None) -> List[Dict[str, Any]]:
+        hospital = hospital.casefold() if hospital else None
+        with self._lock:
+            found = [dict(a) for a in self.active.values()
+                     if (not severity or a["severity"] == severity) and (not rule or a["rule"] == rule)
+                     and (not hospital or hospital in a["hospital_id"].casefold()
+                          or hospital in str(a["hospital_name"]).casefold())]
+        return sorted(found, key=lambda a: (_SEVERITY_ORDER.get(a["severity"], 9), a["rule"], a["hospital_name"]))
+
+    def query(self, metric: str, op: str, threshold: float) -> List[Dict[str, Any]]:
+        """Ad-hoc threshold over the newest snapshot of every hospital (e.g. under 3 days of oxygen)."""
+        latest = self.feed.latest()
+        value = METRICS[metric][0](latest)
+        hits = np.flatnonzero(Rule("adhoc", metric, op, threshold).breached(value))
+        hits = hits[np.argsort(value[hits] if op == "<" else -value[hits], kind="stable")]
+        return [{"hospital_id": self.feed.hospital_ids[i],
+                 "hospital_name": self.feed.names.get(self.feed.hospital_ids[i], self.feed.hospital_ids[i]),
+                 "value": round(float(value[i]), 4), "display": format_value(metric, float(value[i]))}
+                for i in hits]
+
+    def as_of(self) -> Optional[str]:
+        return self.feed.watermark.isoformat(sep=" ") if self.feed.watermark else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        by_rule: Dict[str, int] = {}
+        for rule_name, _ in list(self.active):
+            by_rule[rule_name] = by_rule.get(rule_name, 0) + 1
+        return {"active": len(self.active), "by_rule": by_rule, "rules": [asdict(r) for r in self.rules],
+                "feed": self.feed.snapshot(), **self.stats}
+
+
+engine = AlertEngine(feed)
+feed.subscribe(engine.evaluate)
+
+
+# -- polling questions answered without the agent ---------------------------------------------
+_POLLING = re.compile(r"^\s*(?:any|are|is there|is any|which|what|list|show|how many hospitals)\b", re.IGNORECASE)
+_NOT_POLLING = re.compile(r"\b(?:will|forecast|predict|tomorrow|tonight|next|trend|compare|why|history|last \w+|"
+                          r"average|per region|region)\b", re.IGNORECASE)
+# Superlatives and resource counts ("how many ICU beds") are lookups for the agent, not alert polls
+_NOT_ALERT = re.compile(r"\b(?:most|least|fewest|highest|lowest|best|worst|top|maximum|minimum|"
+                        r"how many(?! hospitals))\b", re.IGNORECASE)
+# Without an explicit threshold, the question has to ask about the alert condition itself
+_ALERT_WORDS = re.compile(r"\b(?:alert\w*|alarm\w*|critical|breach\w*|run(?:ning)? (?:out|low)|low on|short\w*|"
+                          r"exhaust\w*|full|at capacity|overload\w*|overwhelm\w*|spik\w*|surg\w*|long waits?)\b",
+                          re.IGNORECASE)
+_METRIC_WORDS = [
+    (re.compile(r"\b(?:ed critical|critical cases?|critical ed)\b.*\b(?:spik\w*|surg\w*|jump\w*|ris\w*)|"
+                r"\b(?:spik\w*|surg\w*)\b.*\bcritical", re.IGNORECASE), "ed_critical_spike"),
+    (re.compile(r"\boxygen\b", re.IGNORECASE), "oxygen_days"),
+    (re.compile(r"\bicu\b", re.IGNORECASE), "icu_occupancy"),
+    (re.compile(r"\bventilators?\b", re.IGNORECASE), "ventilator_utilization"),
+    (re.compile(r"\b(?:ed|emergency)\b.*\b(?:wait|turnaround|tat)\b", re.IGNORECASE), "ed_wait_minutes"),
+    (re.compile(r"\bbeds?\b", re.IGNORECASE), "bed_occupancy"),
+]
+_LIMIT = re.compile(r"\b(under|below|less than|fewer than|lower than|above|over|more than|greater than|exceed\w*)"
+                    r"\s+(\d+(?:\.\d+)?)\s*(%|[a-z]+)?", re.IGNORECASE)
+# Threshold units each metric unit accepts, with the factor into the metric's unit. A number with
+# no unit or another unit ("5000 liters", "50 beds") goes to the agent.
+_UNITS: Dict[str, Dict[str, float]] = {
+    "ratio": {"%": 0.01, "percent": 0.01},
+    "days": {"day": 1.0, "days": 1.0, "hour": 1 / 24, "hours": 1 / 24, "hr": 1 / 24, "hrs": 1 / 24},
+    "minutes": {"min": 1.0, "mins": 1.0, "minute": 1.0, "minutes": 1.0,
+                "hour": 60.0, "hours": 60.0, "hr": 60.0, "hrs": 60.0},
+}
+_RULE_FOR_METRIC = {"oxygen_days": "oxygen_low", "icu_occupancy": "icu_full", "bed_occupancy": "beds_full",
+                    "ventilator_utilization": "ventilators_exhausted", "ed_wait_minutes": "ed_wait_long",
+                    "ed_critical_spike": "ed_critical_spike"}
+
+
+_hospital_names: Tuple[int, Optional["re.Pattern[str]"]] = (0, None)
+
+
+def _names_hospital(question: str) -> bool:
+    """True when the question mentions a hospital by id, name or unambiguous short name."""
+    global _hospital_names
+    if _hospital_names[0] != len(feed.names):
+        from .answer_cache import HospitalAliases
+
+        names = list(HospitalAliases.build(feed.names)) + [hid.casefold() for hid in feed.names]
+        ordered = sorted(filter(None, names), key=len, reverse=True)
+        pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, ordered)) + r")\b") if ordered else None
+        _hospital_names = (len(feed.names), pattern)
+    pattern = _hospital_names[1]
+    return bool(pattern and pattern.search(re.sub(r"[^\w\s]+", " ", question.casefold())))
+
+
+def _match(question: str) -> Optional[Tuple[str, Optional[Tuple[str, float]]]]:
+    limit = _LIMIT.search(question)
+    # An explicit threshold is enough ("ICU above 90%?"); otherwise a polling question in alert wording
+    if limit is None and not (_POLLING.search(question) and _ALERT_WORDS.search(question)):
+        return None
+    if _NOT_POLLING.search(question) or _NOT_ALERT.search(question) or len(question.split()) > 20:
+        return None
+    if _names_hospital(question):
+        return None
+    found = [target for pattern, target in _METRIC_WORDS if pattern.search(question)]
+    if "icu_occupancy" in found and "bed_occupancy" in found:
+        found.remove("bed_occupancy")  # "ICU beds"
+    # Several resources in one question need the agent
+    if not found or (len(found) > 1 and found[0] != "ed_critical_spike"):
+        return None
+    target = found[0]
+    if limit is None or target == "ed_critical_spike":
+        return target, None
+    op = "<" if limit.group(1).casefold() in ("under", "below", "less than", "fewer than", "lower than") else ">"
+    factor = _UNITS.get(METRICS[target][1], {}).get((limit.group(3) or "").casefold())
+    if factor is None:
+        return None
+    return target, (op, round(float(limit.group(2)) * factor, 6))
+
+
+def answer(question: str) -> Optional[str]:
+    """Reply to a threshold polling question from the alert set, or None to run the agent."""
+    if not ALERT_FAST_PATH or not feed.hospital_ids:
+        return None
+    matched = _match(question or "")
+    if matched is None:
+        return None
+    target, limit = matched
+    as_of = engine.as_of()
+    if limit is None:
+        rule = next((r for r in engine.rules if r.name == _RULE_FOR_METRIC.get(target)), None)
+        if rule is None:
+            return None
+        hits = engine.alerts(rule=rule.name)
+        condition = rule.description
+    else:
+        op, number = limit
+        hits = engine.query(target, op, number)
+        label = METRICS[target][2]
+        condition = f"{label} {'below' if op == '<' else 'above'} {format_value(target, number)}"
+    engine.stats["fast_path_answers"] += 1
+    if not hits:
+        return f"As of {as_of}, no hospital has {condition}."
+    shown = ", ".join(f"{h['hospital_name']} ({h['display']})" for h in hits[:10])
+    more = f", and {len(hits) - 10} more" if len(hits) > 10 else ""
+    noun = "hospital has" if len(hits) == 1 else "hospitals have"
+    return f"As of {as_of}, {len(hits)} {noun} {condition}: {shown}{more}."
@@ -0,0 +1,409 @@
+# server/answer_cache.py
+"""Final-answer cache in front of the agent run.
+
+Many questions repeat across users ("show hospitals with low oxygen"). A
+cache hit returns the stored answer without the root model, the rewrite and
+evaluate sub-agents, or SQL. ``/chat`` still appends the turn to the user's
+session.
+
+- Key: the normalised question plus the user's SQL preference hints, since
+  preferences change the SQL. Normalising casefolds the question, spells out
+  comparison operators and signs ("> 90%" becomes "gt 90%"), drops the
+  remaining punctuation, filler and whitespace, and rewrites hospital names
+  and their short forms ("Sahyadri", "sahyadri general hospital, pune") to the
+  hospital id from the ``hospitals`` table.
+- Validity: before each SQL statement runs, the tables it reads are noted
+  and their watermarks read, so rows written during the run make the answer
+  stale. The answer is stored with those watermarks, one per table: ``MAX(timestamp)`` or
+  ``MAX(last_updated)`` plus ``COUNT(*)`` for time-stamped tables, and the
+  row count and ``UPDATE_TIME`` for the rest. A hit requires every watermark
+  to be unchanged. Watermarks are re-read at most every
+  ``ANSWER_CACHE_WATERMARK_TTL`` seconds.
+- Not cached: follow-up questions that lean on the conversation ("what about
+  them?"), runs that changed preferences or read no table, and answers without an
+  explicit "Correct" from the evaluator. Routes that skip the evaluator are
+  therefore not cached.
+- Memory: an in-process LRU bounded by ``ANSWER_CACHE_MAX_ENTRIES`` and
+  ``ANSWER_CACHE_MAX_BYTES``, with ``ANSWER_CACHE_TTL`` as a backstop.
+"""
+import asyncio
+import contextvars
+import hashlib
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(6 * 3600)))
+ANSWER_CACHE_WATERMARK_TTL = float(os.getenv("ANSWER_CACHE_WATERMARK_TTL", "10"))
+ANSWER_CACHE_ALIAS_TTL = float(os.getenv("ANSWER_CACHE_ALIAS_TTL", "3600"))
+
+# Tables with a reliable change column; the rest fall back to row count + UPDATE_TIME
+_TIME_COLUMNS = {"hospital_resource_timeseries": "timestamp", "hospital_finance_monthly": "last_updated"}
+
+logger = logging.getLogger("chat-api")
+
+# Comparison operators and signs change the meaning, so they become words before punctuation is
+# dropped. A sign only counts before a number, so hyphenated names and dates are left alone.
+_OPERATORS = {">=": " ge ", "=>": " ge ", "<=": " le ", "=<": " le ", "!=": " ne ", "<>": " ne ", "==": " eq ",
+              ">": " gt ", "<": " lt ", "=": " eq ", "+": " plus ", "-": " minus "}
+_OPERATOR = re.compile(r"[<>=!]=|=[<>]|<>|[<>=]|(?<![\w.])[+-](?=\.?\d)")
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_SPACE = re.compile(r"\s+")
+_FILLER = re.compile(
+    r"^(?:(?:please|kindly|can you|could you|would you|show me|show|list|give me|tell me|display|get) )+"
+    r"|(?: please| thanks| thank you)+$"
+)
+_CONTEXTUAL = re.compile(
+    r"\b(?:it|its|they|them|their|those|these|previous|earlier|again|instead|"
+    r"what about|how about)\b|^(?:and|but|or|so|also)\b"
+)
+_GENERIC_NAME_WORDS = frozenset(
+    "hospital hospitals general multispeciality multispecialty speciality specialty super medical "
+    "centre center clinic institute memorial and the of pune".split()
+)
+_IDENTIFIER = re.compile(r"^\w+$")
+
+
+def _plain(text: str) -> str:
+    return _SPACE.sub(" ", _PUNCTUATION.sub(" ", text.casefold())).strip()
+
+
+class HospitalAliases:
+    """Hospital names and unambiguous short forms, mapped to hospital ids."""
+
+    def __init__(self) -> None:
+        self._pattern: Optional["re.Pattern[str]"] = None
+        self._ids: Dict[str, str] = {}
+        self._loaded_at = 0.0
+        self._failed_at = -math.inf
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def build(names: Dict[str, str]) -> Dict[str, str]:
+        aliases: Dict[str, str] = {}
+        short: Dict[str, Set[str]] = {}
+        for hospital_id, name in names.items():
+            full = _plain(str(name))
+            aliases[full] = hospital_id
+            aliases[re.sub(r" pune$", "", full)] = hospital_id
+            core = " ".join(w for w in full.split() if w not in _GENERIC_NAME_WORDS)
+            if core:
+                short.setdefault(core, set()).add(hospital_id)
+        for core, ids in short.items():
+            if len(ids) == 1:
+                aliases.setdefault(core, next(iter(ids)))
+        return aliases
+
+    def _load_names(self) -> Dict[str, str]:
+        feed = sys.modules.get("server.resource_feed")
+        if feed is not None and feed.feed.names:
+            return dict(feed.feed.names)
+        from sqlalchemy import text
+
+        from functions.db_tools import get_db
+
+        with get_db()._engine.connect() as conn:
+            return {row[0]: row[1] for row in conn.execute(text("SELECT hospital_id, hospital_name FROM hospitals"))}
+
+    def canonicalize(self, text: str) -> str:
+        with self._lock:
+            now = time.monotonic()
+            stale = self._pattern is None or now - self._loaded_at > ANSWER_CACHE_ALIAS_TTL
+            # After a failed load (MySQL down) keep the old aliases, or none, for a while before retrying
+            if stale and now - self._failed_at > ANSWER_CACHE_WATERMARK_TTL:
+                try:
+                    names = self._load_names()
+                except Exception:
+                    self._failed_at = now
+                    raise
+                aliases = self.build(names)
+                self._ids = {alias: hospital_id.casefold() for alias, hospital_id in aliases.items()}
+                ordered = sorted(aliases, key=len, reverse=True)
+                self._pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, ordered)) + r")\b") if ordered else None
+                self._loaded_at = time.monotonic()
+            pattern, ids = self._pattern, self._ids
+        return pattern.sub(lambda m: ids[m.group(0)], text) if pattern else text
+
+
+aliases = HospitalAliases()
+
+
+def normalize(question: str) -> str:
+    text = _FILLER.sub("", _plain(_OPERATOR.sub(lambda m: _OPERATORS[m.group(0)], question))).strip()
+    try:
+        return aliases.canonicalize(text)
+    except Exception as exc:  # MySQL down: plain text still gives exact-repeat hits
+        logger.debug("hospital aliases unavailable: %s", exc)
+        return text
+
+
+def is_contextual(question: str) -> bool:
+    """Follow-ups whose meaning depends on earlier turns cannot be shared across sessions."""
+    return bool(_CONTEXTUAL.search(_plain(question)))
+
+
+class Watermarks:
+    """Per-table data versions, re-read at most every ``ttl`` seconds."""
+
+    def __init__(self, ttl: float = ANSWER_CACHE_WATERMARK_TTL) -> None:
+        self.ttl = ttl
+        self._values: Dict[str, Tuple[str, float]] = {}
+        self._known: Optional[Set[str]] = None
+        self._known_at = -math.inf
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    def known(self) -> Optional[Set[str]]:
+        """Tables in the database (None when they cannot be listed), re-read every ``ANSWER_CACHE_ALIAS_TTL``."""
+        now = time.monotonic()
+        if now - self._known_at > (ANSWER_CACHE_ALIAS_TTL if self._known is not None else self.ttl):
+            from functions.db_tools import get_db
+
+            self._known_at = now
+            try:
+                self._known = {name.casefold() for name in get_db().get_usable_table_names()}
+            except Exception as exc:
+                logger.debug("table list unavailable: %s", exc)
+        return self._known
+
+    def _query(self, table: str) -> str:
+        from sqlalchemy import text
+
+        from functions.db_tools import get_db
+
+        column = _TIME_COLUMNS.get(table)
+        if column:
+            sql = f"SELECT MAX(`{column}`), COUNT(*) FROM `{table}`"
+        else:
+            sql = (f"SELECT COUNT(*), (SELECT UPDATE_TIME FROM information_schema.TABLES "
+                   f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{table}') FROM `{table}`")
+        with get_db()._engine.connect() as conn:
+            row = conn.execute(text(sql)).fetchone()
+        self.queries += 1
+        return "|".join(str(v) for v in row)
+
+    def get(self, tables: Iterable[str]) -> Dict[str, str]:
+        now = time.monotonic()
+        found = {}
+        for table in tables:
+            with self._lock:
+                cached = self._values.get(table)
+            if cached is None or now - cached[1] > self.ttl:
+                cached = (self._query(table), now)
+                with self._lock:
+                    self._values[table] = cached
+            found[table] = cached[0]
+        return found
+
+
+watermarks = Watermarks()
+
+
+@dataclass
+class Pending:
+    """A cache miss being answered by the agent; tools note what it read."""
+
+    key: str
+    question: str
+    normalized: str
+    started: float = field(default_factory=time.monotonic)
+    # Table -> watermark read when a tool first noted it, i.e. before the run read the table
+    tables: Dict[str, str] = field(default_factory=dict)
+    uncacheable: Optional[str] = None
+
+
+_pending: contextvars.ContextVar[Optional[Pending]] = contextvars.ContextVar("answer_cache_pending", default=None)
+
+
+def note_tables(tables: Iterable[str]) -> None:
+    """Called by tools before they read MySQL: the answer is valid while these tables are unchanged.
+
+    The watermark is read here, not when the answer is stored, so rows written
+    while the agent runs make the stored answer stale rather than fresh. Names
+    that are not tables in the database are ignored, and a table whose
+    watermark cannot be read is left out rather than failing the store.
+    """
+    pending = _pending.get()
+    if pending is None:
+        return
+    names = {table.replace("`", "").split(".")[-1].casefold() for table in tables}
+    names = {name for name in names if _IDENTIFIER.match(name) and name not in pending.tables}
+    if not names:
+        return
+    known = watermarks.known()
+    for name in sorted(names):
+        if known is not None and name not in known:
+            continue
+        try:
+            pending.tables[name] = watermarks.get([name])[name]
+        except Exception as exc:
+            answer_cache.stats["watermark_errors"] += 1
+            logger.warning("answer cache watermark read failed for %s: %s", name, exc)
+
+
+def note_uncacheable(reason: str) -> None:
+    """Called by tools with side effects (e.g. saving a preference): never cache this answer."""
+    pending = _pending.get()
+    if pending is not None:
+        pending.uncacheable = reason
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, max_bytes: int = ANSWER_CACHE_MAX_BYTES,
+                 ttl: float = ANSWER_CACHE_TTL) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"lookups": 0, "hits": 0, "misses": 0, "stale": 0, "expired": 0,
+                                      "contextual": 0, "stored": 0, "not_stored": {}, "evictions": 0,
+                                      "lookup_ms": 0.0, "hit_ms": 0.0, "saved_seconds": 0.0, "miss_run_seconds": 0.0,
+                                      "errors": 0, "watermark_errors": 0}
+
+    @staticmethod
+    def key_for(normalized: str, user_id: Optional[str]) -> str:
+        hints = ""
+        if user_id:
+            from functions.preference_tools import preference_store
+
+            hints = repr(sorted(h["sql"] for h in preference_store.get(user_id).hints))
+        return hashlib.blake2b(f"{normalized}\x00{hints}".encode(), digest_size=16).hexdigest()
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["bytes"]
+
+    def lookup(self, question: str, user_id: Optional[str]) -> Tuple[Optional[str], Optional[Pending]]:
+        """The cached answer, or None and a ``Pending`` to pass to ``begin``/``store`` (None: do not cache)."""
+        if not ANSWER_CACHE_ENABLED or not question or not question.strip():
+            return None, None
+        started = time.perf_counter()
+        self.stats["lookups"] += 1
+        if is_contextual(question):
+            self.stats["contextual"] += 1
+            return None, None
+        try:
+            normalized = normalize(question)
+            pending = Pending(self.key_for(normalized, user_id), question, normalized)
+            with self._lock:
+                entry = self._entries.get(pending.key)
+            answer = None
+            if entry is not None:
+                if time.time() - entry["created"] > self.ttl:
+                    self.stats["expired"] += 1
+                elif watermarks.get(entry["tables"]) != entry["tables"]:
+                    self.stats["stale"] += 1
+                else:
+                    answer = entry["answer"]
+                if answer is None:
+                    with self._lock:
+                        self._drop(pending.key)
+                else:
+                    with self._lock:
+                        if pending.key in self._entries:
+                            self._entries.move_to_end(pending.key)
+                    entry["hits"] += 1
+                    self.stats["saved_seconds"] = round(self.stats["saved_seconds"] + entry["run_seconds"], 3)
+        except Exception as exc:
+            self.stats["errors"] += 1
+            logger.warning("answer cache lookup failed: %s", exc)
+            return None, None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats["lookup_ms"] = round(self.stats["lookup_ms"] + elapsed_ms, 3)
+        if answer is None:
+            self.stats["misses"] += 1
+            return None, pending
+        self.stats["hits"] += 1
+        self.stats["hit_ms"] = round(self.stats["hit_ms"] + elapsed_ms, 3)
+        return answer, None
+
+    def _skip(self, reason: str) -> None:
+        self.stats["not_stored"][reason] = self.stats["not_stored"].get(reason, 0) + 1
+
+    def store(self, pending: Optional[Pending], answer: str, route: Any = None) -> None:
+        """Keep a completed run's answer, unless the run was not cacheable."""
+        if pending is None:
+            return
+        run_seconds = time.monotonic() - pending.started
+        self.stats["miss_run_seconds"] = round(self.stats["miss_run_seconds"] + run_seconds, 3)
+        verdicts = getattr(route, "verdicts", None) or []
+        if pending.uncacheable:
+            return self._skip(pending.uncacheable)
+        if not answer or not answer.strip():
+            return self._skip("empty answer")
+        if not pending.tables:
+            return self._skip("no tables read")
+        if not verdicts or verdicts[-1] != "Correct":
+            return self._skip("not judged correct")
+        tables = dict(pending.tables)
+        entry = {"answer": answer, "question": pending.question, "normalized": pending.normalized,
+                 "tables": tables, "created": time.time(), "run_seconds": round(run_seconds, 3), "hits": 0,
+                 "bytes": len(answer.encode()) + len(pending.question.encode()) + 64 * (len(tables) + 4)}
+        with self._lock:
+            self._drop(pending.key)
+            self._entries[pending.key] = entry
+            self._bytes += entry["bytes"]
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+        self.stats["stored"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        misses = stats["misses"]
+        with self._lock:
+            top = sorted(self._entries.values(), key=lambda e: e["hits"], reverse=True)[:10]
+            size = {"entries": len(self._entries), "bytes": self._bytes}
+        return {
+            "enabled": ANSWER_CACHE_ENABLED, **size, "max_entries": self.max_entries, "max_bytes": self.max_bytes,
+            **stats,
+            "hit_rate": round(stats["hits"] / stats["lookups"], 3) if stats["lookups"] else None,
+            "avg_hit_ms": round(stats["hit_ms"] / stats["hits"], 3) if stats["hits"] else None,
+            "avg_miss_run_seconds": round(stats["miss_run_seconds"] / misses, 3) if misses else None,
+            "watermark_queries": watermarks.queries,
+            "top": [{"question": e["question"], "hits": e["hits"], "tables": list(e["tables"])} for e in top],
+        }
+
+
+answer_cache = AnswerCache()
+_store_tasks: Set["asyncio.Task[None]"] = set()
+
+
+def lookup(question: str, user_id: Optional[str]) -> Tuple[Optional[str], Optional[Pending]]:
+    return answer_cache.lookup(question, user_id)
+
+
+def begin(pending: Optional[Pending]) -> None:
+    """Make ``pending`` visible to the tools of the run that follows (set before the run task starts)."""
+    _pending.set(pending)
+
+
+def schedule_store(pending: Optional[Pending], answer: str, route: Any = None) -> None:
+    """Store off the request path; reading watermarks may query MySQL."""
+    if pending is None:
+        return
+    task = asyncio.get_running_loop().create_task(asyncio.to_thread(answer_cache.store, pending, answer, route))
+    _store_tasks.add(task)
+    task.add_done_callback(_store_tasks.discard)
+
+
+def snapshot() -> Dict[str, Any]:
+    return answer_cache.snapshot()
@@ -0,0 +1,182 @@
+# server/deadline.py
+"""Per-request deadlines and cancellation bookkeeping.
+
+``/chat`` opens a ``RequestBudget`` for each request from the
+``X-Request-Timeout`` header (seconds) or ``REQUEST_DEADLINE_SECONDS``. It
+lives in a context variable, so everything the agent run touches sees the same
+budget without extra parameters:
+
+- ``before_model_callback`` (root agent and both sub-agents) sets the Gemini
+  HTTP timeout to the remaining time, or aborts the run once it is spent.
+- ``run_sql_query`` passes the remaining time to MySQL as ``MAX_EXECUTION_TIME``.
+- session operations are wrapped with ``bound()``.
+
+``deadline_stats`` counts requests cut short and the work that was skipped.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "120"))
+MAX_REQUEST_DEADLINE_SECONDS = float(os.getenv("MAX_REQUEST_DEADLINE_SECONDS", "300"))
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+DEADLINE_HEADER = "x-request-timeout"
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request's time budget is spent before a step starts."""
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client went away while its request was still running."""
+
+
+class RequestBudget:
+    """Deadline plus per-request counters for one ``/chat`` call."""
+
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.expires_at = self.started + seconds
+        self.llm_calls = 0
+        self.sql_calls = 0
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def check(self, step: str) -> float:
+        left = self.remaining()
+        if left <= 0:
+            raise DeadlineExceeded(f"deadline of {self.seconds:.1f}s exceeded before {step}")
+        return left
+
+
+_current: contextvars.ContextVar[Optional[RequestBudget]] = contextvars.ContextVar("request_budget", default=None)
+
+deadline_stats: Dict[str, Any] = {
+    "requests": 0,
+    "completed": 0,
+    "cancelled_disconnect": 0,
+    "deadline_exceeded": 0,
+    "llm_calls_completed": 0,
+    "llm_calls_skipped": 0,
+    "sql_calls_skipped": 0,
+    "retries_skipped": 0,
+    "budget_seconds_unspent": 0.0,
+}
+_completed_llm_calls = [0]
+
+
+def parse_timeout(header_value: Optional[str]) -> float:
+    try:
+        seconds = float(header_value) if header_value else REQUEST_DEADLINE_SECONDS
+    except ValueError:
+        seconds = REQUEST_DEADLINE_SECONDS
+    return max(1.0, min(seconds, MAX_REQUEST_DEADLINE_SECONDS))
+
+
+def start(seconds: float) -> RequestBudget:
+    budget = RequestBudget(seconds)
+    _current.set(budget)
+    deadline_stats["requests"] += 1
+    return budget
+
+
+def current() -> Optional[RequestBudget]:
+    return _current.get()
+
+
+def remaining() -> Optional[float]:
+    budget = _current.get()
+    return budget.remaining() if budget else None
+
+
+async def bound(awaitable: Awaitable[T], step: str) -> T:
+    """Await ``awaitable`` within the remaining budget (unbounded outside a request)."""
+    budget = _current.get()
+    if budget is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=budget.check(step))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"deadline of {budget.seconds:.1f}s exceeded during {step}") from None
+
+
+async def run_cancellable(awaitable: Awaitable[T], budget: RequestBudget,
+                          is_disconnected: Callable[[], Awaitable[bool]]) -> T:
+    """Run ``awaitable`` as a task and cancel it on deadline or client disconnect.
+
+    Args:
+        awaitable: The request pipeline
+        budget: Budget opened with ``start()`` for this request
+        is_disconnected: Usually ``Request.is_disconnected``, polled every
+            ``DISCONNECT_POLL_INTERVAL`` seconds
+
+    Returns:
+        The pipeline's result
+
+    Raises:
+        DeadlineExceeded: The budget ran out first
+        ClientDisconnected: The client went away first
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            wait = min(DISCONNECT_POLL_INTERVAL, max(budget.remaining(), 0.0))
+            done, _ = await asyncio.wait({task}, timeout=wait)
+            if task in done:
+                return task.result()
+            if budget.remaining() <= 0:
+                raise DeadlineExceeded(f"deadline of {budget.seconds:.1f}s exceeded")
+            if await is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+def record_outcome(budget: RequestBudget, outcome: str, expected_llm_calls: Optional[float] = None) -> None:
+    """Update ``deadline_stats`` once a request finishes, is cancelled or times out."""
+    deadline_stats["llm_calls_completed"] += budget.llm_calls
+    if outcome == "completed":
+        deadline_stats["completed"] += 1
+        _completed_llm_calls[0] += budget.llm_calls
+        return
+    deadline_stats[outcome] += 1
+    deadline_stats["budget_seconds_unspent"] = round(
+        deadline_stats["budget_seconds_unspent"] + max(budget.remaining(), 0.0), 3
+    )
+    if expected_llm_calls is not None:
+        deadline_stats["llm_calls_skipped"] += max(0, round(expected_llm_calls - budget.llm_calls))
+
+
+def average_llm_calls() -> Optional[float]:
+    """Model calls per completed request, used to estimate the calls a cancellation avoided."""
+    if not deadline_stats["completed"]:
+        return None
+    return _completed_llm_calls[0] / deadline_stats["completed"]
+
+
+def before_model_callback(callback_context, llm_request) -> None:
+    """ADK hook: cap the model call's HTTP timeout at the remaining budget."""
+    budget = _current.get()
+    if budget is None:
+        return None
+    left = budget.check(f"model call by {callback_context.agent_name}")
+    from google.genai import types
+
+    if llm_request.config is None:
+        llm_request.config = types.GenerateContentConfig()
+    options = llm_request.config.http_options or types.HttpOptions()
+    options.timeout = max(1, int(left * 1000))
+    llm_request.config.http_options = options
+    budget.llm_calls += 1
+    return None
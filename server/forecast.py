@@ -0,0 +1,248 @@
+# server/forecast.py
+"""Batched capacity forecasts for beds, ICU, ventilators and oxygen.
+
+The forecaster subscribes to ``server.resource_feed``. On each tick it refits
+the hospitals that got new snapshots. Every hospital and resource is fitted
+together, as NumPy reductions over the feed's ``(hospitals, history)`` window:
+
+- Beds, ICU beds and ventilators: an exponentially weighted linear trend
+  (half-life ``FORECAST_HALF_LIFE_HOURS``) of the occupied count. The
+  forecast is anchored at the newest value and clipped to ``[0, capacity]``.
+- Oxygen: the daily consumption estimate gets the same fit. The forecaster
+  then integrates consumption over the horizon, assuming no refill, and
+  subtracts it from the available liters.
+
+Projections for ``FORECAST_HORIZONS`` and the hours until each resource runs
+out are computed at fit time. A lookup only reads array slices. With fewer
+than ``FORECAST_MIN_POINTS`` snapshots the trend is taken as flat, and
+``method`` says so.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .resource_feed import COLUMN_INDEX, ResourceFeed, feed, isoformat
+
+FORECAST_HORIZONS = tuple(float(h) for h in os.getenv("FORECAST_HORIZONS", "6,12,24,48,72").split(","))
+FORECAST_HALF_LIFE_HOURS = float(os.getenv("FORECAST_HALF_LIFE_HOURS", "12"))
+FORECAST_MIN_POINTS = int(os.getenv("FORECAST_MIN_POINTS", "3"))
+# One-sided 80% band on the residual spread
+_BAND_Z = 1.28
+
+# resource -> (fitted series, capacity column, unit)
+RESOURCES = {
+    "beds": ("occupied_beds", "total_beds", "beds"),
+    "icu": ("icu_occupied_beds", "total_icu_beds", "beds"),
+    "ventilators": ("in_use_ventilators", "total_ventilators", "ventilators"),
+    "oxygen": ("estimated_daily_consumption_oxygen_liters", "available_oxygen_liters", "liters"),
+}
+NAMES = tuple(RESOURCES)
+OXYGEN = NAMES.index("oxygen")
+
+
+def fit_trends(values: np.ndarray, times: np.ndarray, columns: List[int],
+               half_life: float = FORECAST_HALF_LIFE_HOURS) -> Dict[str, np.ndarray]:
+    """Weighted least-squares level and slope per hospital and series, in one pass.
+
+    Args:
+        values: ``(n, history, feed columns)`` window, NaN for gaps
+        times: ``(n, history)`` epoch seconds, NaN for gaps
+        columns: feed column indices to fit, ``m`` of them
+
+    Returns:
+        ``last``, ``slope`` (units per hour), ``sigma`` and ``points``, each ``(n, m)``
+    """
+    y = values[:, :, columns]                                        # (n, T, m)
+    hours = (times - times[:, -1:]) / 3600.0                         # <= 0, newest is 0
+    seen = np.isfinite(y) & np.isfinite(hours)[:, :, None]
+    weight = np.where(seen, 0.5 ** (-np.nan_to_num(hours, nan=0.0) / half_life)[:, :, None], 0.0)
+    t = np.nan_to_num(hours, nan=0.0)[:, :, None]
+    y0 = np.nan_to_num(y, nan=0.0)
+    total = weight.sum(axis=1)
+    safe = np.where(total > 0, total, 1.0)
+    t_mean = (weight * t).sum(axis=1) / safe
+    y_mean = (weight * y0).sum(axis=1) / safe
+    dt = t - t_mean[:, None, :]
+    stt = (weight * dt * dt).sum(axis=1)
+    sty = (weight * dt * (y0 - y_mean[:, None, :])).sum(axis=1)
+    points = seen.sum(axis=1)
+    fitted = (points >= FORECAST_MIN_POINTS) & (stt > 1e-9)
+    slope = np.where(fitted, sty / np.where(stt > 1e-9, stt, 1.0), 0.0)
+    residual = y0 - (y_mean[:, None, :] + slope[:, None, :] * dt)
+    sigma = np.sqrt((weight * residual * residual).sum(axis=1) / safe)
+    # Newest observed value per series (the fit is anchored there, not at its intercept)
+    newest = np.where(seen, np.arange(y.shape[1])[None, :, None], -1).max(axis=1)
+    last = np.take_along_axis(y, np.maximum(newest, 0)[:, None, :], axis=1)[:, 0, :]
+    last = np.where(newest >= 0, last, np.nan)
+    return {"last": last, "slope": slope, "sigma": np.where(fitted, sigma, 0.0), "points": points,
+            "fitted": fitted}
+
+
+def oxygen_hours_left(liters: np.ndarray, per_day: np.ndarray, growth: np.ndarray) -> np.ndarray:
+    """Hours until ``liters`` run out when consumption starts at ``per_day`` and changes by ``growth`` per hour.
+
+    Solves ``liters = (per_day * h + growth * h**2 / 2) / 24`` for the smallest ``h >= 0``.
+    """
+    a, b = growth / 48.0, per_day / 24.0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        linear = np.where(b > 0, liters / b, np.inf)
+        disc = b * b + 4 * a * liters
+        quadratic = np.where(disc >= 0, (-b + np.sqrt(np.maximum(disc, 0))) / (2 * a), np.inf)
+        hours = np.where(np.abs(a) > 1e-12, quadratic, linear)
+    hours = np.where(np.isfinite(hours) & (hours >= 0), hours, np.inf)
+    return np.where(liters <= 0, 0.0, np.where(np.isfinite(liters), hours, np.nan))
+
+
+class CapacityForecaster:
+    """Per-hospital forecasts kept as arrays aligned with the feed's hospital positions."""
+
+    def __init__(self, source: ResourceFeed, horizons=FORECAST_HORIZONS) -> None:
+        self.feed = source
+        self.horizons = np.array(sorted(horizons), dtype=float)
+        shape = (0, len(NAMES))
+        self.current = np.empty(shape)
+        self.capacity = np.empty(shape)
+        self.slope = np.empty(shape)
+        self.sigma = np.empty(shape)
+        self.points = np.zeros(shape, dtype=int)
+        self.fitted = np.zeros(shape, dtype=bool)
+        self.hours_left = np.empty(shape)
+        self.projection = np.empty(shape + (len(self.horizons),))
+        self.fitted_at = np.empty(0)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"refreshes": 0, "hospitals_fitted": 0, "last_fit_ms": 0.0,
+                                      "lookups": 0, "last_lookup_ms": 0.0}
+
+    def _grow(self, n: int) -> None:
+        extra = n - self.current.shape[0]
+        if extra <= 0:
+            return
+        pad = lambda a, fill: np.concatenate([a, np.full((extra,) + a.shape[1:], fill, dtype=a.dtype)])
+        self.current, self.capacity = pad(self.current, np.nan), pad(self.capacity, np.nan)
+        self.slope, self.sigma = pad(self.slope, np.nan), pad(self.sigma, np.nan)
+        self.points, self.fitted = pad(self.points, 0), pad(self.fitted, False)
+        self.hours_left, self.projection = pad(self.hours_left, np.nan), pad(self.projection, np.nan)
+        self.fitted_at = pad(self.fitted_at, np.nan)
+
+    def refresh(self, source: ResourceFeed, updated: np.ndarray) -> None:
+        """Feed subscriber: refit the hospitals in ``updated``."""
+        started = time.perf_counter()
+        with source._lock:
+            values, times = source.values[updated], source.times[updated]
+        series = [COLUMN_INDEX[RESOURCES[name][0]] for name in NAMES]
+        caps = [COLUMN_INDEX[RESOURCES[name][1]] for name in NAMES]
+        fit = fit_trends(values, times, series)
+        capacity = values[:, -1, caps]                                # (n, m)
+        current, slope = fit["last"], fit["slope"]
+        h = self.horizons[None, None, :]
+
+        # Occupancy resources: anchored linear trend, clipped to the physical range
+        projection = np.clip(current[:, :, None] + slope[:, :, None] * h, 0, capacity[:, :, None])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            hours_left = np.where(current >= capacity, 0.0,
+                                  np.where(slope > 0, (capacity - current) / np.where(slope > 0, slope, 1), np.inf))
+
+        # Oxygen: "current" is consumption/day and "capacity" the liters on hand; burn them down
+        per_day = np.maximum(current[:, OXYGEN], 0)
+        growth = slope[:, OXYGEN]
+        burned = (per_day[:, None] * self.horizons + growth[:, None] * self.horizons ** 2 / 2) / 24.0
+        projection[:, OXYGEN] = np.maximum(capacity[:, OXYGEN, None] - np.maximum(burned, 0), 0)
+        hours_left[:, OXYGEN] = oxygen_hours_left(capacity[:, OXYGEN], per_day, growth)
+
+        with self._lock:
+            self._grow(len(source.hospital_ids))
+            self.current[updated], self.capacity[updated] = current, capacity
+            self.slope[updated], self.sigma[updated] = slope, fit["sigma"]
+            self.points[updated], self.fitted[updated] = fit["points"], fit["fitted"]
+            self.hours_left[updated], self.projection[updated] = hours_left, projection
+            self.fitted_at[updated] = times[:, -1]
+        self.stats["refreshes"] += 1
+        self.stats["hospitals_fitted"] += int(len(updated))
+        self.stats["last_fit_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    def _catch_up(self) -> None:
+        # Hospitals the feed loaded before this forecaster subscribed
+        if self.current.shape[0] < len(self.feed.hospital_ids):
+            self.refresh(self.feed, np.arange(len(self.feed.hospital_ids)))
+
+    def _entry(self, i: int, r: int, extra_hours: Optional[float]) -> Dict[str, Any]:
+        name = NAMES[r]
+        unit = RESOURCES[name][2]
+        left = float(self.hours_left[i, r])
+        entry: Dict[str, Any] = {
+            "resource": name,
+            "method": ("linear trend" if self.fitted[i, r] else "flat (not enough history)")
+            + (" of consumption, no refill" if r == OXYGEN else ""),
+            "snapshots": int(self.points[i, r]),
+            "hours_until_exhausted": None if not np.isfinite(left) else round(left, 1),
+        }
+        if r == OXYGEN:
+            entry.update(available_liters=_round(self.capacity[i, r]), consumption_per_day=_round(self.current[i, r]),
+                         consumption_change_per_day=_round(self.slope[i, r] * 24))
+        else:
+            band = _BAND_Z * float(self.sigma[i, r])
+            entry.update(current=_round(self.current[i, r]), capacity=_round(self.capacity[i, r]),
+                         change_per_day=_round(self.slope[i, r] * 24), band=f"±{band:.1f} {unit}")
+        projections = {f"+{h:g}h": _round(v) for h, v in zip(self.horizons, self.projection[i, r])}
+        if extra_hours is not None and f"+{extra_hours:g}h" not in projections:
+            projections[f"+{extra_hours:g}h"] = _round(self._project(i, r, extra_hours))
+        entry[f"projected_{'liters' if r == OXYGEN else unit}"] = projections
+        return entry
+
+    def _project(self, i: int, r: int, hours: float) -> float:
+        if r == OXYGEN:
+            burned = (max(self.current[i, r], 0) * hours + self.slope[i, r] * hours ** 2 / 2) / 24.0
+            return max(self.capacity[i, r] - max(burned, 0), 0)
+        return float(np.clip(self.current[i, r] + self.slope[i, r] * hours, 0, self.capacity[i, r]))
+
+    def forecast(self, hospital: str, resource: Optional[str] = None,
+                 hours: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Forecasts for every hospital matching ``hospital`` (id or part of the name)."""
+        started = time.perf_counter()
+        self._catch_up()
+        resources = [NAMES.index(resource)] if resource else range(len(NAMES))
+        with self._lock:
+            found = [{"hospital_id": self.feed.hospital_ids[i],
+                      "hospital_name": self.feed.names.get(self.feed.hospital_ids[i], self.feed.hospital_ids[i]),
+                      "as_of": isoformat(self.fitted_at[i]),
+                      "forecasts": [self._entry(i, r, hours) for r in resources]}
+                     for i in self.feed.find(hospital) if i < self.current.shape[0]]
+        self._timed(started)
+        return found
+
+    def at_risk(self, within_hours: float, resource: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Hospital/resource pairs projected to run out within ``within_hours``, soonest first."""
+        started = time.perf_counter()
+        self._catch_up()
+        columns = [NAMES.index(resource)] if resource else list(range(len(NAMES)))
+        with self._lock:
+            left = self.hours_left[:, columns]
+            rows, cols = np.nonzero(np.nan_to_num(left, nan=np.inf) <= within_hours)
+            order = np.argsort(left[rows, cols], kind="stable")
+            found = [{"hospital_id": self.feed.hospital_ids[i],
+                      "hospital_name": self.feed.names.get(self.feed.hospital_ids[i], self.feed.hospital_ids[i]),
+                      "resource": NAMES[columns[c]], "hours_until_exhausted": round(float(left[i, c]), 1),
+                      "trend_fitted": bool(self.fitted[i, columns[c]])}
+                     for i, c in zip(rows[order], cols[order])]
+        self._timed(started)
+        return found
+
+    def _timed(self, started: float) -> None:
+        self.stats["lookups"] += 1
+        self.stats["last_lookup_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"hospitals": int(self.current.shape[0]), "horizons_hours": self.horizons.tolist(),
+                "half_life_hours": FORECAST_HALF_LIFE_HOURS, "min_points": FORECAST_MIN_POINTS,
+                "fitted_share": round(float(self.fitted.mean()), 3) if self.fitted.size else 0.0, **self.stats}
+
+
+def _round(value: float) -> Optional[float]:
+    return round(float(value), 1) if np.isfinite(value) else None
+
+
+forecaster = CapacityForecaster(feed)
+feed.subscribe(forecaster.refresh)
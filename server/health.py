@@ -0,0 +1,240 @@
+# server/health.py
+"""Cached, read-only health and readiness probes.
+
+Probe results are cached for ``HEALTH_CACHE_TTL`` seconds and concurrent
+callers share a single in-flight probe, so high-frequency polling by the
+frontend or a load balancer costs a dictionary lookup. Saturation gauges are
+registered by name so other subsystems can report their pools and queues.
+"""
+import asyncio
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from .runtime import APP_NAME, WARMUP_ON_STARTUP, get_session_service, readiness
+
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "5"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "2"))
+MAX_INFLIGHT_CHATS = int(os.getenv("MAX_INFLIGHT_CHATS", "32"))
+READY_SATURATION_THRESHOLD = float(os.getenv("READY_SATURATION_THRESHOLD", "0.9"))
+
+# user_id used for the read-only session-store probe; no session is ever created for it
+_PROBE_USER = "__healthz__"
+
+_gauges: Dict[str, Callable[[], Dict[str, Any]]] = {}
+_inflight = {"chats": 0}
+
+
+def register_gauge(name: str, fn: Callable[[], Dict[str, Any]]) -> None:
+    """Register a saturation gauge.
+
+    Args:
+        name: Key the gauge is reported under
+        fn: Cheap, non-blocking callable returning a dict. If it contains
+            ``in_use`` and ``capacity`` a ``utilization`` ratio is derived.
+    """
+    _gauges[name] = fn
+
+
+@contextmanager
+def track_chat():
+    _inflight["chats"] += 1
+    try:
+        yield
+    finally:
+        _inflight["chats"] -= 1
+
+
+def _chat_gauge() -> Dict[str, Any]:
+    return {"in_use": _inflight["chats"], "capacity": MAX_INFLIGHT_CHATS}
+
+
+def _mysql_pool_gauge() -> Dict[str, Any]:
+    # Don't force the db_tools/ADK import just to report an unused pool
+    db_tools = sys.modules.get("functions.db_tools")
+    status = db_tools.pool_status() if db_tools else {}
+    if not status:
+        return {"connected": False}
+    return {
+        "in_use": status["checked_out"],
+        "capacity": status["capacity"],
+        "schema_cache_entries": status["schema_cache_entries"],
+    }
+
+
+def _shared_cache_gauge() -> Dict[str, Any]:
+    from . import shared_cache
+
+    cache = shared_cache._shared_cache
+    if cache is None:
+        return {"open": False}
+    return {"in_use": cache.size(), "capacity": cache.max_entries, "hits": cache.stats["hits"],
+            "misses": cache.stats["misses"]}
+
+
+def _preference_writes_gauge() -> Dict[str, Any]:
+    preference_tools = sys.modules.get("functions.preference_tools")
+    if preference_tools is None:
+        return {"loaded": False}
+    return preference_tools.preference_store.snapshot()
+
+
+def _llm_runs_gauge() -> Dict[str, Any]:
+    from .admission import admission
+
+    # Running plus queued against everything the worker will hold before shedding
+    return {"in_use": admission.running + admission.queue_depth(),
+            "capacity": admission.max_concurrent + admission.max_queue,
+            "running": admission.running, "queued": admission.queue_depth()}
+
+
+def _log_queue_gauge() -> Dict[str, Any]:
+    logs = sys.modules.get("server.logs")
+    if logs is None:
+        return {"loaded": False}
+    return logs.snapshot()
+
+
+def _query_log_gauge() -> Dict[str, Any]:
+    query_log = sys.modules.get("server.query_log")
+    if query_log is None:
+        return {"loaded": False}
+    return query_log.query_log.snapshot()
+
+
+def _resource_feed_gauge() -> Dict[str, Any]:
+    resource_feed = sys.modules.get("server.resource_feed")
+    if resource_feed is None:
+        return {"loaded": False}
+    alerts = sys.modules.get("server.alerts")
+    status = resource_feed.feed.snapshot()
+    if alerts is not None:
+        status["active_alerts"] = len(alerts.engine.active)
+    return status
+
+
+def _session_db_gauge() -> Dict[str, Any]:
+    retention = sys.modules.get("server.retention")
+    if retention is None or not retention.maintenance.samples:
+        return {"measured": False}
+    last = retention.maintenance.samples[-1]
+    return {"db_bytes": last.get("db_bytes"), "sessions": last["sessions"], "events": last["events"],
+            "get_session_p50_ms": last["get_session"].get("p50_ms"), "measured_at": last["ts"]}
+
+
+register_gauge("chat_requests", _chat_gauge)
+register_gauge("llm_runs", _llm_runs_gauge)
+register_gauge("mysql_pool", _mysql_pool_gauge)
+register_gauge("shared_cache", _shared_cache_gauge)
+register_gauge("preference_writes", _preference_writes_gauge)
+register_gauge("query_log", _query_log_gauge)
+register_gauge("log_queue", _log_queue_gauge)
+register_gauge("resource_feed", _resource_feed_gauge)
+register_gauge("session_db", _session_db_gauge)
+
+
+def saturation() -> Dict[str, Any]:
+    report: Dict[str, Any] = {}
+    for name, fn in _gauges.items():
+        try:
+            gauge = dict(fn())
+        except Exception as exc:
+            gauge = {"error": str(exc)}
+        if gauge.get("capacity"):
+            gauge["utilization"] = round(gauge.get("in_use", 0) / gauge["capacity"], 3)
+        report[name] = gauge
+    return report
+
+
+def _is_saturated(report: Dict[str, Any]) -> bool:
+    return any(g.get("utilization", 0) >= READY_SATURATION_THRESHOLD for g in report.values())
+
+
+async def _probe_session_store() -> None:
+    # list_sessions is a plain SELECT; unlike create_session it never writes a row
+    await get_session_service().list_sessions(app_name=APP_NAME, user_id=_PROBE_USER)
+
+
+async def _probe_mysql() -> None:
+    from functions import db_tools
+
+    await asyncio.to_thread(db_tools.ping)
+
+
+_PROBES = {
+    "session_store": _probe_session_store,
+    "mysql": _probe_mysql,
+}
+
+
+class HealthCache:
+    """Runs the dependency probes at most once per TTL window."""
+
+    def __init__(self, ttl: float = HEALTH_CACHE_TTL, timeout: float = HEALTH_PROBE_TIMEOUT) -> None:
+        self.ttl = ttl
+        self.timeout = timeout
+        self._result: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._pending: Optional[asyncio.Task] = None
+        self.probe_runs = 0
+
+    async def _probe(self, fn) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(fn(), timeout=self.timeout)
+            return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+        except Exception as exc:
+            return {
+                "ok": False,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+                "error": str(exc) or type(exc).__name__,
+            }
+
+    async def _run(self) -> Dict[str, Any]:
+        names = list(_PROBES)
+        results = await asyncio.gather(*(self._probe(_PROBES[n]) for n in names))
+        self.probe_runs += 1
+        self._result = dict(zip(names, results))
+        self._checked_at = time.monotonic()
+        return self._result
+
+    async def get(self) -> Dict[str, Any]:
+        age = time.monotonic() - self._checked_at
+        if self._result is not None and age < self.ttl:
+            return {"checks": self._result, "cached": True, "age_seconds": round(age, 3)}
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.ensure_future(self._run())
+        checks = await asyncio.shield(self._pending)
+        return {"checks": checks, "cached": False, "age_seconds": 0.0}
+
+
+health_cache = HealthCache()
+
+
+async def healthz() -> Dict[str, Any]:
+    """Liveness plus cached dependency status; always answers while the process is up."""
+    probed = await health_cache.get()
+    ok = all(c["ok"] for c in probed["checks"].values())
+    return {"status": "ok" if ok else "degraded", **probed}
+
+
+async def readyz() -> tuple:
+    """Return ``(http_status, body)``; 503 while warming, when a dependency fails or when saturated."""
+    probed = await health_cache.get()
+    report = saturation()
+    reasons = []
+    if WARMUP_ON_STARTUP and readiness.state in ("cold", "warming"):
+        reasons.append(f"warm-up {readiness.state}")
+    reasons += [f"{name} unavailable" for name, c in probed["checks"].items() if not c["ok"]]
+    if _is_saturated(report):
+        reasons.append("saturated")
+    body = {
+        "ready": not reasons,
+        "reasons": reasons,
+        "warm_up": readiness.state,
+        "saturation": report,
+        **probed,
+    }
+    return (200 if not reasons else 503), body
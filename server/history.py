@@ -0,0 +1,208 @@
+# server/history.py
+"""Incremental, paginated conversation history.
+
+Each session gets a small index of already-extracted messages. On a repeat
+request only what is new is converted: state entries past the last cursor,
+and events newer than the last indexed event (fetched with
+``GetSessionConfig.after_timestamp`` so the old events are not even loaded).
+The index version doubles as the ETag for conditional requests.
+"""
+import asyncio
+import hashlib
+import os
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from .runtime import APP_NAME, get_session_service
+
+HISTORY_DEFAULT_LIMIT = int(os.getenv("HISTORY_DEFAULT_LIMIT", "200"))
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", "1000"))
+HISTORY_INDEX_MAX_SESSIONS = int(os.getenv("HISTORY_INDEX_MAX_SESSIONS", "256"))
+
+
+def _message_from_entry(m: Any) -> Optional[Dict[str, str]]:
+    sender = None
+    text = None
+    if isinstance(m, dict):
+        if "sender" in m and "text" in m:
+            sender, text = m.get("sender"), m.get("text")
+        else:
+            role = m.get("role") or m.get("author")
+            parts = m.get("parts") or []
+            if role:
+                sender = "user" if role == "user" else "bot"
+            if parts and isinstance(parts, list):
+                p0 = parts[0]
+                if isinstance(p0, dict):
+                    text = p0.get("text") or p0.get("content")
+                elif isinstance(p0, str):
+                    text = p0
+    if sender and text:
+        return {"sender": sender, "text": text}
+    return None
+
+
+def _message_from_event(event: Any) -> Optional[Dict[str, str]]:
+    content = getattr(event, "content", None)
+    if content is None or getattr(event, "partial", False) or not content.parts:
+        return None
+    # Tool calls and tool responses are part of the agent run, not the conversation
+    if any(getattr(p, "function_call", None) or getattr(p, "function_response", None) for p in content.parts):
+        return None
+    text = "".join(p.text for p in content.parts if getattr(p, "text", None))
+    if not text:
+        return None
+    return {"sender": "user" if event.author == "user" else "bot", "text": text}
+
+
+def _state_entries(state: Optional[Dict[str, Any]]) -> List[Any]:
+    if not state:
+        return []
+    raw = state.get("messages") or state.get("history") or []
+    return raw if isinstance(raw, list) else []
+
+
+class SessionHistory:
+    """Messages extracted so far for one session plus the cursors to resume from."""
+
+    __slots__ = ("messages", "source", "state_cursor", "last_event_ts", "last_event_ids", "last_update_time")
+
+    def __init__(self) -> None:
+        self.messages: List[Dict[str, str]] = []
+        self.source: Optional[str] = None
+        self.state_cursor = 0
+        self.last_event_ts: Optional[float] = None
+        self.last_event_ids: set = set()
+        self.last_update_time: Optional[float] = None
+
+    @property
+    def version(self) -> str:
+        # last_update_time alone has one-second resolution in the SQL session store
+        return f"{self.last_update_time}:{len(self.messages)}:{self.last_event_ts}:{len(self.last_event_ids)}"
+
+    def apply_state(self, entries: List[Any]) -> None:
+        if len(entries) < self.state_cursor:
+            # The state list was rewritten (e.g. compacted); rebuild from scratch
+            self.messages, self.state_cursor = [], 0
+        for m in entries[self.state_cursor:]:
+            msg = _message_from_entry(m)
+            if msg:
+                self.messages.append(msg)
+        self.state_cursor = len(entries)
+
+    def apply_events(self, events: List[Any]) -> None:
+        for event in events:
+            ts = getattr(event, "timestamp", None) or 0.0
+            if self.last_event_ts is not None:
+                if ts < self.last_event_ts or (ts == self.last_event_ts and event.id in self.last_event_ids):
+                    continue
+            if self.last_event_ts is None or ts > self.last_event_ts:
+                self.last_event_ts, self.last_event_ids = ts, set()
+            self.last_event_ids.add(event.id)
+            msg = _message_from_event(event)
+            if msg:
+                self.messages.append(msg)
+
+
+class HistoryIndex:
+    """LRU of per-session ``SessionHistory`` objects."""
+
+    def __init__(self, max_sessions: int = HISTORY_INDEX_MAX_SESSIONS) -> None:
+        self.max_sessions = max_sessions
+        self._entries: "OrderedDict[tuple, SessionHistory]" = OrderedDict()
+        self._locks: "weakref.WeakValueDictionary[tuple, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def invalidate(self, user_id: str, session_id: str) -> None:
+        self._entries.pop((user_id, session_id), None)
+
+    async def load(self, user_id: str, session_id: str) -> Optional[SessionHistory]:
+        key = (user_id, session_id)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        # Concurrent requests for one session share a single store read instead of
+        # each loading the full event list while the index is still cold.
+        async with lock:
+            return await self._load(key)
+
+    async def _load(self, key: tuple) -> Optional[SessionHistory]:
+        user_id, session_id = key
+        entry = self._entries.get(key)
+        config = None
+        if entry is not None and entry.last_event_ts is not None:
+            from google.adk.sessions.base_session_service import GetSessionConfig
+
+            config = GetSessionConfig(after_timestamp=entry.last_event_ts)
+        session = await get_session_service().get_session(
+            app_name=APP_NAME, user_id=user_id, session_id=session_id, config=config
+        )
+        if session is None:
+            self.invalidate(user_id, session_id)
+            return None
+        if entry is None:
+            entry = SessionHistory()
+            self._entries[key] = entry
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(key)
+
+        # Sessions that keep their own message list in state win, matching the
+        # original behaviour; otherwise the conversation is rebuilt from events.
+        entries = _state_entries(session.state)
+        if entries or entry.source == "state":
+            entry.source = "state"
+            entry.apply_state(entries)
+        else:
+            entry.source = "events"
+            entry.apply_events(session.events or [])
+        entry.last_update_time = session.last_update_time
+        return entry
+
+
+history_index = HistoryIndex()
+
+
+def make_etag(version: str, *params: Any) -> str:
+    digest = hashlib.blake2b(repr((version,) + params).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def paginate(messages: List[Dict[str, str]], before: Optional[int] = None,
+             after: Optional[int] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Slice ``messages`` by index cursor.
+
+    Args:
+        messages: Full, ordered message list
+        before: Return messages with index < before (the newest ``limit`` of them)
+        after: Return messages with index > after (the oldest ``limit`` of them)
+        limit: Page size, capped at ``HISTORY_MAX_LIMIT``
+
+    Returns:
+        Page dictionary; each message carries its ``index`` for the next cursor
+    """
+    total = len(messages)
+    limit = max(1, min(limit or HISTORY_DEFAULT_LIMIT, HISTORY_MAX_LIMIT))
+    lo, hi = 0, total
+    if after is not None:
+        lo = max(lo, after + 1)
+    if before is not None:
+        hi = min(hi, max(before, 0))
+    if after is not None and before is None:
+        hi = min(hi, lo + limit)
+    else:
+        lo = max(lo, hi - limit)
+    page = [{"index": i, **messages[i]} for i in range(lo, hi)] if lo < hi else []
+    return {
+        "messages": page,
+        "total": total,
+        "has_more_before": lo > 0,
+        "has_more_after": hi < total,
+    }
@@ -0,0 +1,319 @@
+# server/live.py
+"""One WebSocket per chat tab, bound to a user and session.
+
+The REST flow costs each message two or three HTTP requests
+(``/sessions/ensure``, ``/chat``, ``/history``), and every one of them looks
+the session up again. On ``/ws`` the client binds once and then exchanges
+small JSON frames. The ``Session`` ensured at bind time is kept for the
+connection's lifetime.
+
+Client -> server::
+
+    {"type": "bind", "user_id": "...", "session_id": "...", "have": 12}
+    {"type": "chat", "id": "c1", "text": "...", "timeout": 120}
+    {"type": "history", "before": 40, "limit": 50}      # older page, same cursors as GET /history
+    {"type": "ping"}
+
+Server -> client::
+
+    {"type": "bound", "user_id": "...", "session_id": "..."}
+    {"type": "history", "session_id": "...", "start": 12, "messages": [...], "total": 14, "reset": false}
+    {"type": "progress", "id": "c1", "stage": "run_sql_query", "phase": "start", "ms": 812}
+    {"type": "response", "id": "c1", "response": "...", "ms": 2140}
+    {"type": "error", "id": "c1", "status": 429, "error": "...", "retry_after": 3}
+    {"type": "status", "status": "ok", "warm_up": "ready", "checks": {...}}
+    {"type": "pong"}
+
+``history`` frames are pushed whenever the bound session gains messages. The
+client sends ``have`` (the number of messages it already holds) and only
+gets what is new. Another tab's turn, on REST or on a socket in this worker,
+is pushed too. ``status`` frames are pushed when the health state changes
+and replace polling. Chats on one connection run one at a time, in order.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from . import admission, health, trace
+from .history import HISTORY_DEFAULT_LIMIT, history_index, paginate
+from .runtime import readiness
+
+LIVE_STATUS_INTERVAL = float(os.getenv("LIVE_STATUS_INTERVAL", "15"))
+LIVE_SEND_QUEUE = int(os.getenv("LIVE_SEND_QUEUE", "256"))
+LIVE_MAX_PENDING_CHATS = int(os.getenv("LIVE_MAX_PENDING_CHATS", "4"))
+
+logger = logging.getLogger("chat-api")
+
+live_stats: Dict[str, int] = {
+    "opened": 0, "closed": 0, "frames_in": 0, "frames_out": 0, "chats": 0, "binds": 0,
+    "history_pushes": 0, "progress_frames": 0, "progress_dropped": 0, "status_pushes": 0, "rejected_chats": 0,
+}
+
+# answer(user_id, session_id, text, role=, timeout=, is_disconnected=, session=) -> (status, body)
+AnswerFn = Callable[..., Awaitable[Tuple[int, Dict[str, Any]]]]
+EnsureFn = Callable[[str, str], Awaitable[Any]]
+
+
+def stages_of(event: Any) -> List[Tuple[str, str]]:
+    """Stage transitions visible in one ADK event: tool and sub-agent calls and their results."""
+    content = getattr(event, "content", None)
+    if content is None or not content.parts:
+        return []
+    found = []
+    for part in content.parts:
+        if part.function_call:
+            found.append((part.function_call.name, "start"))
+        elif part.function_response:
+            found.append((part.function_response.name, "end"))
+    return found
+
+
+def progress_from_event(event: Any) -> None:
+    """Report the stages of an agent event to the step listener of the current request, if any."""
+    for stage, phase in stages_of(event):
+        trace.notify(stage, phase)
+
+
+class Connection:
+    """Per-socket state: the bound session, the history cursor and the outgoing frame queue."""
+
+    def __init__(self, websocket: Any) -> None:
+        self.websocket = websocket
+        self.user_id: Optional[str] = None
+        self.session_id: Optional[str] = None
+        self.session: Any = None
+        # From the handshake headers, like X-User-Role on /chat; never from a client frame
+        self.role: Optional[str] = admission.trusted_role(websocket.headers)
+        self.have = 0
+        self.closed = False
+        self.busy = False
+        self.outbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self.chats: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=LIVE_MAX_PENDING_CHATS)
+
+    @property
+    def key(self) -> Optional[Tuple[str, str]]:
+        return (self.user_id, self.session_id) if self.session_id else None
+
+    def push(self, frame: Dict[str, Any]) -> None:
+        if self.closed:
+            return
+        if frame["type"] == "progress" and self.outbox.qsize() >= LIVE_SEND_QUEUE:
+            # A slow reader loses progress ticks, never responses or history
+            live_stats["progress_dropped"] += 1
+            return
+        self.outbox.put_nowait(frame)
+
+    async def is_disconnected(self) -> bool:
+        return self.closed
+
+    async def write_forever(self) -> None:
+        while True:
+            frame = await self.outbox.get()
+            await self.websocket.send_json(frame)
+            live_stats["frames_out"] += 1
+
+    async def push_history(self) -> None:
+        """Send the messages added since the client's ``have`` cursor."""
+        key = self.key
+        if key is None:
+            return
+        entry = await history_index.load(*key)
+        if key != self.key:
+            return  # rebound while loading
+        if entry is None:
+            messages: List[Dict[str, str]] = []
+        else:
+            messages = entry.messages
+            if self.session is not None and entry.last_update_time:
+                # The index just read the store; keep the held Session appendable without a reload
+                self.session.last_update_time = max(self.session.last_update_time, entry.last_update_time)
+        total = len(messages)
+        reset = self.have > total
+        start = 0 if reset else self.have
+        if start == 0 and total > HISTORY_DEFAULT_LIMIT:
+            start = total - HISTORY_DEFAULT_LIMIT
+            reset = True
+        if start >= total and not reset:
+            return
+        self.have = total
+        live_stats["history_pushes"] += 1
+        self.push({"type": "history", "session_id": key[1], "start": start, "total": total, "reset": reset,
+                   "messages": [{"index": i, **messages[i]} for i in range(start, total)]})
+
+
+class Hub:
+    """Connections of this worker by bound session, plus the shared status broadcaster."""
+
+    def __init__(self) -> None:
+        self.connections: Set[Connection] = set()
+        self.by_session: Dict[Tuple[str, str], Set[Connection]] = {}
+        self.status: Optional[Dict[str, Any]] = None
+        self._status_task: Optional[asyncio.Task] = None
+        self._pushes: Set[asyncio.Task] = set()
+
+    def add(self, conn: Connection) -> None:
+        self.connections.add(conn)
+        if self._status_task is None or self._status_task.done():
+            self._status_task = asyncio.get_running_loop().create_task(self._broadcast_status())
+
+    def remove(self, conn: Connection) -> None:
+        self.connections.discard(conn)
+        self.unbind(conn)
+
+    def bind(self, conn: Connection) -> None:
+        self.by_session.setdefault(conn.key, set()).add(conn)
+
+    def unbind(self, conn: Connection) -> None:
+        bound = self.by_session.get(conn.key) if conn.key else None
+        if bound is not None:
+            bound.discard(conn)
+            if not bound:
+                del self.by_session[conn.key]
+
+    def session_changed(self, user_id: str, session_id: str) -> None:
+        """Push the new messages of a session to every socket bound to it."""
+        for conn in list(self.by_session.get((user_id, session_id), ())):
+            task = asyncio.get_running_loop().create_task(conn.push_history())
+            self._pushes.add(task)
+            task.add_done_callback(self._pushes.discard)
+
+    async def current_status(self) -> Dict[str, Any]:
+        probed = await health.health_cache.get()
+        checks = {name: c["ok"] for name, c in probed["checks"].items()}
+        return {"type": "status", "status": "ok" if all(checks.values()) else "degraded",
+                "warm_up": readiness.state, "checks": checks}
+
+    async def _broadcast_status(self) -> None:
+        while self.connections:
+            try:
+                status = await self.current_status()
+            except Exception as exc:
+                logger.warning("websocket status probe failed: %s", exc)
+                status = {"type": "status", "status": "error", "error": "health check failed"}
+            if status != self.status:
+                self.status = status
+                live_stats["status_pushes"] += 1
+                for conn in list(self.connections):
+                    conn.push(status)
+            await asyncio.sleep(LIVE_STATUS_INTERVAL)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"connections": len(self.connections), "bound_sessions": len(self.by_session),
+                "status": self.status, **live_stats}
+
+
+hub = Hub()
+
+
+def session_changed(user_id: str, session_id: str) -> None:
+    hub.session_changed(user_id, session_id)
+
+
+def snapshot() -> Dict[str, Any]:
+    return hub.snapshot()
+
+
+async def _bind(conn: Connection, frame: Dict[str, Any], ensure: EnsureFn) -> None:
+    user_id, session_id = frame.get("user_id"), frame.get("session_id")
+    if not user_id or not session_id:
+        conn.push({"type": "error", "status": 400, "error": "bind needs user_id and session_id"})
+        return
+    hub.unbind(conn)
+    conn.user_id, conn.session_id, conn.session = user_id, session_id, None
+    conn.have = max(int(frame.get("have") or 0), 0)
+    hub.bind(conn)
+    try:
+        session = await ensure(user_id, session_id)
+    except Exception as exc:
+        logger.warning("websocket bind failed for %s: %s", session_id, exc)
+        conn.push({"type": "error", "status": 500, "error": "could not open session"})
+        return
+    if conn.key != (user_id, session_id):
+        return
+    conn.session = session
+    live_stats["binds"] += 1
+    conn.push({"type": "bound", "user_id": user_id, "session_id": session_id})
+    if hub.status is not None:
+        conn.push(hub.status)
+    await conn.push_history()
+
+
+async def _run_chats(conn: Connection, answer: AnswerFn) -> None:
+    while not conn.closed:
+        frame = await conn.chats.get()
+        conn.busy = True
+        chat_id = frame.get("id")
+        started = time.perf_counter()
+
+        def on_step(stage: str, phase: str, chat_id: Any = chat_id) -> None:
+            live_stats["progress_frames"] += 1
+            conn.push({"type": "progress", "id": chat_id, "stage": stage, "phase": phase,
+                       "ms": round((time.perf_counter() - started) * 1000)})
+
+        token = trace.listen(on_step)
+        try:
+            status, body = await answer(
+                conn.user_id, conn.session_id, frame.get("text") or "", role=conn.role,
+                timeout=frame.get("timeout"), is_disconnected=conn.is_disconnected, session=conn.session,
+            )
+        finally:
+            trace.unlisten(token)
+            conn.busy = False
+        live_stats["chats"] += 1
+        ms = round((time.perf_counter() - started) * 1000)
+        if status == 200:
+            conn.push({"type": "response", "id": chat_id, "response": body.get("response"), "ms": ms})
+            hub.session_changed(conn.user_id, conn.session_id)
+        elif status != 499:
+            conn.push({"type": "error", "id": chat_id, "status": status, "ms": ms, **body})
+
+
+async def serve(websocket: Any, answer: AnswerFn, ensure: EnsureFn) -> None:
+    """Run the protocol on an accepted socket until the client goes away."""
+    conn = Connection(websocket)
+    hub.add(conn)
+    live_stats["opened"] += 1
+    writer = asyncio.get_running_loop().create_task(conn.write_forever())
+    chats = asyncio.get_running_loop().create_task(_run_chats(conn, answer))
+    try:
+        while True:
+            frame = await websocket.receive_json()
+            live_stats["frames_in"] += 1
+            kind = frame.get("type") if isinstance(frame, dict) else None
+            if kind == "bind":
+                await _bind(conn, frame, ensure)
+            elif kind == "chat":
+                if conn.session is None:
+                    conn.push({"type": "error", "id": frame.get("id"), "status": 409, "error": "bind a session first"})
+                    continue
+                try:
+                    conn.chats.put_nowait(frame)
+                except asyncio.QueueFull:
+                    live_stats["rejected_chats"] += 1
+                    conn.push({"type": "error", "id": frame.get("id"), "status": 429,
+                               "error": "too many messages in flight on this connection", "retry_after": 1})
+            elif kind == "history":
+                if conn.key is None:
+                    continue
+                entry = await history_index.load(*conn.key)
+                page = paginate(entry.messages if entry else [], before=frame.get("before"),
+                                after=frame.get("after"), limit=frame.get("limit"))
+                conn.push({"type": "history_page", "session_id": conn.session_id, **page})
+            elif kind == "ping":
+                conn.push({"type": "pong"})
+            else:
+                conn.push({"type": "error", "status": 400, "error": f"unknown frame type {kind!r}"})
+    except Exception as exc:
+        # WebSocketDisconnect on a normal close; anything else is logged and closes the socket
+        if type(exc).__name__ != "WebSocketDisconnect":
+            logger.warning("websocket closed on error: %s", exc)
+    finally:
+        conn.closed = True
+        hub.remove(conn)
+        live_stats["closed"] += 1
+        writer.cancel()
+        if not conn.busy:
+            chats.cancel()
+        # else: the running chat sees is_disconnected(), is cancelled like a dropped REST request, and the loop exits
@@ -0,0 +1,190 @@
+# server/logs.py
+"""Structured, sampled, non-blocking logging for the API process.
+
+``setup()`` replaces ``logging.basicConfig``:
+
+- Request threads only enqueue records (``QueueHandler``). Formatting and
+  I/O happen on a listener thread. When the queue is full, records are
+  dropped and counted instead of blocking the event loop.
+- Messages are formatted lazily. Callers pass ``%s`` arguments, and a record
+  that is filtered or sampled out never builds its string. ``capped(value)``
+  defers ``str(value)`` as well and cuts it to ``LOG_MAX_FIELD_CHARS``.
+  Every message is capped at ``LOG_MAX_MESSAGE_CHARS``.
+- Categories are child loggers of ``chat-api`` (``chat-api.events``,
+  ``chat-api.sql``, ``chat-api.session``). ``LOG_SAMPLE`` keeps one in N of
+  a category's records below WARNING, for example
+  ``chat-api.events=0.01,chat-api.sql=0.1``. Warnings and errors are never
+  sampled out.
+- Output is one JSON object per line (``LOG_FORMAT=json``, default) with the
+  request's ``session_id``/``user_id`` bound by ``bind()``; ``LOG_FORMAT=text``
+  keeps the old human-readable lines.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Any, Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "4000"))
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "500"))
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "chat-api.events=0.05")
+
+_context: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("log_context", default=None)
+log_stats: Dict[str, Any] = {"enqueued": 0, "dropped": 0, "sampled_out": 0}
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue: "Optional[queue.Queue[logging.LogRecord]]" = None
+
+
+class capped:
+    """Defer ``str(value)`` to format time and cut it to ``limit`` characters."""
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = LOG_MAX_FIELD_CHARS) -> None:
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = str(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... [{len(text) - self.limit} more chars]"
+
+    __repr__ = __str__
+
+
+def bind(**fields: Any) -> contextvars.Token:
+    """Attach fields (session_id, user_id, ...) to every record logged in this context."""
+    return _context.set({**(_context.get() or {}), **fields})
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for part in spec.split(","):
+        name, _, rate = part.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in ``1/rate`` records per category below WARNING."""
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        # Longest prefix first, so "chat-api.sql.result" beats "chat-api.sql"
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self._counters: Dict[str, int] = {}
+
+    def _rate(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0:
+            return True
+        count = self._counters.get(record.name, 0)
+        self._counters[record.name] = count + 1
+        if rate > 0 and count % max(1, round(1 / rate)) == 0:
+            record.sample_rate = rate
+            return True
+        log_stats["sampled_out"] += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue the record as is: no formatting on the caller's thread, drop when full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Tracebacks are tied to the raising frame; render them before it goes away
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.context = _context.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            log_stats["enqueued"] += 1
+        except queue.Full:
+            log_stats["dropped"] += 1
+
+
+def _message(record: logging.LogRecord) -> str:
+    try:
+        text = record.getMessage()
+    except Exception as exc:  # a bad format string must not kill the listener
+        text = f"{record.msg!r} (unformattable: {exc})"
+    if len(text) > LOG_MAX_MESSAGE_CHARS:
+        text = f"{text[:LOG_MAX_MESSAGE_CHARS]}... [{len(text) - LOG_MAX_MESSAGE_CHARS} more chars]"
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": _message(record),
+        }
+        context = getattr(record, "context", None)
+        if context:
+            entry.update(context)
+        if getattr(record, "sample_rate", None) is not None:
+            entry["sample_rate"] = record.sample_rate
+        if record.exc_text:
+            entry["exc"] = record.exc_text[-LOG_MAX_MESSAGE_CHARS:]
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record)} {record.levelname} {_message(record)}"
+        return f"{line}\n{record.exc_text}" if record.exc_text else line
+
+
+def setup(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, stream=None) -> None:
+    """Route the root logger through the sampling filter and the queue listener (idempotent)."""
+    global _listener, _queue
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    _queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(_queue)
+    handler.addFilter(SamplingFilter(parse_sample_rates(LOG_SAMPLE)))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(_queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def snapshot() -> Dict[str, Any]:
+    return {"in_use": _queue.qsize() if _queue is not None else 0, "capacity": LOG_QUEUE_SIZE,
+            "level": logging.getLevelName(logging.getLogger().level), **log_stats}
@@ -0,0 +1,288 @@
+# server/prompt_cache.py
+"""Stable, versioned prompt prefixes and provider-side context caching.
+
+Every agent's system instruction starts with a static prefix: its instruction
+text and, for the root agent, a snapshot of the database schema. The prefix is
+assembled here (no session-state templating, sample rows stripped from the
+schema, normalised whitespace), so it is byte-identical across requests and
+workers and only changes when the prompt or the schema does. ``version``
+identifies it.
+
+``PROMPT_CACHE`` selects what happens with it:
+
+- ``implicit`` (default): rely on Gemini's automatic prefix caching, which
+  only hits when the prefix is byte-identical.
+- ``explicit``: also register the prefix (with the agent's tools) as a Gemini
+  ``CachedContent`` and send requests against it. Prefixes below the model's
+  minimum cache size, or a provider error, fall back to ``implicit``.
+- ``off``: no caching and no accounting.
+
+In both caching modes each model call is accounted locally (prefix tokens
+that would be served from a warm cache vs. sent cold; prefixes below the
+provider's minimum never count as cached) and, when the response carries
+usage metadata, with the provider's own cached token count.
+"""
+import asyncio
+import contextvars
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "implicit").lower()
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", "3600"))
+PROMPT_CACHE_RETRY_SECONDS = float(os.getenv("PROMPT_CACHE_RETRY_SECONDS", "300"))
+# Smallest prefix Gemini will cache (implicitly or explicitly), by model family
+MIN_CACHE_TOKENS = {"flash": 1024, "pro": 2048}
+PREFIX_FORMAT = "p1"
+SCHEMA_HEADER = (
+    "## Database schema snapshot\n"
+    "This is the full, current schema of the database."
+)
+
+logger = logging.getLogger("chat-api")
+
+_SAMPLE_ROWS = re.compile(r"\n*/\*\n\d+ rows from .*?\*/", re.DOTALL)
+_TRAILING_SPACE = re.compile(r"[ \t]+\n")
+
+
+@dataclass(frozen=True)
+class StaticPrefix:
+    agent: str
+    text: str
+    version: str
+    tokens: int
+
+
+@dataclass
+class PrefixUsage:
+    """Prefix token accounting for one ``/chat`` request."""
+
+    calls: int = 0
+    prefix_tokens: int = 0
+    cached_tokens: int = 0
+    uncached_tokens: int = 0
+    explicit_calls: int = 0
+    provider_prompt_tokens: int = 0
+    provider_cached_tokens: int = 0
+
+
+_current: contextvars.ContextVar[Optional[PrefixUsage]] = contextvars.ContextVar("prefix_usage", default=None)
+_prefixes: Dict[str, StaticPrefix] = {}
+_warm: Dict[Tuple[str, str], float] = {}
+_explicit: Dict[Tuple[str, str], Tuple[str, float]] = {}
+_explicit_failed: Dict[Tuple[str, str], float] = {}
+_explicit_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+_schema_failed_at = [0.0]
+
+prompt_cache_stats: Dict[str, Any] = {
+    "requests": 0,
+    "calls": 0,
+    "prefix_tokens": 0,
+    "cached_tokens": 0,
+    "uncached_tokens": 0,
+    "explicit_calls": 0,
+    "explicit_caches_created": 0,
+    "explicit_fallbacks": 0,
+    "provider_prompt_tokens": 0,
+    "provider_cached_tokens": 0,
+    "prefix_mismatches": 0,
+}
+recent_requests: Deque[Dict[str, Any]] = deque(maxlen=100)
+
+
+def _canonical(text: str) -> str:
+    return _TRAILING_SPACE.sub("\n", text.replace("\r\n", "\n")).strip()
+
+
+def strip_sample_rows(schema: str) -> str:
+    """Drop langchain's sample-row comments; they follow the data, not the schema."""
+    return _canonical(_SAMPLE_ROWS.sub("", schema))
+
+
+def schema_snapshot() -> str:
+    """Full schema without sample rows, or "" while MySQL is unreachable."""
+    if time.monotonic() - _schema_failed_at[0] < 30:
+        return ""
+    try:
+        from functions import db_tools
+
+        return strip_sample_rows(db_tools.get_table_info())
+    except Exception as exc:
+        _schema_failed_at[0] = time.monotonic()
+        logger.warning("schema snapshot unavailable, prefix sent without it: %s", exc)
+        return ""
+
+
+def assemble(agent: str, instruction: str, schema: Optional[str] = None) -> StaticPrefix:
+    """Build the static prefix for ``agent`` and remember it for the callbacks."""
+    text = _canonical(instruction)
+    if schema:
+        text = f"{text}\n\n{SCHEMA_HEADER}\n\n{schema}"
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=6).hexdigest()
+    prefix = StaticPrefix(agent=agent, text=text, version=f"{PREFIX_FORMAT}-{digest}", tokens=len(text) // 4)
+    _prefixes[agent] = prefix
+    return prefix
+
+
+def static_instruction(agent: str, instruction: str, include_schema: bool = False) -> Callable[[Any], str]:
+    """ADK instruction provider returning the byte-stable prefix for ``agent``.
+
+    A callable instruction also tells ADK to skip ``{state}`` templating, so
+    nothing request-specific can leak into the prefix.
+    """
+    def provider(readonly_context) -> str:
+        return assemble(agent, instruction, schema_snapshot() if include_schema else None).text
+
+    return provider
+
+
+def prefixes() -> Dict[str, Dict[str, Any]]:
+    return {agent: {"version": p.version, "tokens": p.tokens} for agent, p in _prefixes.items()}
+
+
+def start() -> Optional[PrefixUsage]:
+    if PROMPT_CACHE == "off":
+        return None
+    usage = PrefixUsage()
+    _current.set(usage)
+    return usage
+
+
+def finish(usage: Optional[PrefixUsage]) -> None:
+    if usage is None:
+        return
+    prompt_cache_stats["requests"] += 1
+    record = asdict(usage)
+    for key, value in record.items():
+        prompt_cache_stats[key] += value
+    recent_requests.append({"ts": round(time.time(), 3), **record})
+    logger.debug("prompt prefix usage: %s", record)
+
+
+def _min_tokens(model: str) -> int:
+    return MIN_CACHE_TOKENS["flash"] if "flash" in model else MIN_CACHE_TOKENS["pro"]
+
+
+async def _explicit_cache(model: str, prefix: StaticPrefix, llm_request) -> Optional[str]:
+    """Return a live CachedContent name for (model, prefix), creating it once."""
+    key = (model, prefix.version)
+    now = time.time()
+    entry = _explicit.get(key)
+    if entry and entry[1] - 60 > now:
+        return entry[0]
+    if prefix.tokens < _min_tokens(model) or now - _explicit_failed.get(key, 0.0) < PROMPT_CACHE_RETRY_SECONDS:
+        return None
+    lock = _explicit_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        entry = _explicit.get(key)
+        if entry and entry[1] - 60 > time.time():
+            return entry[0]
+        from server.shared_cache import get_shared_cache
+
+        shared_key = f"{model}:{prefix.version}"
+        # Another worker may already have registered this prefix
+        shared = get_shared_cache().get("prompt_cache", shared_key)
+        if shared and shared["expires_at"] - 60 > time.time():
+            _explicit[key] = (shared["name"], shared["expires_at"])
+            return shared["name"]
+        try:
+            from google import genai
+            from google.genai import types
+
+            cache = await genai.Client().aio.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=prefix.text,
+                    tools=llm_request.config.tools,
+                    tool_config=llm_request.config.tool_config,
+                    ttl=f"{PROMPT_CACHE_TTL}s",
+                    display_name=f"{prefix.agent}-{prefix.version}",
+                ),
+            )
+        except Exception as exc:
+            _explicit_failed[key] = time.time()
+            logger.warning("explicit prompt cache unavailable for %s (%s), using implicit caching: %s",
+                           prefix.agent, model, exc)
+            return None
+        expires_at = time.time() + PROMPT_CACHE_TTL
+        _explicit[key] = (cache.name, expires_at)
+        get_shared_cache().set("prompt_cache", shared_key, {"name": cache.name, "expires_at": expires_at},
+                               ttl=PROMPT_CACHE_TTL - 60)
+        prompt_cache_stats["explicit_caches_created"] += 1
+        return cache.name
+
+
+async def before_model_callback(callback_context, llm_request) -> None:
+    """ADK hook: account for the static prefix and, in explicit mode, send it by reference.
+
+    Runs last among the model callbacks, after routing has fixed the model and
+    the context window has appended the conversation summary.
+    """
+    if PROMPT_CACHE == "off":
+        return None
+    prefix = _prefixes.get(callback_context.agent_name)
+    instruction = llm_request.config.system_instruction if llm_request.config else None
+    if prefix is None or not isinstance(instruction, str) or not instruction.startswith(prefix.text):
+        prompt_cache_stats["prefix_mismatches"] += 1
+        return None
+    model = llm_request.model or ""
+    usage = _current.get()
+
+    name = await _explicit_cache(model, prefix, llm_request) if PROMPT_CACHE == "explicit" else None
+    if PROMPT_CACHE == "explicit" and name is None:
+        prompt_cache_stats["explicit_fallbacks"] += 1
+    if name is not None:
+        from google.genai import types
+
+        # The cache holds the prefix and the tools; the request may not repeat them
+        tail = instruction[len(prefix.text):].strip()
+        llm_request.config.cached_content = name
+        llm_request.config.system_instruction = None
+        llm_request.config.tools = None
+        llm_request.config.tool_config = None
+        if tail:
+            llm_request.contents = [types.Content(role="user", parts=[types.Part(text=tail)])] + list(
+                llm_request.contents or []
+            )
+
+    key = (model, prefix.version)
+    now = time.monotonic()
+    cacheable = prefix.tokens >= _min_tokens(model)
+    warm = name is not None or (cacheable and now - _warm.get(key, float("-inf")) < PROMPT_CACHE_TTL)
+    _warm[key] = now
+    if usage is not None:
+        usage.calls += 1
+        usage.prefix_tokens += prefix.tokens
+        usage.explicit_calls += name is not None
+        if warm:
+            usage.cached_tokens += prefix.tokens
+        else:
+            usage.uncached_tokens += prefix.tokens
+    return None
+
+
+def after_model_callback(callback_context, llm_response) -> None:
+    """ADK hook: add the provider's own prompt/cached token counts when reported."""
+    usage = _current.get()
+    metadata = getattr(llm_response, "usage_metadata", None)
+    if usage is None or metadata is None:
+        return None
+    usage.provider_prompt_tokens += metadata.prompt_token_count or 0
+    usage.provider_cached_tokens += metadata.cached_content_token_count or 0
+    return None
+
+
+def snapshot() -> Dict[str, Any]:
+    sent = prompt_cache_stats["prefix_tokens"]
+    return {
+        "mode": PROMPT_CACHE,
+        "prefixes": prefixes(),
+        **prompt_cache_stats,
+        "cached_ratio": round(prompt_cache_stats["cached_tokens"] / sent, 3) if sent else None,
+        "recent_requests": list(recent_requests)[-10:],
+    }
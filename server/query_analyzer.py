@@ -0,0 +1,327 @@
+# server/query_analyzer.py
+"""Rank logged SQL fingerprints by total time and suggest indexes and rollups.
+
+Reads the JSON lines written by ``server.query_log`` and groups them by
+fingerprint. For each of the ``--top`` most expensive fingerprints it works
+out, from the normalised SQL, which columns are filtered by equality, by
+range, joined on, grouped and ordered by, and proposes a composite index per
+table (equality columns first, then one range or ordering column) unless an
+existing key already starts with it. Keys and columns are read from the
+schema script (``--schema``). Aggregations over the resource timeseries also
+get a rollup suggestion. Index suggestions shared by several fingerprints
+are merged and ranked by the total time of the queries they would help.
+
+Usage:
+    python -m server.query_analyzer [--log .cache/query_log.jsonl] [--top 10] [--json]
+"""
+import argparse
+import json
+import math
+import os
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .query_log import QUERY_LOG_PATH
+
+DEFAULT_SCHEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "data", "mock_pune_50_hospitals.sql")
+TIMESERIES = "hospital_resource_timeseries"
+
+_CREATE = re.compile(r"create table (?:if not exists )?`?(\w+)`?\s*\((.*?)\n\);", re.IGNORECASE | re.DOTALL)
+_PRIMARY = re.compile(r"primary key\s*\(([^)]*)\)", re.IGNORECASE)
+_FOREIGN = re.compile(r"foreign key\s*\(([^)]*)\)", re.IGNORECASE)
+_ALIASES = re.compile(r"\b(?:from|join)\s+(\w+)(?:\s+(?:as\s+)?(?!on\b|where\b|join\b|group\b|order\b|limit\b|"
+                      r"left\b|right\b|inner\b|outer\b|cross\b|using\b)(\w+))?")
+_COLUMN = r"(?:(\w+)\.)?(\w+)"
+# A filtered column may be wrapped in one function call, e.g. date(timestamp) >= ?; the call hides
+# the column from a plain index, so the function name is captured to suggest a rewrite instead
+_FILTERED = r"\b(?:(?!(?:and|or|not|in|exists)\b)(\w+)\s*\(\s*)?" + _COLUMN + r"(?:\s*\))?"
+_EQUALITY = re.compile(_FILTERED + r"\s*(?:=|<=>|\bin\s*\()\s*(?:\?|\(\s*select\b)")
+_RANGE = re.compile(_FILTERED + r"\s*(?:<=|>=|<|>|\bbetween\b|\blike\b)\s*\?")
+_JOIN_ON = re.compile(r"\bon\s+" + _COLUMN + r"\s*=\s*" + _COLUMN)
+_AGGREGATE = re.compile(r"\b(?:sum|avg|count|min|max)\s*\(")
+_LATEST = re.compile(r"\bmax\s*\(\s*(?:\w+\.)?timestamp\s*\)|order by (?:\w+\.)?timestamp desc")
+# Functions on a date column whose filter can be rewritten as a plain range on the column
+_RANGE_REWRITES = {
+    "date": "{column} >= ? and {column} < ? + interval 1 day",
+    "year": "{column} >= makedate(?, 1) and {column} < makedate(? + 1, 1)",
+}
+_CLAUSE_END = re.compile(r"\bgroup by\b|\border by\b|\blimit\b|\bhaving\b|\bunion\b|[()]")
+
+
+def load_schema(path: str = DEFAULT_SCHEMA) -> Tuple[Dict[str, List[str]], Dict[str, List[Tuple[str, ...]]]]:
+    """Columns per table and the column lists of its existing keys, from a schema script."""
+    with open(path, encoding="utf-8") as fh:
+        sql = fh.read()
+    columns: Dict[str, List[str]] = {}
+    keys: Dict[str, List[Tuple[str, ...]]] = {}
+    for table, body in _CREATE.findall(sql):
+        table = table.casefold()
+        columns[table], keys[table] = [], []
+        for line in body.splitlines():
+            line = line.strip().rstrip(",")
+            for pattern in (_PRIMARY, _FOREIGN):
+                match = pattern.search(line)
+                if match:
+                    keys[table].append(tuple(c.strip(" `").casefold() for c in match.group(1).split(",")))
+            if not line or line.upper().startswith(("PRIMARY", "FOREIGN", "KEY", "INDEX", "UNIQUE", "CONSTRAINT")):
+                continue
+            name = line.split()[0].strip("`").casefold()
+            columns[table].append(name)
+            if "primary key" in line.casefold():
+                keys[table].append((name,))
+    return columns, keys
+
+
+def read_log(path: str) -> Iterable[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A torn last line from a killed worker; skip it
+                    continue
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct * len(ordered)) - 1))]
+
+
+def aggregate(entries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Group log entries by fingerprint, most total time first."""
+    groups: Dict[str, Dict[str, Any]] = {}
+    durations: Dict[str, List[float]] = defaultdict(list)
+    for entry in entries:
+        fid = entry["fingerprint_id"]
+        group = groups.get(fid)
+        if group is None:
+            group = groups[fid] = {"fingerprint_id": fid, "fingerprint": entry["fingerprint"],
+                                   "tables": entry.get("tables", []), "count": 0, "errors": 0,
+                                   "rows_total": 0, "questions": []}
+        group["count"] += 1
+        durations[fid].append(float(entry.get("duration_ms") or 0.0))
+        if entry.get("error"):
+            group["errors"] += 1
+        group["rows_total"] += entry.get("rows") or 0
+        question = entry.get("question")
+        if question and question not in group["questions"] and len(group["questions"]) < 3:
+            group["questions"].append(question)
+    for fid, group in groups.items():
+        values = durations[fid]
+        group.update(total_ms=round(sum(values), 1), mean_ms=round(sum(values) / len(values), 1),
+                     p95_ms=round(_percentile(values, 0.95), 1), max_ms=round(max(values), 1),
+                     mean_rows=round(group.pop("rows_total") / group["count"], 1))
+    return sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)
+
+
+def _resolve(fingerprint: str, columns: Dict[str, List[str]]):
+    """Return a function mapping ``(qualifier, column)`` to its table, or None when unknown."""
+    aliases: Dict[str, str] = {}
+    for table, alias in _ALIASES.findall(fingerprint):
+        if table in columns:
+            aliases[table] = table
+            if alias:
+                aliases[alias] = table
+    in_query = sorted(set(aliases.values()))
+
+    def table_of(qualifier: Optional[str], column: str) -> Optional[str]:
+        if qualifier:
+            table = aliases.get(qualifier)
+            return table if table and column in columns[table] else None
+        owners = [t for t in in_query if column in columns[t]]
+        return owners[0] if len(owners) == 1 else None
+
+    return table_of
+
+
+def _clause(fingerprint: str, keyword: str) -> str:
+    """Every ``keyword`` clause, outer query and subqueries, each cut at its own nesting level.
+
+    A clause ends at the next clause keyword outside parentheses, or at the
+    ``)`` that closes its subquery, so ``date(timestamp)`` or an ``in (...)``
+    list does not end it.
+    """
+    clauses = []
+    for match in re.finditer(r"\b" + keyword + r"\b", fingerprint):
+        depth, end = 0, len(fingerprint)
+        for token in _CLAUSE_END.finditer(fingerprint, match.end()):
+            if token.group(0) == "(":
+                depth += 1
+            elif token.group(0) == ")":
+                depth -= 1
+                if depth < 0:
+                    end = token.start()
+                    break
+            elif depth == 0:
+                end = token.start()
+                break
+        clauses.append(fingerprint[match.end():end])
+    return " ".join(clauses)
+
+
+def _columns_in(text: str, table_of) -> List[Tuple[str, str]]:
+    found = []
+    for qualifier, column in re.findall(_COLUMN, text):
+        table = table_of(qualifier or None, column)
+        if table and (table, column) not in found:
+            found.append((table, column))
+    return found
+
+
+def _filters(fingerprint: str, table_of) -> Iterable[Tuple[str, str, str, str]]:
+    """``(kind, function, table, column)`` for each equality/range filter in WHERE and HAVING."""
+    where = " ".join(_clause(fingerprint, kw) for kw in ("where", "having"))
+    for pattern, kind in ((_EQUALITY, "equality"), (_RANGE, "range")):
+        for function, qualifier, column in pattern.findall(where):
+            table = table_of(qualifier or None, column)
+            if table:
+                yield kind, function, table, column
+
+
+def _covered(proposal: Tuple[str, ...], existing: List[Tuple[str, ...]]) -> bool:
+    return any(key[:len(proposal)] == proposal for key in existing)
+
+
+def suggest_indexes(fingerprint: str, columns: Dict[str, List[str]],
+                    keys: Dict[str, List[Tuple[str, ...]]]) -> List[Dict[str, Any]]:
+    """Composite index proposals (equality, then range/order column) per table for one fingerprint."""
+    table_of = _resolve(fingerprint, columns)
+    equality: Dict[str, List[str]] = defaultdict(list)
+    ranged: Dict[str, List[str]] = defaultdict(list)
+    rewritten: Dict[str, List[str]] = defaultdict(list)
+    for kind, function, table, column in _filters(fingerprint, table_of):
+        if function:
+            # Only usable once rewritten as a range on the bare column (see suggest_rewrites)
+            if function not in _RANGE_REWRITES:
+                continue
+            kind = "range"
+            rewritten[table].append(f"{function}({column})")
+        target = equality if kind == "equality" else ranged
+        if column not in target[table]:
+            target[table].append(column)
+    for q1, c1, q2, c2 in _JOIN_ON.findall(fingerprint):
+        for qualifier, column in ((q1, c1), (q2, c2)):
+            table = table_of(qualifier or None, column)
+            if table and column not in equality[table]:
+                equality[table].append(column)
+    ordering: Dict[str, List[str]] = defaultdict(list)
+    for keyword in ("group by", "order by"):
+        for table, column in _columns_in(_clause(fingerprint, keyword), table_of):
+            if column not in ordering[table]:
+                ordering[table].append(column)
+
+    proposals = []
+    for table in sorted(set(equality) | set(ranged) | set(ordering)):
+        lead = list(equality[table])
+        tail = next((c for c in ranged[table] + ordering[table] if c not in lead), None)
+        index = tuple(lead + ([tail] if tail else []))
+        if not index or _covered(index, keys.get(table, [])):
+            continue
+        reasons = ([f"equality on {', '.join(lead)}"] if lead else []) + \
+                  ([f"{'range' if tail in ranged[table] else 'ordering'} on {tail}"] if tail else [])
+        if any(call.endswith(f"({c})") for call in rewritten[table] for c in index):
+            reasons.append(f"after rewriting {', '.join(rewritten[table])} as a range")
+        proposals.append({"table": table, "columns": list(index), "reason": "; ".join(reasons),
+                          "ddl": f"CREATE INDEX idx_{table}_{'_'.join(index)} ON {table} ({', '.join(index)});"})
+    return proposals
+
+
+def suggest_rewrites(fingerprint: str, columns: Dict[str, List[str]]) -> List[str]:
+    """Filters on a function of a column, which no plain index on the column can serve."""
+    ideas = []
+    for _kind, function, table, column in _filters(fingerprint, _resolve(fingerprint, columns)):
+        call = f"{function}({column})"
+        if not function or any(idea.startswith(call + " ") for idea in ideas):
+            continue
+        if function in _RANGE_REWRITES:
+            ideas.append(f"{call} on {table} cannot use an index on {column}; filter on the column itself, "
+                         f"e.g. {_RANGE_REWRITES[function].format(column=column)}")
+        else:
+            ideas.append(f"{call} on {table} cannot use an index on {column}; rewrite the filter on the column "
+                         f"itself, or add a functional index (MySQL 8.0.13+): "
+                         f"CREATE INDEX idx_{table}_{function}_{column} ON {table} (({call}));")
+    return ideas
+
+
+def suggest_rollups(fingerprint: str) -> List[str]:
+    """Precomputation ideas for aggregation patterns over the resource timeseries."""
+    if TIMESERIES not in fingerprint:
+        return []
+    ideas = []
+    if _LATEST.search(fingerprint):
+        ideas.append("latest snapshot per hospital: keep a hospital_resource_latest table (one row per "
+                     "hospital, upserted on ingest) or index hospital_resource_timeseries (hospital_id, timestamp)")
+    elif _AGGREGATE.search(fingerprint) and ("group by" in fingerprint or "date(" in fingerprint):
+        ideas.append("daily rollup: hospital_resource_daily (hospital_id, day, avg/max of the occupancy, ICU, "
+                     "ventilator and oxygen columns), refreshed incrementally from the newest timestamp")
+    return ideas
+
+
+def analyze(entries: Iterable[Dict[str, Any]], top: int = 10, schema_path: str = DEFAULT_SCHEMA) -> Dict[str, Any]:
+    columns, keys = load_schema(schema_path)
+    groups = aggregate(entries)
+    total = sum(g["total_ms"] for g in groups)
+    merged: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+    for group in groups[:top]:
+        group["share"] = round(group["total_ms"] / total, 3) if total else 0.0
+        group["indexes"] = suggest_indexes(group["fingerprint"], columns, keys)
+        group["rewrites"] = suggest_rewrites(group["fingerprint"], columns)
+        group["rollups"] = suggest_rollups(group["fingerprint"])
+        for proposal in group["indexes"]:
+            key = (proposal["table"], tuple(proposal["columns"]))
+            item = merged.setdefault(key, {**proposal, "helps_ms": 0.0, "fingerprints": []})
+            item["helps_ms"] = round(item["helps_ms"] + group["total_ms"], 1)
+            item["fingerprints"].append(group["fingerprint_id"])
+    indexes = sorted(merged.values(), key=lambda i: i["helps_ms"], reverse=True)
+    # An index whose columns start another proposal on the same table is redundant
+    indexes = [i for i in indexes if not any(
+        o is not i and o["table"] == i["table"] and len(o["columns"]) > len(i["columns"])
+        and o["columns"][:len(i["columns"])] == i["columns"] for o in indexes)]
+    return {"statements": sum(g["count"] for g in groups), "fingerprints": len(groups),
+            "total_ms": round(total, 1), "top": groups[:top], "indexes": indexes}
+
+
+def render_text(report: Dict[str, Any]) -> str:
+    lines = [f"{report['statements']} statements, {report['fingerprints']} fingerprints, "
+             f"{report['total_ms'] / 1000:.1f} s total", ""]
+    for rank, group in enumerate(report["top"], 1):
+        lines.append(f"#{rank} {group['fingerprint_id']}  total {group['total_ms']:.0f} ms ({group['share']:.0%})  "
+                     f"calls {group['count']}  mean {group['mean_ms']:.0f} ms  p95 {group['p95_ms']:.0f} ms  "
+                     f"rows {group['mean_rows']:g}  errors {group['errors']}")
+        lines.append(f"   {group['fingerprint'][:300]}")
+        for question in group["questions"]:
+            lines.append(f"   asked as: {question[:120]}")
+        for proposal in group["indexes"]:
+            lines.append(f"   index: {proposal['ddl']}  ({proposal['reason']})")
+        for idea in group["rewrites"]:
+            lines.append(f"   rewrite: {idea}")
+        for idea in group["rollups"]:
+            lines.append(f"   rollup: {idea}")
+        lines.append("")
+    if report["indexes"]:
+        lines.append("recommended indexes, by query time they would help:")
+        for proposal in report["indexes"]:
+            lines.append(f"  {proposal['helps_ms']:10.0f} ms  {proposal['ddl']}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", default=QUERY_LOG_PATH)
+    parser.add_argument("--schema", default=DEFAULT_SCHEMA, help="schema script to read columns and keys from")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log):
+        parser.exit(1, f"no query log at {args.log}\n")
+    report = analyze(read_log(args.log), args.top, args.schema)
+    print(json.dumps(report, indent=2) if args.json else render_text(report))
+
+
+if __name__ == "__main__":
+    main()
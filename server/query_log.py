@@ -0,0 +1,179 @@
+# server/query_log.py
+"""Append-only log of every SQL statement the agent executes.
+
+``record()`` is called on the request path and only puts a tuple on a queue.
+A background thread fingerprints the statements (literals replaced by ``?``,
+whitespace and case normalised, comments and optimizer hints removed), works
+out the tables they touch and appends them as JSON lines to
+``QUERY_LOG_PATH``. Each batch is written with a single ``O_APPEND`` write,
+so several workers can share the file.
+
+``python -m server.query_analyzer`` ranks the fingerprints by total time and
+suggests indexes and rollups.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "./.cache/query_log.jsonl")
+QUERY_LOG_QUEUE_SIZE = int(os.getenv("QUERY_LOG_QUEUE_SIZE", "10000"))
+QUERY_LOG_QUESTION_CHARS = 300
+
+logger = logging.getLogger("chat-api")
+
+_COMMENTS = re.compile(r"/\*.*?\*/|--[^\n]*|#[^\n]*", re.DOTALL)
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBERS = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", re.IGNORECASE)
+_IN_LISTS = re.compile(r"\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_LISTS = re.compile(r"\bvalues\s*(\(\s*\?(?:\s*,\s*\?)*\s*\)\s*,?\s*)+", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+_TABLES = re.compile(r"\b(?:from|join|update|into)\s+((?:`?\w+`?\.)?`?\w+`?)", re.IGNORECASE)
+_SUBQUERY_START = re.compile(r"\s*(?:select|with)\b", re.IGNORECASE)
+_WITH = re.compile(r"\s*\(?\s*with\b", re.IGNORECASE)
+_CTE_NAMES = re.compile(r"`?(\w+)`?\s*(?:\([\w\s,`]*\))?\s+as\s*\(", re.IGNORECASE)
+
+
+def fingerprint(sql: str) -> str:
+    """Normalise ``sql`` so statements differing only in literals share one fingerprint."""
+    text = _STRINGS.sub("?", sql or "")
+    text = _COMMENTS.sub(" ", text)
+    text = _NUMBERS.sub("?", text)
+    text = _IN_LISTS.sub("in (?+)", text)
+    text = _VALUES_LISTS.sub("values (?+) ", text)
+    return _SPACE.sub(" ", text).strip().rstrip(";").strip().casefold()
+
+
+def fingerprint_id(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _in_function_call(text: str, position: int) -> bool:
+    """True when ``position`` sits inside parentheses that are not a subquery, e.g. ``EXTRACT(... FROM x)``."""
+    depth = 0
+    for i in range(position - 1, -1, -1):
+        if text[i] == ")":
+            depth += 1
+        elif text[i] == "(":
+            if depth == 0:
+                return not _SUBQUERY_START.match(text, i + 1)
+            depth -= 1
+    return False
+
+
+def tables_touched(sql: str) -> List[str]:
+    text = _COMMENTS.sub(" ", _STRINGS.sub("''", sql or ""))
+    names = {m.group(1).replace("`", "").split(".")[-1].casefold() for m in _TABLES.finditer(text)
+             if not _in_function_call(text, m.start())}
+    # Names defined in a WITH list are not tables
+    if _WITH.match(text):
+        names -= {name.casefold() for name in _CTE_NAMES.findall(text)}
+    # "FROM (SELECT ..." and "FROM dual" are not tables
+    names.discard("select")
+    names.discard("dual")
+    return sorted(names)
+
+
+class QueryLog:
+    """Queue plus writer thread; ``record`` never blocks on I/O."""
+
+    def __init__(self, path: str = QUERY_LOG_PATH) -> None:
+        self.path = path
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=QUERY_LOG_QUEUE_SIZE)
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0, "write_errors": 0}
+
+    def record(self, sql: str, duration_ms: float, rows: Optional[int], question: Optional[str] = None,
+               error: Optional[str] = None) -> None:
+        try:
+            self._queue.put_nowait((time.time(), sql, duration_ms, rows, question, error))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return
+        self.stats["recorded"] += 1
+        if self._writer is None or not self._writer.is_alive():
+            with self._lock:
+                if self._writer is None or not self._writer.is_alive():
+                    self._writer = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+                    self._writer.start()
+
+    @staticmethod
+    def _entry(item: tuple) -> Dict[str, Any]:
+        ts, sql, duration_ms, rows, question, error = item
+        text = fingerprint(sql)
+        entry = {
+            "ts": round(ts, 3),
+            "fingerprint_id": fingerprint_id(text),
+            "fingerprint": text,
+            "tables": tables_touched(text),
+            "duration_ms": round(duration_ms, 3),
+            "rows": rows,
+            "question": (question or "")[:QUERY_LOG_QUESTION_CHARS] or None,
+        }
+        if error:
+            entry["error"] = error[:200]
+        return entry
+
+    def _drain(self, first: tuple) -> List[tuple]:
+        batch = [first]
+        while len(batch) < 500:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[tuple]) -> None:
+        blob = "".join(json.dumps(self._entry(item), default=str) + "\n" for item in batch).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, blob)
+            finally:
+                os.close(fd)
+            self.stats["written"] += len(batch)
+        except OSError as exc:
+            self.stats["write_errors"] += 1
+            logger.warning("query log write failed, %d entries lost: %s", len(batch), exc)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._drain(self._queue.get())
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"in_use": self._queue.qsize(), "capacity": QUERY_LOG_QUEUE_SIZE, "path": self.path, **self.stats}
+
+    def flush(self) -> None:
+        """Write everything queued so far (used at exit)."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+
+query_log = QueryLog()
+atexit.register(query_log.flush)
+
+
+def record(sql: str, duration_ms: float, rows: Optional[int], question: Optional[str] = None,
+           error: Optional[str] = None) -> None:
+    if QUERY_LOG_ENABLED:
+        query_log.record(sql, duration_ms, rows, question, error)
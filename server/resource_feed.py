@@ -0,0 +1,186 @@
+# server/resource_feed.py
+"""In-memory, incrementally refreshed window of ``hospital_resource_timeseries``.
+
+The feed keeps the last ``FEED_HISTORY`` snapshots of every hospital in one
+NumPy array of shape ``(hospitals, FEED_HISTORY, columns)``. The newest
+snapshot is ``history[:, -1]``, and gaps are NaN. On each tick a background
+task reads only the rows newer than its watermark, shifts them into the
+array, and calls the subscribers (``server.alerts``, ...) with the indices
+of the hospitals that changed. Subscribers can then evaluate every hospital
+in one vectorised pass instead of one query per question.
+
+Rows arrive from outside this process (the data loaders write to MySQL), so
+the feed polls every ``FEED_POLL_INTERVAL`` seconds. The first tick loads
+the last ``FEED_BOOTSTRAP_HOURS`` of history.
+"""
+import asyncio
+import datetime
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+FEED_ENABLED = os.getenv("FEED_ENABLED", "true").lower() in ("1", "true", "yes")
+FEED_POLL_INTERVAL = float(os.getenv("FEED_POLL_INTERVAL", "30"))
+FEED_HISTORY = int(os.getenv("FEED_HISTORY", "48"))
+FEED_BOOTSTRAP_HOURS = float(os.getenv("FEED_BOOTSTRAP_HOURS", "168"))
+
+TABLE = "hospital_resource_timeseries"
+COLUMNS = (
+    "occupied_beds", "total_beds", "ed_total_beds", "ed_occupied_beds", "ward_capacity_beds",
+    "total_icu_beds", "icu_occupied_beds", "total_ventilators", "in_use_ventilators",
+    "oxygen_units_liters", "available_oxygen_liters", "estimated_daily_consumption_oxygen_liters",
+    "tb_med_stock_tablets", "diag_kits_available", "available_staff_count", "on_shift_doctors",
+    "required_doctors", "on_shift_nurses", "ambulance_arrivals_24h", "critical_cases_ed",
+    "avg_daily_admissions_7d", "avg_ed_tat_minutes_1h", "avg_ed_tat_minutes_6h",
+)
+COLUMN_INDEX = {name: i for i, name in enumerate(COLUMNS)}
+
+logger = logging.getLogger("chat-api")
+
+Subscriber = Callable[["ResourceFeed", np.ndarray], None]
+
+
+def isoformat(stamp: float) -> Optional[str]:
+    """Local time string for an epoch-seconds entry of ``ResourceFeed.times`` (None for gaps)."""
+    if not np.isfinite(stamp):
+        return None
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stamp))
+
+
+class ResourceFeed:
+    """Rolling per-hospital history with a timestamp watermark."""
+
+    def __init__(self, history: int = FEED_HISTORY) -> None:
+        self.depth = history
+        self.hospital_ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.names: Dict[str, str] = {}
+        self.values = np.full((0, history, len(COLUMNS)), np.nan)
+        self.times = np.full((0, history), np.nan)
+        self.watermark: Optional[datetime.datetime] = None
+        self._subscribers: List[Subscriber] = []
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"ticks": 0, "rows_ingested": 0, "duplicates": 0, "errors": 0,
+                                      "last_tick_ms": 0.0, "last_tick_at": None}
+
+    def subscribe(self, fn: Subscriber) -> None:
+        self._subscribers.append(fn)
+
+    def column(self, name: str) -> int:
+        return COLUMN_INDEX[name]
+
+    def find(self, text: str) -> List[int]:
+        """Positions of hospitals whose id or name contains ``text`` (case-insensitive)."""
+        needle = text.casefold().strip()
+        return [i for i, hid in enumerate(self.hospital_ids)
+                if needle in hid.casefold() or needle in str(self.names.get(hid, "")).casefold()]
+
+    def latest(self) -> np.ndarray:
+        """Copy of the newest snapshot per hospital, shape ``(hospitals, columns)``."""
+        with self._lock:
+            return self.values[:, -1, :].copy()
+
+    def _grow(self, hospital_id: str) -> int:
+        position = self.index[hospital_id] = len(self.hospital_ids)
+        self.hospital_ids.append(hospital_id)
+        self.values = np.concatenate([self.values, np.full((1, self.depth, len(COLUMNS)), np.nan)])
+        self.times = np.concatenate([self.times, np.full((1, self.depth), np.nan)])
+        return position
+
+    def ingest(self, rows: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """Shift ``rows`` (dicts with timestamp, hospital_id and COLUMNS) into the history.
+
+        Returns:
+            Sorted indices of the hospitals that received at least one new snapshot
+        """
+        if not rows:
+            return np.empty(0, dtype=int)
+        rows = sorted(rows, key=lambda r: r["timestamp"])
+        with self._lock:
+            positions = np.array([self.index.get(r["hospital_id"]) if r["hospital_id"] in self.index
+                                  else self._grow(r["hospital_id"]) for r in rows], dtype=int)
+            stamps = np.array([r["timestamp"].timestamp() for r in rows], dtype=float)
+            matrix = np.array([[np.nan if r.get(c) is None else float(r[c]) for c in COLUMNS] for r in rows],
+                              dtype=float)
+            # Drop rows at or before what we already hold (the watermark query is inclusive)
+            fresh = ~(stamps <= np.nan_to_num(self.times[positions, -1], nan=-np.inf))
+            self.stats["duplicates"] += int((~fresh).sum())
+            positions, stamps, matrix = positions[fresh], stamps[fresh], matrix[fresh]
+            # A hospital can get several rows per tick: shift in rounds, one row per hospital per round
+            rank = np.zeros(positions.size, dtype=int)
+            seen: Dict[int, int] = {}
+            for i, p in enumerate(positions):
+                rank[i] = seen.get(p, 0)
+                seen[p] = rank[i] + 1
+            for r in range(int(rank.max()) + 1 if rank.size else 0):
+                sel = rank == r
+                idx = positions[sel]
+                self.values[idx, :-1] = self.values[idx, 1:]
+                self.values[idx, -1] = matrix[sel]
+                self.times[idx, :-1] = self.times[idx, 1:]
+                self.times[idx, -1] = stamps[sel]
+            newest = max(r["timestamp"] for r in rows)
+            if self.watermark is None or newest > self.watermark:
+                self.watermark = newest
+            self.stats["rows_ingested"] += int(positions.size)
+            return np.unique(positions)
+
+    def _fetch(self) -> List[Dict[str, Any]]:
+        from sqlalchemy import text
+
+        from functions.db_tools import get_db
+
+        select = f"SELECT timestamp, hospital_id, {', '.join(COLUMNS)} FROM {TABLE}"
+        with get_db()._engine.connect() as conn:
+            if not self.names:
+                hospitals = conn.execute(text("SELECT hospital_id, hospital_name FROM hospitals"))
+                self.names = {row[0]: row[1] for row in hospitals}
+            if self.watermark is None:
+                query = text(f"{select} WHERE timestamp >= (SELECT MAX(timestamp) FROM {TABLE}) "
+                             f"- INTERVAL :hours HOUR ORDER BY timestamp")
+                result = conn.execute(query, {"hours": FEED_BOOTSTRAP_HOURS})
+            else:
+                result = conn.execute(text(f"{select} WHERE timestamp >= :wm ORDER BY timestamp"),
+                                      {"wm": self.watermark})
+            return [dict(row._mapping) for row in result]
+
+    def tick(self) -> np.ndarray:
+        """Fetch rows newer than the watermark, ingest them and notify subscribers."""
+        started = time.perf_counter()
+        updated = self.ingest(self._fetch())
+        if updated.size:
+            for fn in self._subscribers:
+                try:
+                    fn(self, updated)
+                except Exception as exc:
+                    logger.warning("resource feed subscriber %s failed: %s", getattr(fn, "__name__", fn), exc)
+        self.stats["ticks"] += 1
+        self.stats["last_tick_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        self.stats["last_tick_at"] = time.time()
+        return updated
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"hospitals": len(self.hospital_ids), "history": self.depth,
+                "watermark": self.watermark.isoformat() if self.watermark else None, **self.stats}
+
+
+feed = ResourceFeed()
+
+
+async def poll_forever(interval: float = FEED_POLL_INTERVAL) -> None:
+    """Background task started by the app: tick the feed, backing off while MySQL is down."""
+    delay, failures = 0.0, 0
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await asyncio.to_thread(feed.tick)
+            delay, failures = interval, 0
+        except Exception as exc:
+            feed.stats["errors"] += 1
+            failures += 1
+            delay = min(max(interval, 1.0) * 2 ** min(failures, 5), 600.0)
+            logger.warning("resource feed tick failed, retrying in %.0fs: %s", delay, exc)
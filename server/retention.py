@@ -0,0 +1,649 @@
+# server/retention.py
+"""Retention, archival and compaction for the ADK session database.
+
+DatabaseSessionService never deletes anything, so ``my_chatbot_data.db``
+grows with every turn (and still holds the throwaway sessions older builds
+of ``/debug/db-test`` created), and ``get_session``/history reads slow down
+with it. A background
+cycle (one worker at a time, behind a file lock) applies a policy per app:
+
+- archive: sessions idle longer than ``archive`` are written to
+  ``<SESSION_ARCHIVE_DIR>/<app>/<YYYY-MM>.jsonl.gz`` (session row, state and
+  every event, one JSON line per session) and then deleted.
+- drop: the same, without the archive copy. Meant for test apps.
+- compact: in sessions idle at least ``RETENTION_MIN_IDLE``, the leading
+  turns that are already folded into the context summary and older than
+  ``compact`` are archived and their events deleted. The summary state is
+  kept and ``context_summary_upto`` is shifted down, so the model sees the
+  same context as before. ``update_time`` is left untouched.
+
+After each cycle SQLite gets ``PRAGMA incremental_vacuum`` and a WAL
+checkpoint, and ``ANALYZE`` every ``RETENTION_ANALYZE_EVERY`` cycles. Each
+cycle records database size, row counts and ``get_session`` latency on the
+most recent sessions, in memory and in ``RETENTION_REPORT_PATH``.
+
+Archived sessions can be put back with
+``python -m server.retention --restore APP USER SESSION``.
+
+``incremental_vacuum`` only frees pages in a file with
+``auto_vacuum=INCREMENTAL``. Switching an existing file needs one full
+``VACUUM``, which blocks writers for the whole rebuild. The background cycle
+therefore never does it; run ``python -m server.retention --vacuum`` once,
+during a quiet period.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-worker deployments only
+    fcntl = None
+
+from .runtime import APP_NAME, DATABASE_URL, get_session_service
+
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "true").lower() in ("1", "true", "yes")
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))
+RETENTION_STARTUP_DELAY = float(os.getenv("RETENTION_STARTUP_DELAY", "120"))
+SESSION_RETENTION = os.getenv(
+    "SESSION_RETENTION",
+    f"{APP_NAME}=archive:30d|compact:7d,{APP_NAME}_test=drop:0d,*=archive:90d",
+)
+SESSION_ARCHIVE_DIR = os.getenv("SESSION_ARCHIVE_DIR", "./.cache/session_archive")
+RETENTION_MIN_IDLE = os.getenv("RETENTION_MIN_IDLE", "1h")
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "100"))
+RETENTION_MAX_SESSIONS = int(os.getenv("RETENTION_MAX_SESSIONS", "2000"))
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "2000"))
+RETENTION_ANALYZE_EVERY = int(os.getenv("RETENTION_ANALYZE_EVERY", "24"))
+RETENTION_PROBE_SESSIONS = int(os.getenv("RETENTION_PROBE_SESSIONS", "5"))
+RETENTION_HISTORY = int(os.getenv("RETENTION_HISTORY", "168"))
+RETENTION_REPORT_PATH = os.getenv("RETENTION_REPORT_PATH", "./.cache/retention_report.jsonl")
+RETENTION_LOCK_PATH = os.getenv("RETENTION_LOCK_PATH", "./.cache/retention.lock")
+
+logger = logging.getLogger("chat-api")
+
+_DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*$")
+_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(text: str) -> float:
+    """``"30d"``, ``"12h"``, ``"90m"``, ``"0"`` -> seconds."""
+    match = _DURATION.match(text)
+    if not match:
+        raise ValueError(f"bad duration {text!r}; use a number with s, m, h, d or w")
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+
+@dataclass
+class Policy:
+    """What happens to one app's sessions. ``None`` disables that step."""
+
+    archive_after: Optional[float] = None
+    compact_after: Optional[float] = None
+    drop: bool = False
+
+    def describe(self) -> Dict[str, Any]:
+        return {"archive_after_hours": _hours(self.archive_after), "compact_after_hours": _hours(self.compact_after),
+                "drop": self.drop}
+
+
+def _hours(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds / 3600, 2)
+
+
+def parse_policies(spec: str) -> Dict[str, Policy]:
+    """Parse ``app=archive:30d|compact:7d,other=drop:0d,*=archive:90d``.
+
+    ``*`` applies to apps without their own entry; an app listed with no
+    actions (``app=``) is kept forever.
+    """
+    policies: Dict[str, Policy] = {}
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        app, _, actions = entry.partition("=")
+        policy = Policy()
+        for action in filter(None, (a.strip() for a in actions.split("|"))):
+            name, _, age = action.partition(":")
+            seconds = parse_duration(age or "0")
+            if name == "archive":
+                policy.archive_after = seconds
+            elif name == "drop":
+                policy.archive_after, policy.drop = seconds, True
+            elif name == "compact":
+                policy.compact_after = seconds
+            else:
+                raise ValueError(f"unknown retention action {name!r} for {app.strip()!r}")
+        policies[app.strip()] = policy
+    return policies
+
+
+def _is_turn_start(content: Optional[Dict[str, Any]]) -> bool:
+    # Same rule as sql_agent.context, on the stored JSON form of the content
+    if not content or content.get("role") != "user" or not content.get("parts"):
+        return False
+    parts = content["parts"]
+    return any(p.get("text") for p in parts) and not any(p.get("function_response") for p in parts)
+
+
+def turn_boundaries(events: List[Any]) -> List[int]:
+    """Index of the first event of each turn, grouped like ``context.split_turns``."""
+    starts: List[int] = []
+    for i, event in enumerate(events):
+        if event.content is None:
+            continue
+        if not starts or _is_turn_start(event.content):
+            starts.append(i)
+    return starts
+
+
+class ArchiveWriter:
+    """Appends JSON lines to ``<dir>/<app>/<YYYY-MM>.jsonl.gz``.
+
+    Every ``write`` adds a new gzip member to the month's file, which
+    ``gzip`` reads back as one stream, and fsyncs before returning, so rows are only
+    deleted once their archive copy is on disk.
+    """
+
+    def __init__(self, root: str = SESSION_ARCHIVE_DIR) -> None:
+        self.root = Path(root)
+
+    def path_for(self, app_name: str, when: Optional[datetime] = None) -> Path:
+        safe = re.sub(r"[^\w.-]+", "_", app_name)
+        return self.root / safe / f"{(when or datetime.now(timezone.utc)):%Y-%m}.jsonl.gz"
+
+    def write(self, app_name: str, records: List[Dict[str, Any]]) -> int:
+        if not records:
+            return 0
+        path = self.path_for(app_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        before = path.stat().st_size if path.exists() else 0
+        with open(path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="ab") as gz:
+                for record in records:
+                    gz.write((json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+            raw.flush()
+            os.fsync(raw.fileno())
+        return path.stat().st_size - before
+
+    def records(self, app_name: str) -> Iterator[Dict[str, Any]]:
+        """Every record archived for ``app_name``, oldest file first."""
+        folder = self.path_for(app_name).parent
+        for path in sorted(folder.glob("*.jsonl.gz")):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def _event_record(storage_event) -> Dict[str, Any]:
+    return json.loads(storage_event.to_event().model_dump_json(exclude_none=True))
+
+
+class SessionMaintenance:
+    """Runs the retention cycle against the shared session database."""
+
+    def __init__(self, spec: str = SESSION_RETENTION, archive_dir: str = SESSION_ARCHIVE_DIR) -> None:
+        self.policies = parse_policies(spec)
+        self.archive = ArchiveWriter(archive_dir)
+        self.min_idle = parse_duration(RETENTION_MIN_IDLE)
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=RETENTION_HISTORY)
+        self.stats: Dict[str, Any] = {
+            "cycles": 0, "skipped_locked": 0, "errors": 0, "last_error": None,
+            "archived_sessions": 0, "dropped_sessions": 0, "compacted_sessions": 0,
+            "pruned_events": 0, "archive_bytes": 0, "vacuumed_pages": 0, "analyze_runs": 0,
+        }
+        self._lock = threading.Lock()
+        self._vacuum_hint_logged = False
+
+    def policy_for(self, app_name: str) -> Policy:
+        return self.policies.get(app_name) or self.policies.get("*") or Policy()
+
+    # --- leader election -------------------------------------------------
+
+    def _try_lock(self):
+        if fcntl is None:
+            return True
+        Path(RETENTION_LOCK_PATH).parent.mkdir(parents=True, exist_ok=True)
+        handle = open(RETENTION_LOCK_PATH, "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return None
+        return handle
+
+    # --- retention -------------------------------------------------------
+
+    def maintain(self, dry_run: bool = False) -> Optional[Dict[str, Any]]:
+        """One retention pass; returns the per-cycle counts, or None if another worker holds the lock."""
+        handle = self._try_lock()
+        if handle is None:
+            self.stats["skipped_locked"] += 1
+            return None
+        try:
+            with self._lock:
+                return self._maintain(dry_run)
+        finally:
+            if handle is not True:
+                handle.close()
+
+    def _maintain(self, dry_run: bool) -> Dict[str, Any]:
+        from sqlalchemy import func, select
+
+        from google.adk.sessions.database_session_service import StorageSession
+
+        service = get_session_service()
+        started = time.perf_counter()
+        counts = {"archived": 0, "dropped": 0, "compacted": 0, "pruned_events": 0, "archive_bytes": 0}
+        with service.database_session_factory() as db:
+            # update_time is written by the database clock (UTC on SQLite), so cut off on that clock too
+            db_now = db.execute(select(func.now())).scalar()
+            if isinstance(db_now, str):
+                db_now = datetime.fromisoformat(db_now)
+            apps = [row[0] for row in db.execute(select(StorageSession.app_name).distinct())]
+        budget = RETENTION_MAX_SESSIONS
+        for app_name in apps:
+            policy = self.policy_for(app_name)
+            if policy.archive_after is not None and budget > 0:
+                cutoff = db_now - timedelta(seconds=max(policy.archive_after, self.min_idle))
+                done, written = self._expire(service, app_name, cutoff, policy.drop, budget, dry_run)
+                counts["dropped" if policy.drop else "archived"] += done
+                counts["archive_bytes"] += written
+                budget -= done
+            if policy.compact_after is not None and budget > 0:
+                idle_cutoff = db_now - timedelta(seconds=self.min_idle)
+                sessions, events, written = self._compact(service, app_name, idle_cutoff, policy.compact_after,
+                                                          budget, dry_run)
+                counts["compacted"] += sessions
+                counts["pruned_events"] += events
+                counts["archive_bytes"] += written
+                budget -= sessions
+        if not dry_run:
+            counts.update(self._sqlite_upkeep(service.db_engine))
+            for key, stat in (("archived", "archived_sessions"), ("dropped", "dropped_sessions"),
+                              ("compacted", "compacted_sessions"), ("pruned_events", "pruned_events"),
+                              ("archive_bytes", "archive_bytes")):
+                self.stats[stat] += counts[key]
+            self.stats["cycles"] += 1
+        counts["dry_run"] = dry_run
+        counts["seconds"] = round(time.perf_counter() - started, 3)
+        return counts
+
+    def _expire(self, service, app_name: str, cutoff: datetime, drop: bool, budget: int,
+                dry_run: bool) -> Tuple[int, int]:
+        from sqlalchemy import delete, select
+
+        from google.adk.sessions.database_session_service import StorageEvent, StorageSession
+
+        done = written = 0
+        while done < budget:
+            with service.database_session_factory() as db:
+                batch = db.execute(
+                    select(StorageSession)
+                    .where(StorageSession.app_name == app_name, StorageSession.update_time < cutoff)
+                    .order_by(StorageSession.update_time)
+                    .limit(min(RETENTION_BATCH, budget - done))
+                ).scalars().all()
+                if not batch:
+                    break
+                if dry_run:
+                    return done + len(batch), 0
+                if not drop:
+                    records = []
+                    for s in batch:
+                        events = db.execute(
+                            select(StorageEvent)
+                            .where(StorageEvent.app_name == app_name, StorageEvent.user_id == s.user_id,
+                                   StorageEvent.session_id == s.id)
+                            .order_by(StorageEvent.timestamp)
+                        ).scalars().all()
+                        records.append({
+                            "kind": "session", "app_name": app_name, "user_id": s.user_id, "session_id": s.id,
+                            "archived_at": time.time(), "state": dict(s.state or {}),
+                            "create_time": s.create_time.isoformat(), "update_time": s.update_time.isoformat(),
+                            "events": [_event_record(e) for e in events],
+                        })
+                    written += self.archive.write(app_name, records)
+                for s in batch:
+                    db.execute(delete(StorageEvent).where(
+                        StorageEvent.app_name == app_name, StorageEvent.user_id == s.user_id,
+                        StorageEvent.session_id == s.id))
+                    db.delete(s)
+                db.commit()
+                self._forget([(s.user_id, s.id) for s in batch])
+                done += len(batch)
+        return done, written
+
+    def _compact(self, service, app_name: str, idle_cutoff: datetime, compact_after: float, budget: int,
+                 dry_run: bool) -> Tuple[int, int, int]:
+        from sqlalchemy import delete, func, select
+        from sqlalchemy.orm.attributes import flag_modified
+
+        from google.adk.sessions.database_session_service import StorageEvent, StorageSession
+        from sql_agent.context import SUMMARY_UPTO_KEY
+
+        # Event timestamps are stored as local naive datetimes (datetime.fromtimestamp)
+        event_cutoff = datetime.fromtimestamp(time.time() - compact_after)
+        with service.database_session_factory() as db:
+            keys = db.execute(
+                select(StorageSession.user_id, StorageSession.id)
+                .join(StorageEvent, (StorageEvent.app_name == StorageSession.app_name)
+                      & (StorageEvent.user_id == StorageSession.user_id)
+                      & (StorageEvent.session_id == StorageSession.id))
+                .where(StorageSession.app_name == app_name, StorageSession.update_time < idle_cutoff)
+                .group_by(StorageSession.user_id, StorageSession.id)
+                .having(func.min(StorageEvent.timestamp) < event_cutoff)
+                .limit(budget)
+            ).all()
+
+        sessions = pruned = written = 0
+        for user_id, session_id in keys:
+            with service.database_session_factory() as db:
+                s = db.get(StorageSession, (app_name, user_id, session_id))
+                if s is None:
+                    continue
+                state = dict(s.state or {})
+                upto = int(state.get(SUMMARY_UPTO_KEY) or 0)
+                if upto <= 0:
+                    continue
+                events = db.execute(
+                    select(StorageEvent)
+                    .where(StorageEvent.app_name == app_name, StorageEvent.user_id == user_id,
+                           StorageEvent.session_id == session_id)
+                    .order_by(StorageEvent.timestamp)
+                ).scalars().all()
+                starts = turn_boundaries(events)
+                # Drop whole summarised turns whose last event is old enough; always keep the latest turn
+                turns = 0
+                while turns < min(upto, len(starts) - 1) and events[starts[turns + 1] - 1].timestamp < event_cutoff:
+                    turns += 1
+                if turns == 0:
+                    continue
+                doomed = events[:starts[turns]]
+                sessions += 1
+                pruned += len(doomed)
+                if dry_run:
+                    continue
+                written += self.archive.write(app_name, [{
+                    "kind": "events", "app_name": app_name, "user_id": user_id, "session_id": session_id,
+                    "archived_at": time.time(), "turns": turns, "events": [_event_record(e) for e in doomed],
+                }])
+                db.execute(delete(StorageEvent).where(
+                    StorageEvent.app_name == app_name, StorageEvent.user_id == user_id,
+                    StorageEvent.session_id == session_id, StorageEvent.id.in_([e.id for e in doomed])))
+                state[SUMMARY_UPTO_KEY] = upto - turns
+                s.state = state
+                # An explicit update_time suppresses onupdate=now(), so open Session objects stay valid
+                flag_modified(s, "update_time")
+                db.commit()
+            self._forget([(user_id, session_id)])
+        return sessions, pruned, written
+
+    def _forget(self, keys: List[Tuple[str, str]]) -> None:
+        history = sys.modules.get("server.history")
+        if history is None:
+            return
+        for user_id, session_id in keys:
+            history.history_index.invalidate(user_id, session_id)
+
+    # --- storage upkeep --------------------------------------------------
+
+    def _sqlite_upkeep(self, engine) -> Dict[str, Any]:
+        from sqlalchemy.exc import OperationalError
+
+        result: Dict[str, Any] = {"vacuumed_pages": 0, "analyzed": False}
+        analyze = RETENTION_ANALYZE_EVERY > 0 and self.stats["cycles"] % RETENTION_ANALYZE_EVERY == 0
+        if engine.dialect.name != "sqlite":
+            if analyze and engine.dialect.name == "mysql":
+                with engine.connect() as conn:
+                    conn.exec_driver_sql("ANALYZE TABLE sessions, events")
+                self.stats["analyze_runs"] += 1
+                result["analyzed"] = True
+            return result
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+                free_before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+                vacuum = conn.exec_driver_sql(f"PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})")
+                if vacuum.returns_rows:
+                    vacuum.fetchall()  # the pragma frees pages as its rows are stepped
+                result["vacuumed_pages"] = free_before - conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            elif not self._vacuum_hint_logged:
+                # Switching needs a full VACUUM, which would block live writers; see --vacuum
+                logger.info("session db: auto_vacuum is off, freed pages are reused but not returned; "
+                            "run `python -m server.retention --vacuum` in a quiet period to switch it on")
+                self._vacuum_hint_logged = True
+            try:
+                conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            except OperationalError as exc:
+                # A reader or a not-yet-reset statement holds the WAL; the next cycle retries
+                logger.debug("session db: wal checkpoint skipped: %s", exc.orig)
+            if analyze:
+                conn.exec_driver_sql("ANALYZE")
+                self.stats["analyze_runs"] += 1
+                result["analyzed"] = True
+        self.stats["vacuumed_pages"] += result["vacuumed_pages"]
+        return result
+
+    def enable_incremental_vacuum(self) -> Dict[str, Any]:
+        """Switch a SQLite session db to ``auto_vacuum=INCREMENTAL`` with one full VACUUM (blocks writers)."""
+        engine = get_session_service().db_engine
+        if engine.dialect.name != "sqlite":
+            return {"changed": False, "reason": f"not sqlite ({engine.dialect.name})"}
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+                return {"changed": False, "reason": "already incremental"}
+            started = time.perf_counter()
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+            changed = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+        return {"changed": changed, "seconds": round(time.perf_counter() - started, 2)}
+
+    # --- measurements ----------------------------------------------------
+
+    def measure_storage(self) -> Dict[str, Any]:
+        from sqlalchemy import func, select
+
+        from google.adk.sessions.database_session_service import StorageEvent, StorageSession
+
+        service = get_session_service()
+        sample: Dict[str, Any] = {}
+        engine = service.db_engine
+        if engine.dialect.name == "sqlite" and engine.url.database:
+            path = Path(engine.url.database)
+            wal = Path(f"{path}-wal")
+            sample["db_bytes"] = path.stat().st_size if path.exists() else 0
+            sample["wal_bytes"] = wal.stat().st_size if wal.exists() else 0
+            with engine.connect() as conn:
+                sample["page_size"] = conn.exec_driver_sql("PRAGMA page_size").scalar()
+                sample["page_count"] = conn.exec_driver_sql("PRAGMA page_count").scalar()
+                sample["freelist_pages"] = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        with service.database_session_factory() as db:
+            sessions = dict(db.execute(select(StorageSession.app_name, func.count())
+                                       .group_by(StorageSession.app_name)).all())
+            events = dict(db.execute(select(StorageEvent.app_name, func.count())
+                                     .group_by(StorageEvent.app_name)).all())
+        sample["sessions"] = sum(sessions.values())
+        sample["events"] = sum(events.values())
+        sample["by_app"] = {app: {"sessions": sessions.get(app, 0), "events": events.get(app, 0)}
+                            for app in sorted(set(sessions) | set(events))}
+        return sample
+
+    async def probe_get_session(self, limit: int = RETENTION_PROBE_SESSIONS) -> Dict[str, Any]:
+        """Time ``get_session`` on the most recently updated chat sessions."""
+        from sqlalchemy import select
+
+        from google.adk.sessions.database_session_service import StorageSession
+
+        service = get_session_service()
+
+        def recent() -> List[Tuple[str, str]]:
+            with service.database_session_factory() as db:
+                return db.execute(
+                    select(StorageSession.user_id, StorageSession.id)
+                    .where(StorageSession.app_name == APP_NAME)
+                    .order_by(StorageSession.update_time.desc()).limit(limit)
+                ).all()
+
+        timings, events = [], []
+        for user_id, session_id in await asyncio.to_thread(recent):
+            started = time.perf_counter()
+            session = await service.get_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+            timings.append((time.perf_counter() - started) * 1000)
+            events.append(len(session.events) if session else 0)
+        if not timings:
+            return {"probed": 0}
+        return {"probed": len(timings), "p50_ms": round(statistics.median(timings), 2),
+                "max_ms": round(max(timings), 2), "avg_events": round(sum(events) / len(events), 1)}
+
+    # --- cycle -----------------------------------------------------------
+
+    async def run_cycle(self, dry_run: bool = False) -> Optional[Dict[str, Any]]:
+        """Retention pass plus measurements; the sample is kept and appended to the report file."""
+        counts = await asyncio.to_thread(self.maintain, dry_run)
+        if counts is None:
+            return None
+        sample = {"ts": round(time.time(), 3), "pid": os.getpid(), **counts}
+        sample.update(await asyncio.to_thread(self.measure_storage))
+        sample["get_session"] = await self.probe_get_session()
+        if not dry_run:
+            self.samples.append(sample)
+            _append_report(sample)
+        return sample
+
+    def snapshot(self, samples: int = 24) -> Dict[str, Any]:
+        return {
+            "enabled": RETENTION_ENABLED,
+            "interval_seconds": RETENTION_INTERVAL,
+            "database": DATABASE_URL.split("://", 1)[0],
+            "archive_dir": str(self.archive.root),
+            "min_idle_hours": _hours(self.min_idle),
+            "policies": {app: p.describe() for app, p in self.policies.items()},
+            **self.stats,
+            "samples": list(self.samples)[-samples:] if samples > 0 else [],
+        }
+
+    # --- restore ---------------------------------------------------------
+
+    def restore(self, app_name: str, user_id: str, session_id: str) -> Dict[str, Any]:
+        """Re-create an archived session, including events pruned by earlier compactions."""
+        from google.adk.events import Event
+        from google.adk.sessions.database_session_service import StorageEvent, StorageSession
+        from sql_agent.context import SUMMARY_UPTO_KEY
+
+        latest, pruned, since = None, [], []
+        for record in self.archive.records(app_name):
+            if record["user_id"] != user_id or record["session_id"] != session_id:
+                continue
+            if record["kind"] == "events":
+                since.append(record)
+            else:
+                # A session archived again after a restore already holds the events pruned before that
+                latest, pruned, since = record, since, []
+        if latest is None:
+            raise LookupError(f"no archived session {app_name}/{user_id}/{session_id}")
+        service = get_session_service()
+        state = dict(latest["state"])
+        restored_turns = sum(r["turns"] for r in pruned)
+        if restored_turns and SUMMARY_UPTO_KEY in state:
+            state[SUMMARY_UPTO_KEY] = int(state[SUMMARY_UPTO_KEY]) + restored_turns
+        payloads = [e for r in pruned for e in r["events"]] + latest["events"]
+        with service.database_session_factory() as db:
+            if db.get(StorageSession, (app_name, user_id, session_id)) is not None:
+                raise FileExistsError(f"session {app_name}/{user_id}/{session_id} already exists")
+            storage = StorageSession(app_name=app_name, id=session_id, user_id=user_id, state=state,
+                                     create_time=datetime.fromisoformat(latest["create_time"]),
+                                     update_time=datetime.fromisoformat(latest["update_time"]))
+            db.add(storage)
+            db.flush()
+            session = storage.to_session()
+            for payload in payloads:
+                db.add(StorageEvent.from_event(session, Event.model_validate(payload)))
+            db.commit()
+        self._forget([(user_id, session_id)])
+        return {"app_name": app_name, "user_id": user_id, "session_id": session_id,
+                "events": len(payloads), "restored_turns": restored_turns}
+
+
+def _append_report(sample: Dict[str, Any]) -> None:
+    try:
+        path = Path(RETENTION_REPORT_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(sample, default=str) + "\n")
+    except OSError as exc:
+        logger.warning("could not append retention report: %s", exc)
+
+
+maintenance = SessionMaintenance()
+
+
+async def maintain_forever(interval: float = RETENTION_INTERVAL) -> None:
+    """Background task started by the app."""
+    await asyncio.sleep(RETENTION_STARTUP_DELAY)
+    while True:
+        try:
+            sample = await maintenance.run_cycle()
+            if sample:
+                logger.info("session retention: archived=%d dropped=%d compacted=%d pruned_events=%d "
+                            "db_bytes=%s get_session_p50_ms=%s", sample["archived"], sample["dropped"],
+                            sample["compacted"], sample["pruned_events"], sample.get("db_bytes"),
+                            sample["get_session"].get("p50_ms"))
+        except Exception as exc:
+            maintenance.stats["errors"] += 1
+            maintenance.stats["last_error"] = str(exc)
+            logger.warning("session retention cycle failed: %s", exc)
+        await asyncio.sleep(interval)
+
+
+def snapshot(samples: int = 24) -> Dict[str, Any]:
+    return maintenance.snapshot(samples)
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--once", action="store_true", help="run one retention cycle now")
+    parser.add_argument("--dry-run", action="store_true", help="with --once: count what would change, change nothing")
+    parser.add_argument("--report", type=int, metavar="N", help="print the last N samples from the report file")
+    parser.add_argument("--restore", nargs=3, metavar=("APP", "USER", "SESSION"), help="restore an archived session")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="switch the SQLite session db to incremental vacuum with one full VACUUM "
+                             "(blocks writers while it runs; use in a quiet period)")
+    args = parser.parse_args()
+
+    if args.vacuum:
+        print(json.dumps(maintenance.enable_incremental_vacuum(), indent=2))
+    elif args.restore:
+        print(json.dumps(maintenance.restore(*args.restore), indent=2))
+    elif args.once:
+        sample = asyncio.run(maintenance.run_cycle(dry_run=args.dry_run))
+        print(json.dumps(sample, indent=2, default=str) if sample else "another worker holds the retention lock")
+    elif args.report:
+        path = Path(RETENTION_REPORT_PATH)
+        lines = path.read_text(encoding="utf-8").splitlines()[-args.report:] if path.exists() else []
+        print(f"{'time':19s} {'db MB':>8s} {'free pg':>8s} {'sessions':>9s} {'events':>9s} "
+              f"{'archived':>9s} {'pruned':>7s} {'get p50':>8s}")
+        for line in lines:
+            s = json.loads(line)
+            print(f"{datetime.fromtimestamp(s['ts']):%Y-%m-%d %H:%M:%S} {s.get('db_bytes', 0) / 1e6:8.2f} "
+                  f"{s.get('freelist_pages', 0):8d} {s['sessions']:9d} {s['events']:9d} "
+                  f"{s['archived'] + s['dropped']:9d} {s['pruned_events']:7d} "
+                  f"{s['get_session'].get('p50_ms', 0):8.2f}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
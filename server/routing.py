@@ -0,0 +1,330 @@
+# server/routing.py
+"""Complexity-based model routing for the root agent and its sub-agents.
+
+Every ``/chat`` question is scored from the tables it is likely to touch, the
+words that imply a join and the words that imply aggregation. The score picks
+a tier (``simple``, ``moderate`` or ``complex``), and the tier picks a model
+for each agent, or skips a sub-agent entirely:
+
+- ``before_model_callback`` swaps ``llm_request.model`` for the routed model.
+- ``before_tool_callback`` on the root agent answers a skipped AgentTool
+  call directly (the rewrite step passes the question through unchanged).
+- ``after_model_callback`` and ``after_tool_callback`` record per-agent model
+  latency and the ``evaluate_result`` verdict.
+
+Each finished request appends one JSON line to ``ROUTING_LOG_PATH``;
+``benchmarks/routing_policy.py`` replays that log (or a built-in question
+set) against candidate policies with a stubbed model to tune thresholds
+offline. A tuned policy is loaded from ``ROUTING_POLICY_PATH``.
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+ROUTING_ENABLED = os.getenv("ROUTING_ENABLED", "true").lower() in ("1", "true", "yes")
+ROUTING_POLICY_PATH = os.getenv("ROUTING_POLICY_PATH", "")
+ROUTING_LOG_PATH = os.getenv("ROUTING_LOG_PATH", "./.cache/routing_log.jsonl")
+FAST_MODEL = os.getenv("ROUTING_FAST_MODEL", "gemini-2.5-flash")
+STRONG_MODEL = os.getenv("ROUTING_STRONG_MODEL", "gemini-2.5-pro")
+
+ROOT_AGENT = "sql_query_agent"
+REWRITE_AGENT = "rewrite_prompt_agent"
+EVALUATE_AGENT = "evaluate_result"
+SKIP = "skip"
+
+logger = logging.getLogger("chat-api")
+
+# Word stems (regex fragments, matched from a word boundary) per table.
+TABLE_KEYWORDS: Dict[str, tuple] = {
+    "hospitals": (r"hospital names?\b", r"region", r"ownership", r"private\b", r"government",
+                  r"latitude", r"longitude", r"location", r"max(imum)? capacity"),
+    "hospital_resource_timeseries": (r"beds?\b", r"occupan", r"icu\b", r"ventilator", r"oxygen", r"staff",
+                                     r"doctor", r"nurse", r"ambulance", r"admission", r"critical",
+                                     r"emergency", r"ed\b", r"turnaround", r"tat\b", r"diagnostic",
+                                     r"kits?\b", r"tb\b", r"tablet", r"shift"),
+    "hospital_finance_monthly": (r"expenditure", r"spend", r"budget", r"revenue", r"costs?\b", r"financ",
+                                 r"capex", r"capital", r"maintenance", r"transport", r"salar",
+                                 r"profit", r"loss"),
+    "suppliers": (r"supplier", r"vendor", r"lead time", r"payment terms?"),
+    "inventory_items": (r"inventory", r"items?\b", r"reorder", r"stock levels?", r"unit cost", r"assets?\b"),
+}
+JOIN_WORDS = (r"compar", r"versus", r"vs\b", r"along with", r"together with", r"and their", r"with their",
+              r"relative to", r"against", r"correlat", r"ratio", r"per hospital", r"each hospital",
+              r"for every", r"join", r"match")
+AGGREGATION_WORDS = (r"total", r"sum\b", r"average", r"avg\b", r"mean\b", r"count", r"how many",
+                     r"number of", r"max(imum)?\b", r"min(imum)?\b", r"highest", r"lowest", r"most\b",
+                     r"least\b", r"top\b", r"bottom\b", r"rank", r"median", r"percent", r"trend", r"growth",
+                     r"group", r"over time", r"monthly", r"weekly", r"daily", r"yearly")
+
+DEFAULT_POLICY: Dict[str, Any] = {
+    "weights": {"tables": 1.0, "joins": 1.0, "aggregations": 0.5},
+    # score < simple_below -> simple; score >= complex_from -> complex
+    "simple_below": 1.5,
+    "complex_from": 3.0,
+    "tiers": {
+        "simple": {ROOT_AGENT: FAST_MODEL, REWRITE_AGENT: SKIP, EVALUATE_AGENT: FAST_MODEL},
+        "moderate": {ROOT_AGENT: FAST_MODEL, REWRITE_AGENT: FAST_MODEL, EVALUATE_AGENT: STRONG_MODEL},
+        "complex": {ROOT_AGENT: FAST_MODEL, REWRITE_AGENT: STRONG_MODEL, EVALUATE_AGENT: STRONG_MODEL},
+    },
+}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _compile(words: tuple) -> List["re.Pattern[str]"]:
+    return [re.compile(r"\b" + word) for word in words]
+
+
+_TABLE_PATTERNS = {table: _compile(words) for table, words in TABLE_KEYWORDS.items()}
+_JOIN_PATTERNS = _compile(JOIN_WORDS)
+_AGGREGATION_PATTERNS = _compile(AGGREGATION_WORDS)
+
+
+def _count(text: str, patterns: List["re.Pattern[str]"]) -> int:
+    return sum(1 for pattern in patterns if pattern.search(text))
+
+
+def score_question(question: str, policy: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Extract routing features and the weighted complexity score.
+
+    A question over several tables needs a join even without a join word, so
+    every table beyond the first counts towards the score on its own.
+
+    Returns:
+        Dict with ``tables`` (sorted names), ``join_words``, ``aggregations``
+        and ``score``
+    """
+    policy = policy or get_policy()
+    text = _WHITESPACE.sub(" ", question.casefold())
+    tables = sorted(t for t, patterns in _TABLE_PATTERNS.items() if _count(text, patterns))
+    join_words = _count(text, _JOIN_PATTERNS)
+    aggregations = _count(text, _AGGREGATION_PATTERNS)
+    weights = policy["weights"]
+    score = (weights["tables"] * max(len(tables) - 1, 0)
+             + weights["joins"] * join_words
+             + weights["aggregations"] * aggregations)
+    return {"tables": tables, "join_words": join_words, "aggregations": aggregations, "score": round(score, 3)}
+
+
+def tier_for(score: float, policy: Optional[Dict[str, Any]] = None) -> str:
+    policy = policy or get_policy()
+    if score < policy["simple_below"]:
+        return "simple"
+    if score >= policy["complex_from"]:
+        return "complex"
+    return "moderate"
+
+
+@dataclass
+class RouteDecision:
+    """Routing choice for one request plus what happened under it."""
+
+    question: str
+    features: Dict[str, Any]
+    tier: str
+    models: Dict[str, str]
+    started: float = field(default_factory=time.monotonic)
+    model_latency: Dict[str, float] = field(default_factory=dict)
+    model_calls: Dict[str, int] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+    verdict: Optional[str] = None
+    # Every evaluator verdict in order; the first is the first-pass verdict
+    verdicts: List[str] = field(default_factory=list)
+    # Verified SQL examples shown to the SQL writer (None until looked up)
+    examples: Optional[List[Dict[str, Any]]] = None
+    _pending: Dict[str, List[float]] = field(default_factory=dict, repr=False)
+
+    def model_for(self, agent_name: str) -> Optional[str]:
+        return self.models.get(agent_name)
+
+    def record(self, outcome: str) -> Dict[str, Any]:
+        return {
+            "ts": round(time.time(), 3),
+            "question_hash": hashlib.blake2b(self.question.encode(), digest_size=8).hexdigest(),
+            "question": self.question,
+            "features": self.features,
+            "tier": self.tier,
+            "models": self.models,
+            "skipped": self.skipped,
+            "model_latency": {k: round(v, 4) for k, v in self.model_latency.items()},
+            "model_calls": self.model_calls,
+            "latency": round(time.monotonic() - self.started, 4),
+            "verdict": self.verdict,
+            "verdicts": self.verdicts,
+            "examples": len(self.examples or []),
+            "outcome": outcome,
+        }
+
+
+_current: contextvars.ContextVar[Optional[RouteDecision]] = contextvars.ContextVar("route_decision", default=None)
+_policy: Optional[Dict[str, Any]] = None
+_log_lock = threading.Lock()
+
+routing_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def load_policy(path: str = ROUTING_POLICY_PATH) -> Dict[str, Any]:
+    """Merge a tuned policy file over ``DEFAULT_POLICY`` (missing keys keep defaults)."""
+    policy = json.loads(json.dumps(DEFAULT_POLICY))
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as fh:
+            tuned = json.load(fh)
+        policy["weights"].update(tuned.get("weights", {}))
+        for key in ("simple_below", "complex_from"):
+            if key in tuned:
+                policy[key] = tuned[key]
+        for tier, models in tuned.get("tiers", {}).items():
+            policy["tiers"].setdefault(tier, {}).update(models)
+    return policy
+
+
+def get_policy() -> Dict[str, Any]:
+    global _policy
+    if _policy is None:
+        _policy = load_policy()
+    return _policy
+
+
+def decide(question: str, policy: Optional[Dict[str, Any]] = None) -> RouteDecision:
+    """Score ``question`` and pick per-agent models without touching request state."""
+    policy = policy or get_policy()
+    features = score_question(question, policy)
+    tier = tier_for(features["score"], policy)
+    return RouteDecision(question=question, features=features, tier=tier, models=dict(policy["tiers"][tier]))
+
+
+def start(question: str) -> Optional[RouteDecision]:
+    """Open the routing decision for the current request."""
+    if not ROUTING_ENABLED:
+        return None
+    decision = decide(question)
+    _current.set(decision)
+    return decision
+
+
+def current() -> Optional[RouteDecision]:
+    return _current.get()
+
+
+def finish(decision: Optional[RouteDecision], outcome: str) -> None:
+    """Aggregate the request into ``routing_stats`` and append it to the routing log."""
+    if decision is None:
+        return
+    entry = decision.record(outcome)
+    stats = routing_stats.setdefault(decision.tier, {
+        "requests": 0, "latency_seconds": 0.0, "verdicts": {}, "skipped_calls": 0,
+    })
+    stats["requests"] += 1
+    stats["latency_seconds"] = round(stats["latency_seconds"] + entry["latency"], 4)
+    stats["skipped_calls"] += len(decision.skipped)
+    if decision.verdict:
+        stats["verdicts"][decision.verdict] = stats["verdicts"].get(decision.verdict, 0) + 1
+    if not ROUTING_LOG_PATH:
+        return
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(ROUTING_LOG_PATH)), exist_ok=True)
+        line = json.dumps(entry, default=str) + "\n"
+        with _log_lock, open(ROUTING_LOG_PATH, "a", encoding="utf-8") as fh:
+            fh.write(line)
+    except OSError as exc:
+        logger.warning("routing log write failed: %s", exc)
+
+
+def snapshot() -> Dict[str, Any]:
+    tiers = {}
+    for tier, stats in routing_stats.items():
+        judged = sum(stats["verdicts"].values())
+        tiers[tier] = {
+            **stats,
+            "avg_latency_seconds": round(stats["latency_seconds"] / stats["requests"], 3),
+            "correct_rate": round(stats["verdicts"].get("Correct", 0) / judged, 3) if judged else None,
+        }
+    return {"enabled": ROUTING_ENABLED, "policy": get_policy(), "tiers": tiers}
+
+
+def _question_from_request(llm_request) -> str:
+    # Outside /chat (e.g. ``adk web``) derive the decision from the latest user text
+    for content in reversed(llm_request.contents or []):
+        if content.role == "user" and content.parts:
+            text = " ".join(p.text for p in content.parts if getattr(p, "text", None))
+            if text:
+                return text
+    return ""
+
+
+def before_model_callback(callback_context, llm_request) -> None:
+    """ADK hook: send the call to the model the routing decision picked."""
+    decision = _current.get()
+    if decision is None:
+        if not ROUTING_ENABLED or callback_context.agent_name != ROOT_AGENT:
+            return None
+        decision = decide(_question_from_request(llm_request))
+        _current.set(decision)
+    agent = callback_context.agent_name
+    model = decision.model_for(agent)
+    if model and model != SKIP:
+        llm_request.model = model
+    decision._pending.setdefault(agent, []).append(time.monotonic())
+    return None
+
+
+def after_model_callback(callback_context, llm_response) -> None:
+    """ADK hook: attribute the model call's latency to its agent."""
+    decision = _current.get()
+    if decision is None:
+        return None
+    agent = callback_context.agent_name
+    pending = decision._pending.get(agent)
+    if pending:
+        decision.model_latency[agent] = decision.model_latency.get(agent, 0.0) + time.monotonic() - pending.pop()
+        decision.model_calls[agent] = decision.model_calls.get(agent, 0) + 1
+    return None
+
+
+def before_tool_callback(tool, args, tool_context) -> Optional[Dict[str, Any]]:
+    """ADK hook on the root agent: short-circuit sub-agents the decision skips."""
+    decision = _current.get()
+    if decision is None or decision.model_for(tool.name) != SKIP:
+        return None
+    decision.skipped.append(tool.name)
+    if tool.name == REWRITE_AGENT:
+        # The question is simple enough to use as its own rewrite
+        return {"result": args.get("user_input") or decision.question}
+    if tool.name == EVALUATE_AGENT:
+        return {"result": "Correct", "skipped": True}
+    return {"result": ""}
+
+
+# Negative wording is checked first: "Incorrect" and "partially correct" both contain "correct"
+_NOT_CORRECT = re.compile(r"\b(?:partial|partially|incorrect|not correct|wrong)\b")
+_CORRECT = re.compile(r"\bcorrect\b")
+
+
+def verdict_of(response: Any) -> str:
+    """Classify an ``evaluate_result`` reply as "Correct", "Partial" or "Unknown"."""
+    text = str(response).casefold()
+    if _NOT_CORRECT.search(text):
+        return "Partial"
+    return "Correct" if _CORRECT.search(text) else "Unknown"
+
+
+def add_verdict(decision: Optional[RouteDecision], verdict: str) -> None:
+    if decision is not None:
+        decision.verdict = verdict
+        decision.verdicts.append(verdict)
+
+
+def after_tool_callback(tool, args, tool_context, tool_response) -> None:
+    """ADK hook on the root agent: keep the evaluator's verdict as the correctness signal."""
+    decision = _current.get()
+    if decision is None or tool.name != EVALUATE_AGENT or tool.name in decision.skipped:
+        return None
+    add_verdict(decision, verdict_of(tool_response))
+    return None
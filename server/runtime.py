@@ -0,0 +1,146 @@
+# server/runtime.py
+"""Lazily constructed backend singletons and the readiness state.
+
+Nothing in here touches MySQL, the session database or the ADK/langchain
+stack at import time. Each dependency is built on first use, and
+``warm_up`` builds all of them in the background after the app starts.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APP_NAME = "persistent_chatbot_app"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./my_chatbot_data.db")
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger("chat-api")
+
+_lock = threading.Lock()
+_session_service = None
+_runner = None
+
+
+def get_session_service():
+    """Return the shared DatabaseSessionService, creating it on first use."""
+    global _session_service
+    if _session_service is not None:
+        return _session_service
+    with _lock:
+        if _session_service is None:
+            from google.adk.sessions import DatabaseSessionService
+
+            kwargs = {}
+            if DATABASE_URL.startswith("sqlite"):
+                # Several workers share the file: wait on locks instead of failing fast
+                kwargs["connect_args"] = {"timeout": 30}
+            service = DatabaseSessionService(db_url=DATABASE_URL, **kwargs)
+            if service.db_engine.dialect.name == "sqlite":
+                # WAL is persistent in the file, so setting it once lets readers and the writer overlap
+                with service.db_engine.connect() as conn:
+                    conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+            _session_service = service
+    return _session_service
+
+
+def get_runner():
+    """Return the shared Runner, importing the agent tree on first use."""
+    global _runner
+    if _runner is not None:
+        return _runner
+    session_service = get_session_service()
+    with _lock:
+        if _runner is None:
+            from google.adk.runners import Runner
+            from sql_agent.agent import root_agent as chatbot_agent
+
+            _runner = Runner(agent=chatbot_agent, app_name=APP_NAME, session_service=session_service)
+    return _runner
+
+
+class Readiness:
+    """Tracks background warm-up separately from process liveness.
+
+    ``state`` moves from ``cold`` to ``warming`` and then to ``ready`` or
+    ``degraded`` (some step failed; requests still work and will retry the
+    failed dependency lazily).
+    """
+
+    def __init__(self) -> None:
+        self.state = "cold"
+        self.process_started = time.time()
+        self.warm_started: Optional[float] = None
+        self.warm_finished: Optional[float] = None
+        self.steps: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    def record(self, step: str, seconds: float, error: Optional[BaseException] = None, **info: Any) -> None:
+        entry: Dict[str, Any] = {"ok": error is None, "seconds": round(seconds, 4)}
+        if error is not None:
+            entry["error"] = str(error)
+        entry.update(info)
+        self.steps[step] = entry
+
+    def snapshot(self) -> Dict[str, Any]:
+        warm_seconds = None
+        if self.warm_started and self.warm_finished:
+            warm_seconds = round(self.warm_finished - self.warm_started, 4)
+        return {
+            "state": self.state,
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - self.process_started, 3),
+            "warm_up_seconds": warm_seconds,
+            "steps": dict(self.steps),
+        }
+
+
+readiness = Readiness()
+
+
+async def _run_step(name: str, fn) -> None:
+    started = time.perf_counter()
+    try:
+        info = await asyncio.to_thread(fn)
+        readiness.record(name, time.perf_counter() - started, **(info or {}))
+    except Exception as exc:
+        logger.warning("warm-up step %s failed: %s", name, exc)
+        readiness.record(name, time.perf_counter() - started, error=exc)
+
+
+def _warm_mysql() -> Dict[str, Any]:
+    from functions import db_tools
+
+    return db_tools.warm_up()
+
+
+def _warm_session_store() -> None:
+    get_session_service()
+
+
+def _warm_agents() -> None:
+    get_runner()
+
+
+async def warm_up() -> Dict[str, Any]:
+    """Pre-connect the MySQL pool, prefetch the schema and build the agents."""
+    readiness.state = "warming"
+    readiness.warm_started = time.time()
+    # Session store and MySQL are independent; the agent tree needs the session store.
+    await asyncio.gather(
+        _run_step("session_store", _warm_session_store),
+        _run_step("mysql", _warm_mysql),
+    )
+    await _run_step("agents", _warm_agents)
+    readiness.warm_finished = time.time()
+    readiness.state = "ready" if all(s["ok"] for s in readiness.steps.values()) else "degraded"
+    logger.info("warm-up finished: %s", readiness.state)
+    return readiness.snapshot()
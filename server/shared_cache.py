@@ -0,0 +1,186 @@
+# server/shared_cache.py
+"""Cross-process cache on a local SQLite file.
+
+With several workers every in-process cache would be duplicated and
+invalidated independently. ``SharedCache`` keeps entries in one WAL-mode
+SQLite file that all workers on the host open, so a value computed by one
+worker is reused by the others, and no external service is needed.
+
+Invalidation is by namespace generation: ``invalidate(ns)`` bumps a counter
+in the same transaction-safe table, and lookups join on the current
+generation, so once ``invalidate`` returns no worker can read an older entry.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "./.cache/shared_cache.db")
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "5000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_generations (
+    namespace TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    generation INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed_at);
+"""
+
+_MISSING = object()
+
+
+class SharedCache:
+    """SQLite-backed key/value cache shared by every process on the host."""
+
+    def __init__(self, path: str = SHARED_CACHE_PATH, max_entries: int = SHARED_CACHE_MAX_ENTRIES) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self.stats = {"hits": 0, "misses": 0, "sets": 0, "invalidations": 0}
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread and per process; connections must not cross a fork.
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT e.value, e.expires_at FROM cache_entries e "
+            "JOIN cache_generations g ON g.namespace = e.namespace AND g.generation = e.generation "
+            "WHERE e.namespace = ? AND e.key = ?",
+            (namespace, key),
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < now):
+            self.stats["misses"] += 1
+            return default
+        self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def expires_at(self, namespace: str, key: str) -> Optional[float]:
+        """Wall-clock expiry of the current entry (None: no entry, or it never expires)."""
+        row = self._conn().execute(
+            "SELECT e.expires_at FROM cache_entries e "
+            "JOIN cache_generations g ON g.namespace = e.namespace AND g.generation = e.generation "
+            "WHERE e.namespace = ? AND e.key = ?",
+            (namespace, key),
+        ).fetchone()
+        return row[0] if row else None
+
+    def generation(self, namespace: str) -> int:
+        row = self._conn().execute(
+            "SELECT generation FROM cache_generations WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None,
+            generation: Optional[int] = None) -> None:
+        """Store ``value``.
+
+        Args:
+            namespace: Invalidation group
+            key: Key within the namespace
+            value: JSON-serialisable value
+            ttl: Seconds until expiry (None keeps it until evicted or invalidated)
+            generation: Generation read before computing ``value``; if the
+                namespace was invalidated in between, the write stays invisible
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR IGNORE INTO cache_generations (namespace, generation) VALUES (?, 0)", (namespace,)
+        )
+        if generation is None:
+            generation = self.generation(namespace)
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, generation, value, expires_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (namespace, key, generation, json.dumps(value, default=str), now + ttl if ttl else None, now),
+        )
+        self.stats["sets"] += 1
+        if self.stats["sets"] % 256 == 0:
+            self.evict()
+
+    def get_or_set(self, namespace: str, key: str, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        value = self.get(namespace, key, _MISSING)
+        if value is _MISSING:
+            generation = self.generation(namespace)
+            value = compute()
+            self.set(namespace, key, value, ttl, generation=generation)
+        return value
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def invalidate(self, namespace: str) -> None:
+        """Drop every entry of ``namespace`` for all processes at once."""
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO cache_generations (namespace, generation) VALUES (?, 1) "
+            "ON CONFLICT(namespace) DO UPDATE SET generation = generation + 1",
+            (namespace,),
+        )
+        conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND generation < "
+            "(SELECT generation FROM cache_generations WHERE namespace = ?)",
+            (namespace, namespace),
+        )
+        self.stats["invalidations"] += 1
+
+    def evict(self) -> int:
+        """Remove expired entries, then the least recently written ones above ``max_entries``."""
+        conn = self._conn()
+        removed = conn.execute(
+            "DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+        ).rowcount
+        (count,) = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()
+        if count > self.max_entries:
+            removed += conn.execute(
+                "DELETE FROM cache_entries WHERE rowid IN "
+                "(SELECT rowid FROM cache_entries ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+        return removed
+
+    def size(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"path": self.path, "entries": self.size(), "max_entries": self.max_entries, **self.stats}
+
+
+_shared_cache: Optional[SharedCache] = None
+_lock = threading.Lock()
+
+
+def get_shared_cache() -> SharedCache:
+    global _shared_cache
+    if _shared_cache is None:
+        with _lock:
+            if _shared_cache is None:
+                _shared_cache = SharedCache()
+    return _shared_cache
@@ -0,0 +1,313 @@
+# server/sql_examples.py
+"""Local store of verified question → SQL examples, retrieved by similarity.
+
+When ``evaluate_result`` judges a query "Correct", the question and its SQL
+are appended to ``SQL_EXAMPLES_PATH``, a JSONL file that workers share. The
+curated ``SQL_EXAMPLES_SEED`` examples cover the patterns that most often
+fail on the first pass: the latest-snapshot join, oxygen days of supply and
+finance period filters. Before SQL is written, the ``SQL_EXAMPLES_TOP_K``
+most similar examples are added to the prompt.
+
+Similarity is cosine over TF-IDF weighted character 3–5-grams of the
+question, taken inside word boundaries, so "ICU beds" still matches "icu bed
+occupancy". There is no network call or model. The index is rebuilt lazily
+after the file changes, which costs a few ms for hundreds of examples, and a
+lookup scans only the posting lists of the question's n-grams.
+
+``example_stats`` splits judged requests by whether examples were shown. It
+reports the first-pass "Partial" rate and the model calls per question for
+each side.
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from . import routing
+from .query_log import fingerprint, fingerprint_id
+
+SQL_EXAMPLES_ENABLED = os.getenv("SQL_EXAMPLES_ENABLED", "true").lower() in ("1", "true", "yes")
+SQL_EXAMPLES_PATH = os.getenv("SQL_EXAMPLES_PATH", "./.cache/sql_examples.jsonl")
+SQL_EXAMPLES_SEED = os.getenv(
+    "SQL_EXAMPLES_SEED", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data",
+                                      "sql_examples.json")
+)
+SQL_EXAMPLES_TOP_K = int(os.getenv("SQL_EXAMPLES_TOP_K", "3"))
+SQL_EXAMPLES_MIN_SCORE = float(os.getenv("SQL_EXAMPLES_MIN_SCORE", "0.4"))
+SQL_EXAMPLES_MAX = int(os.getenv("SQL_EXAMPLES_MAX", "500"))
+
+logger = logging.getLogger("chat-api")
+
+EXAMPLES_HEADER = ("Verified SQL for similar questions. Reuse their joins and filters where they fit; "
+                   "do not copy values the question does not mention:")
+
+_WORDS = re.compile(r"[a-z0-9_]+")
+_DIGITS = re.compile(r"\d+")
+# Question scaffolding; left in, it makes every "what is the ..." question look alike
+_STOPWORDS = frozenset(
+    "a all an and are at by can could do does each every for from give has have how i in is it list me my of on "
+    "or please show tell than that the their there these this to us was we what which who with would you".split()
+)
+
+
+def normalize(question: str) -> str:
+    # Numbers are placeholders ("under 3 days" ~ "under 2 days")
+    return " ".join(w for w in _WORDS.findall(_DIGITS.sub("0", question.casefold())) if w not in _STOPWORDS)
+
+
+def example_key(question: str, sql: str) -> Tuple[str, str]:
+    """Same question wording and same SQL shape (literals aside) count as one example."""
+    return normalize(question), fingerprint_id(fingerprint(sql))
+
+
+def ngrams(question: str, sizes: Tuple[int, ...] = (3, 4, 5)) -> Counter:
+    grams: Counter = Counter()
+    for word in normalize(question).split():
+        padded = f" {word} "
+        for n in sizes:
+            for i in range(max(1, len(padded) - n + 1)):
+                grams[padded[i:i + n]] += 1
+    return grams
+
+
+class ExampleIndex:
+    """TF-IDF over character n-grams with an inverted index."""
+
+    def __init__(self, seed_path: str = SQL_EXAMPLES_SEED, path: str = SQL_EXAMPLES_PATH,
+                 max_examples: int = SQL_EXAMPLES_MAX) -> None:
+        self.seed_path = seed_path
+        self.path = path
+        self.max_examples = max_examples
+        self.examples: List[Dict[str, Any]] = []
+        self._idf: Dict[str, float] = {}
+        self._postings: Dict[str, List[Tuple[int, float]]] = {}
+        self._keys: set = set()
+        self._file_size = -1
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"lookups": 0, "hits": 0, "added": 0, "duplicates": 0, "rebuilds": 0,
+                                      "last_rebuild_ms": 0.0, "last_lookup_ms": 0.0}
+
+    def _load(self) -> List[Dict[str, Any]]:
+        # Keyed by question: a later verified query for the same question replaces the earlier one
+        loaded: Dict[str, Dict[str, Any]] = {}
+        if self.seed_path and os.path.exists(self.seed_path):
+            with open(self.seed_path, encoding="utf-8") as fh:
+                for spec in json.load(fh):
+                    example = {"question": spec["question"], "sql": spec["sql"], "source": "seed", "ts": 0}
+                    loaded[normalize(example["question"])] = example
+        if self.path and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        example = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a torn last line from a concurrent writer
+                    loaded[normalize(example["question"])] = example
+        # Newest verified examples win when the store is over its cap; seeds are kept
+        examples = sorted(loaded.values(), key=lambda e: (e["source"] != "seed", -e.get("ts", 0)))
+        return examples[:self.max_examples]
+
+    def _refresh(self) -> None:
+        size = os.path.getsize(self.path) if self.path and os.path.exists(self.path) else 0
+        if size == self._file_size:
+            return
+        started = time.perf_counter()
+        examples = self._load()
+        grams = [ngrams(e["question"]) for e in examples]
+        df: Counter = Counter()
+        for doc in grams:
+            df.update(doc.keys())
+        idf = {g: math.log((1 + len(grams)) / (1 + n)) + 1 for g, n in df.items()}
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for i, doc in enumerate(grams):
+            weights = {g: (1 + math.log(c)) * idf[g] for g, c in doc.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for g, w in weights.items():
+                postings.setdefault(g, []).append((i, w / norm))
+        self.examples, self._idf, self._postings, self._file_size = examples, idf, postings, size
+        self._keys = {example_key(e["question"], e["sql"]) for e in examples}
+        self.stats["rebuilds"] += 1
+        self.stats["last_rebuild_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def search(self, question: str, k: int = SQL_EXAMPLES_TOP_K,
+               min_score: float = SQL_EXAMPLES_MIN_SCORE) -> List[Dict[str, Any]]:
+        """Up to ``k`` examples with cosine similarity of at least ``min_score``, best first."""
+        started = time.perf_counter()
+        with self._lock:
+            self._refresh()
+            query = {g: (1 + math.log(c)) * self._idf[g] for g, c in ngrams(question).items() if g in self._idf}
+            norm = math.sqrt(sum(w * w for w in query.values())) or 1.0
+            scores: Dict[int, float] = {}
+            for g, w in query.items():
+                for i, dw in self._postings[g]:
+                    scores[i] = scores.get(i, 0.0) + w / norm * dw
+            best = sorted(((s, i) for i, s in scores.items() if s >= min_score), reverse=True)[:k]
+            found = [{**self.examples[i], "score": round(s, 3)} for s, i in best]
+        self.stats["lookups"] += 1
+        self.stats["hits"] += bool(found)
+        self.stats["last_lookup_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return found
+
+    def add(self, question: str, sql: str) -> bool:
+        """Append a verified pair; returns False when the same question and SQL shape are stored."""
+        question, sql = question.strip(), sql.strip()
+        if not question or not sql:
+            return False
+        key = example_key(question, sql)
+        with self._lock:
+            self._refresh()
+            if key in self._keys:
+                self.stats["duplicates"] += 1
+                return False
+            line = json.dumps({"question": question, "sql": sql, "source": "verified", "ts": round(time.time())},
+                              ensure_ascii=False) + "\n"
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                # One O_APPEND write per line, so workers appending at once do not interleave
+                fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                try:
+                    os.write(fd, line.encode("utf-8"))
+                finally:
+                    os.close(fd)
+            except OSError as exc:
+                logger.warning("sql example write failed: %s", exc)
+                return False
+        self.stats["added"] += 1
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        seeds = sum(1 for e in self.examples if e["source"] == "seed")
+        return {"enabled": SQL_EXAMPLES_ENABLED, "examples": len(self.examples), "seed": seeds,
+                "verified": len(self.examples) - seeds, "top_k": SQL_EXAMPLES_TOP_K,
+                "min_score": SQL_EXAMPLES_MIN_SCORE, **self.stats}
+
+
+example_index = ExampleIndex()
+
+example_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def format_examples(examples: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(f"Q: {e['question']}\nSQL: {e['sql']}" for e in examples)
+
+
+def for_question(question: str) -> List[Dict[str, Any]]:
+    if not SQL_EXAMPLES_ENABLED or not question:
+        return []
+    try:
+        return example_index.search(question)
+    except Exception as exc:  # retrieval is an optimisation; never fail the request on it
+        logger.warning("sql example lookup failed: %s", exc)
+        return []
+
+
+def record_verified(question: str, sql: str, result: Any = None) -> None:
+    """Store a pair the evaluator judged Correct, unless its result was an error or empty."""
+    if not SQL_EXAMPLES_ENABLED or not question or not sql:
+        return
+    if isinstance(result, dict):
+        if "error" in result or result.get("raw_result") in ("", "[]"):
+            return
+    elif str(result or "").strip().casefold().startswith(("error", "[]")):
+        return
+    example_index.add(question, sql)
+
+
+def examples_for(decision) -> List[Dict[str, Any]]:
+    """Examples for the request's question, looked up once per request and kept on its routing decision."""
+    if decision is None:
+        return []
+    if decision.examples is None:
+        decision.examples = for_question(decision.question)
+    return decision.examples
+
+
+def before_model_callback(callback_context, llm_request) -> None:
+    """ADK hook on the root agent: add the closest verified examples after the static prefix."""
+    examples = examples_for(routing.current())
+    if examples:
+        llm_request.append_instructions([f"{EXAMPLES_HEADER}\n\n{format_examples(examples)}"])
+    return None
+
+
+def after_tool_callback(tool, args, tool_context, tool_response) -> None:
+    """ADK hook on the root agent: keep the query the evaluator judged Correct as an example."""
+    if tool.name != routing.EVALUATE_AGENT or routing.verdict_of(tool_response) != "Correct":
+        return None
+    decision = routing.current()
+    if decision is not None and tool.name in decision.skipped:
+        return None
+    question = args.get("user_input") or (decision.question if decision else "")
+    record_verified(question, args.get("sql_query", ""), args.get("result"))
+    return None
+
+
+def _tally(stats: Dict[str, Dict[str, Any]], side: str, verdicts: List[str], model_calls: int) -> None:
+    entry = stats.setdefault(side, {"requests": 0, "first_pass_partial": 0, "partial_verdicts": 0, "model_calls": 0})
+    entry["requests"] += 1
+    entry["first_pass_partial"] += verdicts[0] == "Partial"
+    entry["partial_verdicts"] += verdicts.count("Partial")
+    entry["model_calls"] += model_calls
+
+
+def _rates(stats: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    return {side: {**entry,
+                   "first_pass_partial_rate": round(entry["first_pass_partial"] / entry["requests"], 3),
+                   "avg_model_calls": round(entry["model_calls"] / entry["requests"], 2)}
+            for side, entry in stats.items()}
+
+
+def finish(decision) -> None:
+    """Aggregate one judged request into ``example_stats`` (by whether examples were shown)."""
+    if decision is None or not decision.verdicts:
+        return
+    side = "with_examples" if decision.examples else "without_examples"
+    _tally(example_stats, side, decision.verdicts, sum(decision.model_calls.values()))
+
+
+def snapshot() -> Dict[str, Any]:
+    return {"index": example_index.snapshot(), "outcomes": _rates(example_stats)}
+
+
+def report(log_path: str) -> Dict[str, Dict[str, Any]]:
+    """The same split over the routing log; entries written before examples existed count as ``before``."""
+    stats: Dict[str, Dict[str, Any]] = {}
+    with open(log_path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            verdicts = entry.get("verdicts") or ([entry["verdict"]] if entry.get("verdict") else [])
+            if not verdicts or entry.get("outcome") != "completed":
+                continue
+            side = ("before" if "examples" not in entry else
+                    "with_examples" if entry["examples"] else "without_examples")
+            _tally(stats, side, verdicts, sum((entry.get("model_calls") or {}).values()))
+    return _rates(stats)
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--search", help="show the examples retrieved for this question")
+    parser.add_argument("--log", default=routing.ROUTING_LOG_PATH, help="routing log to report outcomes from")
+    args = parser.parse_args()
+
+    if args.search:
+        for example in example_index.search(args.search):
+            print(f"{example['score']:.3f}  [{example['source']}] {example['question']}\n       {example['sql']}")
+        return
+    if not os.path.exists(args.log):
+        parser.exit(1, f"no routing log at {args.log}\n")
+    print(json.dumps(report(args.log), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# server/trace.py
+"""Per-request step traces and their critical path.
+
+A ``Trace`` collects spans (name, start, end, the spans it waited on, and
+whether it ran speculatively or was discarded). The critical path is found by
+walking back from the final span, always to the dependency that finished
+last: those are the steps whose latency the user actually waited for.
+Everything else overlapped with them.
+
+A step listener set with ``listen`` is told when each span starts and ends in
+the current context; the WebSocket endpoint uses it to stream stage progress.
+"""
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence
+
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "200"))
+
+# Called as listener(step, phase) with phase "start", "end" or "error"; must not block
+_listener: ContextVar[Optional[Callable[[str, str], None]]] = ContextVar("trace_listener", default=None)
+
+
+def listen(fn: Optional[Callable[[str, str], None]]) -> Token:
+    """Send step starts and ends in this context (and tasks started from it) to ``fn``."""
+    return _listener.set(fn)
+
+
+def unlisten(token: Token) -> None:
+    _listener.reset(token)
+
+
+def notify(step: str, phase: str) -> None:
+    fn = _listener.get()
+    if fn is not None:
+        fn(step, phase)
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "depends_on", "speculative", "discarded", "error")
+
+    def __init__(self, name: str, start: float, depends_on: Sequence[str], speculative: bool) -> None:
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.depends_on = list(depends_on)
+        self.speculative = speculative
+        self.discarded = False
+        self.error: Optional[str] = None
+
+
+class Trace:
+    def __init__(self, request_id: str, session_id: str = "") -> None:
+        self.request_id = request_id
+        self.session_id = session_id
+        self.origin = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.spans: "OrderedDict[str, Span]" = OrderedDict()
+
+    @contextmanager
+    def span(self, name: str, depends_on: Sequence[str] = (), speculative: bool = False) -> Iterator[Span]:
+        span = Span(name, time.perf_counter() - self.origin, depends_on, speculative)
+        self.spans[name] = span
+        notify(name, "start")
+        try:
+            yield span
+        except BaseException as exc:
+            span.error = type(exc).__name__
+            raise
+        finally:
+            span.end = time.perf_counter() - self.origin
+            notify(name, "error" if span.error else "end")
+
+    def discard(self, name: str) -> None:
+        if name in self.spans:
+            self.spans[name].discarded = True
+
+    def finish(self) -> None:
+        self.finished = time.perf_counter() - self.origin
+
+    def critical_path(self, final: Optional[str] = None) -> List[str]:
+        done = {n: s for n, s in self.spans.items() if s.end is not None}
+        if not done:
+            return []
+        name = final if final in done else max(done, key=lambda n: done[n].end)
+        path = [name]
+        while True:
+            deps = [d for d in done[name].depends_on if d in done]
+            if not deps:
+                break
+            name = max(deps, key=lambda d: done[d].end)
+            path.append(name)
+        return path[::-1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        path = self.critical_path()
+        wall = self.finished if self.finished is not None else max(
+            (s.end for s in self.spans.values() if s.end is not None), default=0.0)
+        busy = sum(s.end - s.start for s in self.spans.values() if s.end is not None)
+        return {
+            "request_id": self.request_id,
+            "session_id": self.session_id,
+            "wall_ms": round(wall * 1000, 1),
+            "sequential_ms": round(busy * 1000, 1),
+            "critical_path": path,
+            "critical_path_ms": round(sum(self.spans[n].end - self.spans[n].start for n in path) * 1000, 1),
+            "spans": [
+                {
+                    "name": s.name,
+                    "start_ms": round(s.start * 1000, 1),
+                    "end_ms": round(s.end * 1000, 1) if s.end is not None else None,
+                    "depends_on": s.depends_on,
+                    "speculative": s.speculative,
+                    "discarded": s.discarded,
+                    "error": s.error,
+                    "critical": s.name in path,
+                }
+                for s in self.spans.values()
+            ],
+        }
+
+
+def render_text(trace: Dict[str, Any], width: int = 60) -> str:
+    """ASCII timeline of ``Trace.to_dict()`` output; critical-path spans are drawn with ``#``."""
+    total = max(trace["wall_ms"], 1.0)
+    lines = [
+        f"request {trace['request_id']}  wall {trace['wall_ms']:.0f} ms  "
+        f"(sequential {trace['sequential_ms']:.0f} ms, critical path {trace['critical_path_ms']:.0f} ms)"
+    ]
+    label = max((len(s["name"]) for s in trace["spans"]), default=4)
+    for s in trace["spans"]:
+        end = s["end_ms"] if s["end_ms"] is not None else total
+        lo = int(s["start_ms"] / total * width)
+        hi = max(lo + 1, int(end / total * width))
+        bar = " " * lo + ("#" if s["critical"] else "=") * (hi - lo)
+        flags = " ".join(f for f, on in (("speculative", s["speculative"]), ("discarded", s["discarded"]),
+                                         (s["error"] or "", bool(s["error"]))) if on)
+        lines.append(f"{s['name']:<{label}} |{bar:<{width}}| {end - s['start_ms']:7.0f} ms {flags}".rstrip())
+    lines.append("critical path: " + " -> ".join(trace["critical_path"]))
+    return "\n".join(lines)
+
+
+_traces: Deque[Dict[str, Any]] = deque(maxlen=TRACE_HISTORY)
+
+
+def record(trace: Trace) -> Dict[str, Any]:
+    data = trace.to_dict()
+    _traces.append(data)
+    return data
+
+
+def recent(session_id: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    found = [t for t in reversed(_traces) if session_id is None or t["session_id"] == session_id]
+    return found[:limit]
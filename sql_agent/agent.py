@@ -1,10 +1,23 @@
+import os
+
 from google.adk.agents import Agent
 from google.adk.tools.agent_tool import AgentTool
 
 from functions.db_tools import get_schema_tool
-from functions.db_tools  import run_sql_query_tool
+from functions.db_tools  import run_sql_query_tool, get_result_rows_tool
+from functions.preference_tools import get_user_priorities_tool, update_user_priority_tool
+from functions.preference_tools import before_model_callback as load_preferences
+from functions.resource_tools import get_active_alerts_tool, get_capacity_forecast_tool
 from subagents.evaluate_result import evaluate_result_agent
 from subagents.rewrite_prompt import rewrite_prompt_agent
+from server import prompt_cache, routing, sql_examples
+from server.deadline import before_model_callback as apply_deadline
+from .context import before_model_callback as bound_context
+from .pipeline import pipeline_agent
+
+# "react": the model decides the order of tool calls (default);
+# "pipeline": fixed step graph with concurrent and speculative steps (pipeline.py)
+AGENT_MODE = os.getenv("AGENT_MODE", "react").lower()
 
 
 instruction_prompt = """
@@ -15,7 +28,7 @@ Your secondary job is to learn the user's preferences over time to improve your
 You MUST pass the user_id from the runner to the tools get_user_priorities_tool and update_user_priority_tool.
 
 Your task is to:
-1. Load Preferences: Call get_user_priorities_tool to retrieve the user's saved preferences (e.g., 'cost: low').
+1. Load Preferences: The user's saved preferences (e.g., 'cost: low') and SQL hints compiled from them are included below under "User preferences" when there are any. Call get_user_priorities_tool only if you need to re-check them.
 2. Understand the user's input.
 3. Check for Feedback: Check the 'state' for a 'last_sql_result_json'. If it exists, compare it to the user's new input.
 4. If the user is giving feedback** (e.g., "No, that's too expensive" after you showed them results), you MUST call update_user_priority_tool to save this new preference.
@@ -48,7 +61,7 @@ You have access to the following tools:
          }
        }
        ```
-    IMPORTANT: ALWAYS get full schema!
+    IMPORTANT: ALWAYS get full schema! If a "Database schema snapshot" section follows these instructions, it already is the full schema: use it and skip this call.
 
 2. `run_sql_query_tool`: Executes a SQL query and returns the result.
    - Call this after you've generated a SQL query.
@@ -60,12 +73,37 @@ You have access to the following tools:
        }
      }
      ```
+   - Small results come back as `raw_result` (the rows).
+   - Larger results come back as a `digest` instead: `row_count`, a `preview` of the first rows, a `result_id`, and per column the count, sum, mean, min/median/max, quartiles, the `top` and `bottom` rows (named by the `label_column`), a `histogram`, `outliers` and, for text columns, the `most_common` values.
+   - Take totals, averages, rankings and threshold answers from the digest; do not recompute them from rows.
+
+3. `get_user_priorities_tool`: Returns the user's saved preferences and the SQL hints compiled from them.
+   - Input: `{"user_id": "<user_id>"}`
+   - Each hint names a table and a `where` predicate or `order_by` term; apply it when the query uses that table.
+
+4. `update_user_priority_tool`: Saves one preference.
+   - Input: `{"user_id": "<user_id>", "preference": "cost: low"}`
+   - Use `"<key>: none"` to remove a preference.
+
+5. `get_result_rows_tool`: Returns raw rows of a result that came back as a digest.
+   - Input: `{"result_id": "<result_id>", "offset": 0, "limit": 50}`
+   - Use it only when the answer needs rows the digest does not show (for example, a specific hospital's value).
+
+6. `get_active_alerts_tool`: Returns the hospitals currently breaching resource thresholds, kept up to date from the latest resource snapshots.
+   - Input: `{"severity": "critical"}`, `{"hospital": "Sahyadri"}`, `{"rule": "oxygen_low"}` or `{}` for all.
+   - Rules: oxygen_low (under 2 days of oxygen), icu_full / beds_full / ed_full / ventilators_exhausted (above 90%), ed_critical_spike, ed_wait_long, doctor_shortfall.
+   - For questions about current alerts or these thresholds, use this instead of writing SQL.
+
+7. `get_capacity_forecast_tool`: Returns projected beds, ICU beds, ventilators and oxygen from each hospital's recent trend, with the hours until each runs out.
+   - Input: `{"hospital": "Sahyadri", "resource": "icu", "within_hours": 12}` for one hospital, or `{"resource": "oxygen", "within_hours": 48}` to list hospitals at risk.
+   - Use it for "will ... run out", "tonight", "tomorrow" and other forward-looking capacity questions instead of estimating from `avg_daily_admissions_7d`.
+   - Mention the `method` when it says the history was too short for a trend.
 
 ---
 
 **Agent Tools**
 
-3. `rewrite_prompt_agent`: Helps rewrite the original user input into a clearer and unambiguous natural language prompt, based on the schema.
+8. `rewrite_prompt_agent`: Helps rewrite the original user input into a clearer and unambiguous natural language prompt, based on the schema.
    - Use this after retrieving the schema.
    - Call with the following input:
     ```json
@@ -80,7 +118,7 @@ You have access to the following tools:
     }
    - Store the result as `rewritten_query`.
 
-4. `evaluate_result_agent`: Evaluates whether the result of the SQL query correctly answers the original user intent.
+9. `evaluate_result_agent`: Evaluates whether the result of the SQL query correctly answers the original user intent.
    - Use this after executing the query.
    - Input format:
      ```json
@@ -96,6 +134,7 @@ You have access to the following tools:
     }
     }
      ```
+   - When `run_sql_query_tool` returned a digest, pass the digest (as JSON text) as `result`.
    - This tool returns either `"Correct"` or `"Partial"`.
 
 ---
@@ -117,15 +156,30 @@ Return only the natural language summary in a friendly, conversational tone. The
 """
 
 
-root_agent = Agent(
+sql_query_agent = Agent(
     name="sql_query_agent",
     model="gemini-2.5-flash",
     description="From user input in natural language, generate an SQL query, run it, evaluate the response, and return the query result, and a summary",
-    instruction=instruction_prompt,
+    # Instructions plus schema snapshot form a byte-stable, cacheable prefix
+    instruction=prompt_cache.static_instruction("sql_query_agent", instruction_prompt, include_schema=True),
+    before_model_callback=[
+        apply_deadline, routing.before_model_callback, bound_context, load_preferences,
+        sql_examples.before_model_callback, prompt_cache.before_model_callback,
+    ],
+    after_model_callback=[routing.after_model_callback, prompt_cache.after_model_callback],
+    before_tool_callback=routing.before_tool_callback,
+    after_tool_callback=[routing.after_tool_callback, sql_examples.after_tool_callback],
     tools=[
         get_schema_tool,
         run_sql_query_tool,
+        get_user_priorities_tool,
+        update_user_priority_tool,
+        get_result_rows_tool,
+        get_active_alerts_tool,
+        get_capacity_forecast_tool,
         AgentTool(agent=rewrite_prompt_agent),
         AgentTool(agent=evaluate_result_agent)
     ]
-)
\ No newline at end of file
+)
+
+root_agent = pipeline_agent if AGENT_MODE == "pipeline" else sql_query_agent
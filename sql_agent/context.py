@@ -0,0 +1,245 @@
+# sql_agent/context.py
+"""Bounded conversation context for the root agent.
+
+ADK rebuilds the model prompt from every event in the session, so without
+this each turn re-sends all previous questions, answers and raw SQL results.
+``before_model_callback`` rewrites ``llm_request.contents`` into:
+
+- a running summary of old turns (kept in session state and appended to the
+  system instruction, after the static prefix),
+- the turns the summary does not cover yet, with tool outputs replaced by
+  short digests,
+- the last ``CONTEXT_KEEP_TURNS`` turns verbatim,
+
+and then trims to ``CONTEXT_TOKEN_BUDGET``. The summary itself is refreshed
+by ``schedule_summary_refresh`` in a background task after the response has
+been returned, so the request path never waits for it.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from google.genai import types
+
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "3"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+CONTEXT_TOOL_DIGEST_CHARS = int(os.getenv("CONTEXT_TOOL_DIGEST_CHARS", "240"))
+CONTEXT_SUMMARY_EVERY = int(os.getenv("CONTEXT_SUMMARY_EVERY", "2"))
+CONTEXT_SUMMARY_MAX_CHARS = int(os.getenv("CONTEXT_SUMMARY_MAX_CHARS", "2400"))
+CONTEXT_SUMMARIZER = os.getenv("CONTEXT_SUMMARIZER", "extractive")
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", "gemini-2.5-flash")
+
+SUMMARY_KEY = "context_summary"
+SUMMARY_UPTO_KEY = "context_summary_upto"
+
+logger = logging.getLogger("chat-api")
+
+context_stats = {"requests": 0, "tokens_in": 0, "tokens_out": 0, "summary_refreshes": 0}
+
+
+def _is_turn_start(content: types.Content) -> bool:
+    if content.role != "user" or not content.parts:
+        return False
+    return any(p.text for p in content.parts) and not any(p.function_response for p in content.parts)
+
+
+def split_turns(contents: Sequence[types.Content]) -> List[List[types.Content]]:
+    """Group contents into turns, each starting at a user text message."""
+    turns: List[List[types.Content]] = []
+    for content in contents:
+        if content is None:
+            continue
+        if not turns or _is_turn_start(content):
+            turns.append([])
+        turns[-1].append(content)
+    return turns
+
+
+def _part_chars(part: types.Part) -> int:
+    if part.text:
+        return len(part.text)
+    if part.function_call:
+        return len(json.dumps(part.function_call.args or {}, default=str))
+    if part.function_response:
+        return len(json.dumps(part.function_response.response or {}, default=str))
+    return 0
+
+
+def estimate_tokens(contents: Sequence[types.Content]) -> int:
+    """Cheap chars/4 token estimate; good enough for budgeting."""
+    return sum(_part_chars(p) for c in contents for p in (c.parts or [])) // 4
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+def _digest_part(part: types.Part) -> types.Part:
+    if part.function_response:
+        fr = part.function_response
+        payload = json.dumps(fr.response or {}, default=str)
+        if len(payload) <= CONTEXT_TOOL_DIGEST_CHARS:
+            return part
+        digest = {"digest": _shorten(payload, CONTEXT_TOOL_DIGEST_CHARS), "original_chars": len(payload)}
+        return part.model_copy(update={"function_response": fr.model_copy(update={"response": digest})})
+    if part.function_call and _part_chars(part) > CONTEXT_TOOL_DIGEST_CHARS:
+        fc = part.function_call
+        args = {"digest": _shorten(json.dumps(fc.args or {}, default=str), CONTEXT_TOOL_DIGEST_CHARS)}
+        return part.model_copy(update={"function_call": fc.model_copy(update={"args": args})})
+    return part
+
+
+def digest_turn(turn: Sequence[types.Content]) -> List[types.Content]:
+    return [c.model_copy(update={"parts": [_digest_part(p) for p in (c.parts or [])]}) for c in turn]
+
+
+def build_window(
+    contents: Sequence[types.Content],
+    summary: Optional[str] = None,
+    summary_upto: int = 0,
+    keep_turns: int = CONTEXT_KEEP_TURNS,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+) -> Tuple[List[types.Content], Dict[str, Any]]:
+    """Return the bounded contents for one model call plus accounting.
+
+    Args:
+        contents: Full history ADK built for this call
+        summary: Running summary covering the first ``summary_upto`` turns
+        summary_upto: Number of leading turns the summary replaces
+        keep_turns: Trailing turns to keep verbatim (the current turn always is)
+        budget: Target token estimate for the returned contents
+
+    Returns:
+        Tuple of (contents, stats dict)
+    """
+    turns = split_turns(contents)
+    summary_upto = min(summary_upto if summary else 0, max(len(turns) - 1, 0))
+    keep = max(1, min(keep_turns, len(turns) - summary_upto))
+    middle = turns[summary_upto: len(turns) - keep]
+    recent = turns[len(turns) - keep:]
+
+    window_middle = [digest_turn(t) for t in middle]
+    window_recent = list(recent)
+
+    def _flatten() -> List[types.Content]:
+        return [c for t in window_middle + window_recent for c in t]
+
+    out = _flatten()
+    # Over budget: drop the oldest digested turns first, then the oldest verbatim
+    # turns; the current turn is never dropped.
+    while estimate_tokens(out) > budget and (window_middle or len(window_recent) > 1):
+        if window_middle:
+            window_middle.pop(0)
+        else:
+            window_recent.pop(0)
+        out = _flatten()
+
+    stats = {
+        "turns": len(turns),
+        "summarized_turns": summary_upto,
+        "digested_turns": len(window_middle),
+        "verbatim_turns": len(window_recent),
+        "dropped_turns": len(middle) - len(window_middle) + len(recent) - len(window_recent),
+        "tokens_in": estimate_tokens(contents),
+        "tokens_out": estimate_tokens(out),
+    }
+    return out, stats
+
+
+def before_model_callback(callback_context, llm_request) -> None:
+    """ADK hook: bound ``llm_request.contents`` before it is sent to the model."""
+    state = callback_context.state
+    summary = state.get(SUMMARY_KEY) or None
+    contents, stats = build_window(llm_request.contents or [], summary, int(state.get(SUMMARY_UPTO_KEY) or 0))
+    llm_request.contents = contents
+    if summary and stats["summarized_turns"]:
+        llm_request.append_instructions([f"Summary of the earlier conversation:\n{summary}"])
+    context_stats["requests"] += 1
+    context_stats["tokens_in"] += stats["tokens_in"]
+    context_stats["tokens_out"] += stats["tokens_out"] + (len(summary) // 4 if summary else 0)
+    logger.debug("context window: %s", stats)
+    return None
+
+
+def _turn_text(turn: Sequence[types.Content], role: str) -> str:
+    texts = [p.text for c in turn if c.role == role for p in (c.parts or []) if p.text]
+    return texts[-1] if role == "model" and texts else " ".join(texts)
+
+
+def extractive_summary(previous: Optional[str], turns: Sequence[Sequence[types.Content]]) -> str:
+    """Deterministic summary: one Q/A line pair per turn, oldest lines dropped past the cap."""
+    lines = previous.splitlines() if previous else []
+    for turn in turns:
+        question = _turn_text(turn, "user")
+        answer = _turn_text(turn, "model")
+        if question:
+            lines.append(f"- Q: {_shorten(question, 200)}")
+        if answer:
+            lines.append(f"  A: {_shorten(answer, 300)}")
+    while lines and len("\n".join(lines)) > CONTEXT_SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+async def llm_summary(previous: Optional[str], turns: Sequence[Sequence[types.Content]]) -> str:
+    from google import genai
+
+    transcript = extractive_summary(None, turns)
+    prompt = (
+        "Update the running summary of a conversation between a hospital administrator "
+        "and a SQL assistant. Keep hospital names, metrics, filters and user preferences; "
+        f"stay under {CONTEXT_SUMMARY_MAX_CHARS} characters.\n\n"
+        f"Current summary:\n{previous or '(none)'}\n\nNew turns:\n{transcript}"
+    )
+    response = await genai.Client().aio.models.generate_content(model=CONTEXT_SUMMARY_MODEL, contents=prompt)
+    return (response.text or "")[:CONTEXT_SUMMARY_MAX_CHARS]
+
+
+async def refresh_summary(session_service, app_name: str, user_id: str, session_id: str) -> bool:
+    """Fold turns that fell out of the verbatim window into the stored summary."""
+    from google.adk.events import Event, EventActions
+
+    session = await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+    if session is None:
+        return False
+    turns = split_turns([e.content for e in session.events if e.content])
+    upto = int(session.state.get(SUMMARY_UPTO_KEY) or 0)
+    target = len(turns) - CONTEXT_KEEP_TURNS
+    if target - upto < CONTEXT_SUMMARY_EVERY:
+        return False
+    previous = session.state.get(SUMMARY_KEY)
+    if CONTEXT_SUMMARIZER == "llm":
+        summary = await llm_summary(previous, turns[upto:target])
+    else:
+        summary = extractive_summary(previous, turns[upto:target])
+    event = Event(
+        author="context_manager",
+        actions=EventActions(state_delta={SUMMARY_KEY: summary, SUMMARY_UPTO_KEY: target}),
+    )
+    await session_service.append_event(session, event)
+    context_stats["summary_refreshes"] += 1
+    return True
+
+
+_refreshing: Dict[Tuple[str, str], asyncio.Task] = {}
+
+
+def schedule_summary_refresh(session_service, app_name: str, user_id: str, session_id: str) -> None:
+    """Start ``refresh_summary`` in the background unless one is already running for the session."""
+    key = (user_id, session_id)
+    if key in _refreshing:
+        return
+
+    async def _run() -> None:
+        try:
+            await refresh_summary(session_service, app_name, user_id, session_id)
+        except Exception as exc:
+            # A concurrent turn may have updated the session first; the next turn retries.
+            logger.warning("context summary refresh failed for %s: %s", session_id, exc)
+        finally:
+            _refreshing.pop(key, None)
+
+    _refreshing[key] = asyncio.get_running_loop().create_task(_run())
@@ -0,0 +1,246 @@
+# sql_agent/pipeline.py
+"""Pipeline orchestration mode: fixed step graph, independent steps run concurrently.
+
+The default root agent lets the model call its tools one at a time, so every
+step waits for the previous one even when it does not need its output.
+``PipelineAgent`` runs the same steps as an explicit graph:
+
+    schema ─┬─> rewrite ─> sql_generate ─> sql_execute ─┬─> evaluate ─┐
+    preferences ─────────────┘                         └─> draft ────┴─> respond
+
+- schema fetch and preference load run concurrently;
+- the final answer is drafted speculatively while ``evaluate_result`` judges
+  the SQL result; a "Partial" verdict discards the draft and retries the SQL
+  with the verdict as feedback (up to ``PIPELINE_MAX_ATTEMPTS``);
+- routing still applies: a skipped sub-agent is not run, and without an
+  evaluator there is nothing to speculate on.
+
+Sub-agents run in isolated in-memory sessions, as ``AgentTool`` runs them, so
+their deadline, routing and prompt-cache callbacks behave as in the default
+mode. Every request records a ``server.trace.Trace``; ``GET
+/debug/trace/{session_id}`` shows its critical path.
+"""
+import asyncio
+import logging
+import os
+import re
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from google.adk.agents import Agent, BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.genai import types
+
+from functions import db_tools
+from functions.preference_tools import format_preferences, preference_store
+from functions.result_digest import result_text
+from server import prompt_cache, routing, sql_examples, trace
+from server.deadline import before_model_callback as apply_deadline
+from subagents.evaluate_result import EvaluateResultInput, evaluate_result_agent
+from subagents.rewrite_prompt import RewritePromptInput, rewrite_prompt_agent
+
+from . import context
+
+PIPELINE_MAX_ATTEMPTS = int(os.getenv("PIPELINE_MAX_ATTEMPTS", "2"))
+PIPELINE_MODEL = os.getenv("PIPELINE_MODEL", "gemini-2.5-flash")
+
+logger = logging.getLogger("chat-api")
+
+sql_writer_prompt = """
+You write one MySQL SELECT query that answers a hospital administrator's question.
+
+You will receive the question, a clarified version of it, the database schema,
+verified queries for similar questions, the user's saved preferences, a summary
+of the conversation so far and, on a retry, feedback about the previous query.
+
+Use only tables and columns from the schema. Apply the user's preferences, and
+the SQL hints compiled from them, when they are relevant to the question.
+Return only the SQL query: no explanation and no Markdown fences.
+"""
+
+answer_writer_prompt = """
+You answer a hospital administrator's question from the result of a SQL query.
+
+Write a concise, friendly natural language summary that focuses on what the
+user asked for. Large results are given as a digest of per-column statistics
+(totals, averages, top and bottom rows, outliers); quote its numbers rather
+than recomputing them. Do not include SQL, JSON or raw data in your answer. If the
+result is empty or an error, say so plainly and suggest how to rephrase.
+"""
+
+
+def _pipeline_agent(name: str, instruction: str, description: str) -> Agent:
+    return Agent(
+        name=name,
+        model=PIPELINE_MODEL,
+        description=description,
+        instruction=prompt_cache.static_instruction(name, instruction),
+        before_model_callback=[apply_deadline, routing.before_model_callback, prompt_cache.before_model_callback],
+        after_model_callback=[routing.after_model_callback, prompt_cache.after_model_callback],
+    )
+
+
+sql_writer_agent = _pipeline_agent("sql_writer", sql_writer_prompt, "Writes the SQL query for a question.")
+answer_writer_agent = _pipeline_agent("answer_writer", answer_writer_prompt, "Summarizes a SQL result for the user.")
+
+_runners: Dict[str, Any] = {}
+_FENCE = re.compile(r"^```(?:sql)?\s*|\s*```$", re.IGNORECASE)
+
+
+async def run_isolated(agent: Agent, text: str, user_id: str) -> str:
+    """Run ``agent`` on ``text`` in a throwaway session and return its final text."""
+    from google.adk.runners import Runner
+    from google.adk.sessions import InMemorySessionService
+
+    runner = _runners.get(agent.name)
+    if runner is None:
+        runner = _runners[agent.name] = Runner(
+            app_name=agent.name, agent=agent, session_service=InMemorySessionService()
+        )
+    session = await runner.session_service.create_session(app_name=agent.name, user_id=user_id, state={})
+    last = None
+    try:
+        message = types.Content(role="user", parts=[types.Part(text=text)])
+        async for event in runner.run_async(user_id=user_id, session_id=session.id, new_message=message):
+            if event.content and event.content.parts:
+                last = event.content
+    finally:
+        await runner.session_service.delete_session(app_name=agent.name, user_id=user_id, session_id=session.id)
+    return "\n".join(p.text for p in last.parts if p.text).strip() if last else ""
+
+
+def load_preferences(ctx: InvocationContext) -> str:
+    entry = preference_store.get(ctx.user_id)
+    return format_preferences(entry.preferences, entry.hints)
+
+
+def conversation_summary(ctx: InvocationContext) -> str:
+    """Stored running summary plus the last few turns, as plain text."""
+    turns = context.split_turns([e.content for e in ctx.session.events if e.content])
+    # The newest turn is the current question
+    recent = context.extractive_summary(None, turns[-context.CONTEXT_KEEP_TURNS - 1:-1])
+    stored = ctx.session.state.get(context.SUMMARY_KEY) or ""
+    return "\n".join(part for part in (stored, recent) if part)
+
+
+def _section(title: str, body: Any) -> str:
+    return f"## {title}\n{body if body not in (None, '', {}) else '(none)'}"
+
+
+class PipelineAgent(BaseAgent):
+    """Runs the SQL question pipeline as a concurrent, speculative step graph."""
+
+    sql_writer: Agent
+    answer_writer: Agent
+    rewrite_agent: Agent
+    evaluate_agent: Agent
+    max_attempts: int = PIPELINE_MAX_ATTEMPTS
+
+    def _skipped(self, agent_name: str) -> bool:
+        decision = routing.current()
+        if decision is None or decision.model_for(agent_name) != routing.SKIP:
+            return False
+        decision.skipped.append(agent_name)
+        return True
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        question = "".join(p.text for p in (ctx.user_content.parts or []) if p.text) if ctx.user_content else ""
+        run = trace.Trace(ctx.invocation_id, ctx.session.id)
+        user_id = ctx.user_id
+
+        async def fetch_schema() -> str:
+            with run.span("schema"):
+                return await asyncio.to_thread(db_tools.get_table_info)
+
+        async def fetch_preferences() -> str:
+            with run.span("preferences"):
+                return await asyncio.to_thread(load_preferences, ctx)
+
+        schema, preferences = await asyncio.gather(fetch_schema(), fetch_preferences())
+
+        rewritten, ready = question, ["schema", "preferences"]
+        if not self._skipped(self.rewrite_agent.name):
+            with run.span("rewrite", ["schema"]):
+                rewritten = await run_isolated(
+                    self.rewrite_agent, RewritePromptInput(user_input=question, db_schema=schema).model_dump_json(),
+                    user_id,
+                ) or question
+            ready = ["rewrite", "preferences"]
+
+        history = conversation_summary(ctx)
+        decision = routing.current()
+        examples = sql_examples.examples_for(decision) if decision else sql_examples.for_question(question)
+        skip_evaluate = self._skipped(self.evaluate_agent.name)
+        feedback: Optional[str] = None
+        answer, final_deps = "", ready
+        for attempt in range(1, self.max_attempts + 1):
+            generate, execute = f"sql_generate#{attempt}", f"sql_execute#{attempt}"
+            with run.span(generate, ready):
+                prompt = "\n\n".join([
+                    _section("Question", question), _section("Clarified question", rewritten),
+                    _section("Schema", schema), _section("Verified examples", sql_examples.format_examples(examples)),
+                    _section("User preferences and SQL hints", preferences),
+                    _section("Conversation so far", history), _section("Feedback", feedback),
+                ])
+                sql = _FENCE.sub("", await run_isolated(self.sql_writer, prompt, user_id)).strip()
+            with run.span(execute, [generate]):
+                outcome = await asyncio.to_thread(db_tools.run_sql_query, {"query": sql})
+            result = result_text(outcome)
+
+            evaluate, draft = f"evaluate#{attempt}", f"draft#{attempt}"
+
+            async def write_draft() -> str:
+                with run.span(draft, [execute], speculative=not skip_evaluate):
+                    return await run_isolated(self.answer_writer, "\n\n".join([
+                        _section("Question", question), _section("SQL result", result),
+                    ]), user_id)
+
+            async def judge() -> str:
+                with run.span(evaluate, [execute]):
+                    payload = EvaluateResultInput(user_input=question, sql_query=sql, result=str(result),
+                                                  db_schema=schema)
+                    try:
+                        verdict = await run_isolated(self.evaluate_agent, payload.model_dump_json(), user_id)
+                    except Exception as exc:
+                        # A failed judgement must not fail the answer; keep the draft
+                        logger.warning("pipeline evaluation failed: %s", exc)
+                        return "Unknown"
+                    # Only an explicit "Correct" counts as verified; empty or unexpected replies are "Unknown"
+                    return routing.verdict_of(verdict)
+
+            if skip_evaluate:
+                answer, final_deps = await write_draft(), [draft]
+                break
+            verdict, answer = await asyncio.gather(judge(), write_draft())
+            routing.add_verdict(routing.current(), verdict)
+            if verdict == "Correct":
+                await asyncio.to_thread(sql_examples.record_verified, question, sql, outcome)
+            final_deps = [evaluate, draft]
+            if verdict != "Partial" or attempt == self.max_attempts:
+                break
+            run.discard(draft)
+            feedback = f"The previous query was judged Partial.\nQuery: {sql}\nResult: {str(result)[:500]}"
+            ready = [evaluate]
+
+        with run.span("respond", final_deps):
+            event = Event(
+                invocation_id=ctx.invocation_id,
+                author=self.name,
+                branch=ctx.branch,
+                content=types.Content(role="model", parts=[types.Part(text=answer)]),
+            )
+        run.finish()
+        recorded = trace.record(run)
+        logger.debug("pipeline critical path: %s (%s ms of %s ms)", recorded["critical_path"],
+                     recorded["critical_path_ms"], recorded["wall_ms"])
+        yield event
+
+
+pipeline_agent = PipelineAgent(
+    name="sql_pipeline_agent",
+    description="Answers questions about the hospital database with a concurrent step pipeline",
+    sql_writer=sql_writer_agent,
+    answer_writer=answer_writer_agent,
+    rewrite_agent=rewrite_prompt_agent,
+    evaluate_agent=evaluate_result_agent,
+)
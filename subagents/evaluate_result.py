@@ -1,6 +1,9 @@
 from google.adk.agents import Agent
 from pydantic import BaseModel
 
+from server import prompt_cache, routing
+from server.deadline import before_model_callback as apply_deadline
+
 instruction_prompt = """
 You are an SQL query result verification agent. Your role is to evaluate the correctness of the result of 
 running an SQL query.
@@ -8,7 +11,9 @@ running an SQL query.
 You will be given the following input fields:
 - user_input: the user's original question or instruction
 - sql_query: the SQL query that was generated
-- result: the result returned after executing the SQL query
+- result: the result returned after executing the SQL query. Large results are given as a digest
+  instead of rows: the row count, a preview of the first rows, and per-column statistics (sum, mean,
+  min/median/max, top and bottom rows, histogram, outliers, most common values).
 - db_schema: (optional) the database schema that may help with understanding context
 
 Based on this information, decide whether the query result correctly answers the user's intent.
@@ -28,6 +33,8 @@ evaluate_result_agent = Agent(
     name="evaluate_result",
     model="gemini-2.5-pro",
     description="Evaluate SQL query result for correctness.",
-    instruction=instruction_prompt,
+    instruction=prompt_cache.static_instruction("evaluate_result", instruction_prompt),
+    before_model_callback=[apply_deadline, routing.before_model_callback, prompt_cache.before_model_callback],
+    after_model_callback=[routing.after_model_callback, prompt_cache.after_model_callback],
     input_schema=EvaluateResultInput
 )
\ No newline at end of file
@@ -1,6 +1,9 @@
 from google.adk.agents import Agent
 from pydantic import BaseModel
 
+from server import prompt_cache, routing
+from server.deadline import before_model_callback as apply_deadline
+
 
 instruction_prompt = """
 You are a language simplification agent that rewrites user queries into clear, structured natural language instructions suitable for SQL query generation.
@@ -38,6 +41,8 @@ rewrite_prompt_agent = Agent(
     name="rewrite_prompt_agent",
     model="gemini-2.5-pro",
     description="Rewrites user input into a simplified, unambiguous prompt for SQL generation.",
-    instruction=instruction_prompt,
+    instruction=prompt_cache.static_instruction("rewrite_prompt_agent", instruction_prompt),
+    before_model_callback=[apply_deadline, routing.before_model_callback, prompt_cache.before_model_callback],
+    after_model_callback=[routing.after_model_callback, prompt_cache.after_model_callback],
     input_schema=RewritePromptInput
 )
\ No newline at end of file
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from server import admission
+from server.admission import CLINICAL, CRITICAL, DEFAULT, REPORTING, AdmissionController, Rejected
+
+
+@pytest.mark.parametrize("role, question, expected", [
+    ("ICU", "", CRITICAL),
+    ("critical-care", "", CRITICAL),
+    ("Nurse", "", CLINICAL),
+    ("finance", "oxygen left at Ruby Hill", REPORTING),
+    ("admin", "revenue last month", DEFAULT),
+    (None, "Which hospitals are low on oxygen?", CLINICAL),
+    (None, "Monthly revenue by region", DEFAULT),
+])
+def test_priority_for(role, question, expected):
+    assert admission.priority_for(role, question) == expected
+
+
+def test_role_header_is_ignored_unless_trusted(monkeypatch):
+    headers = {admission.ROLE_HEADER: "icu"}
+    monkeypatch.setattr(admission, "ADMISSION_TRUST_ROLE_HEADER", False)
+    assert admission.trusted_role(headers) is None
+    monkeypatch.setattr(admission, "ADMISSION_TRUST_ROLE_HEADER", True)
+    assert admission.trusted_role(headers) == "icu"
+
+
+def test_rate_limit_allows_a_burst_then_rejects():
+    gate = AdmissionController(rate_per_minute=60, burst=2)
+    gate.check_rate("u1")
+    gate.check_rate("u1")
+    with pytest.raises(Rejected) as rejected:
+        gate.check_rate("u1")
+    assert rejected.value.reason == "rate_limited"
+    assert rejected.value.retry_after == 1
+    gate.check_rate("u2")
+
+
+async def _hold(gate, priority, entered, release, order):
+    async with gate.slot(priority, max_wait=30):
+        order.append(priority)
+        entered.set()
+        await release.wait()
+
+
+def test_queue_runs_most_urgent_first_and_sheds_the_least_urgent():
+    async def scenario():
+        gate = AdmissionController(max_concurrent=1, max_queue=2)
+        gate._run_seconds = 0.1  # short runs, so no one is refused for the estimated wait
+        release, order = asyncio.Event(), []
+        first = asyncio.create_task(_hold(gate, DEFAULT, asyncio.Event(), release, order))
+        await asyncio.sleep(0)
+        queued = {p: asyncio.create_task(_hold(gate, p, asyncio.Event(), release, order))
+                  for p in (REPORTING, DEFAULT)}
+        await asyncio.sleep(0)
+        # Full queue: a critical request evicts the reporting one, another default request is refused
+        urgent = asyncio.create_task(_hold(gate, CRITICAL, asyncio.Event(), release, order))
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as refused:
+            async with gate.slot(DEFAULT, max_wait=30):
+                pass
+        assert refused.value.reason == "queue_full"
+        with pytest.raises(Rejected) as evicted:
+            await queued[REPORTING]
+        assert evicted.value.reason == "evicted"
+        release.set()
+        await asyncio.gather(first, queued[DEFAULT], urgent)
+        assert order == [DEFAULT, CRITICAL, DEFAULT]
+        assert gate.running == 0
+        assert (gate.stats["evicted"], gate.stats["queue_full"]) == (1, 1)
+
+    asyncio.run(scenario())
+
+
+def test_request_that_cannot_start_in_time_is_refused_at_once():
+    async def scenario():
+        gate = AdmissionController(max_concurrent=1, max_queue=4)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(gate, DEFAULT, asyncio.Event(), release, []))
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as refused:
+            async with gate.slot(DEFAULT, max_wait=1):
+                pass
+        assert refused.value.reason == "wait_exceeded"
+        assert gate.queue_depth() == 0
+        release.set()
+        await holder
+
+    asyncio.run(scenario())
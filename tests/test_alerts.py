@@ -0,0 +1,152 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from server import alerts
+from server.resource_feed import COLUMNS, ResourceFeed
+
+
+@pytest.fixture(autouse=True)
+def hospitals(monkeypatch):
+    monkeypatch.setattr(alerts.feed, "names", {"H001": "Ruby Hill Hospital, Pune", "H002": "Sahyadri General Hospital"})
+    monkeypatch.setattr(alerts, "_hospital_names", (0, None))
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("ICU above 90%?", ("icu_occupancy", (">", 0.9))),
+    ("Which hospitals have ICU above 90 percent?", ("icu_occupancy", (">", 0.9))),
+    ("How many hospitals have ICU above 90%?", ("icu_occupancy", (">", 0.9))),
+    ("Any hospital under 2 days of oxygen?", ("oxygen_days", ("<", 2.0))),
+    ("Any hospital with oxygen under 12 hours?", ("oxygen_days", ("<", 0.5))),
+    ("Which hospitals have ED wait over 30 minutes?", ("ed_wait_minutes", (">", 30.0))),
+    ("Which hospitals have ED wait above 2 hours?", ("ed_wait_minutes", (">", 120.0))),
+])
+def test_thresholds_in_the_metric_unit(question, expected):
+    assert alerts._match(question) == expected
+
+
+@pytest.mark.parametrize("question", [
+    "Which hospitals have oxygen under 5000 liters?",   # a stock, not days of supply
+    "Which hospitals have oxygen under 5?",             # no unit
+    "Which hospitals have more than 50 ICU beds?",      # a count, not an occupancy
+    "Which hospitals have ICU above 0.9?",
+    "Which hospitals have ED wait over 30?",
+    "Any hospital with ventilators above 5 units?",
+    "Which hospitals have ICU above 2 days?",
+])
+def test_thresholds_without_the_metric_unit_go_to_the_agent(question):
+    assert alerts._match(question) is None
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("Which hospitals are running out of oxygen?", ("oxygen_days", None)),
+    ("Any ventilator alerts?", ("ventilator_utilization", None)),
+    ("Is any ICU full?", ("icu_occupancy", None)),
+    ("Are ED critical cases spiking?", ("ed_critical_spike", None)),
+])
+def test_alert_wording_reads_the_alert_set(question, expected):
+    assert alerts._match(question) == expected
+
+
+@pytest.mark.parametrize("question", [
+    "How many ICU beds does Ruby Hill have?",
+    "Which hospital has the most oxygen?",
+    "Is Sahyadri ICU above 90%?",
+    "What is the bed occupancy at H002?",
+    "Which hospitals have oxygen?",
+    "Show oxygen levels",
+    "Will any hospital run out of oxygen tomorrow?",
+    "Which hospitals have ICU above 90% and ventilators above 90%?",
+])
+def test_lookups_go_to_the_agent(question):
+    assert alerts._match(question) is None
+
+
+def _feed(history=8):
+    source = ResourceFeed(history=history)
+    source.names = {"H001": "Ruby Hill Hospital", "H002": "Sahyadri General Hospital"}
+    return source
+
+
+def _row(hour, hospital_id, **values):
+    row = {c: None for c in COLUMNS}
+    row.update(timestamp=datetime(2024, 5, 1) + timedelta(hours=hour), hospital_id=hospital_id, **values)
+    return row
+
+
+def _tick(engine, source, *rows):
+    engine.evaluate(source, source.ingest(list(rows)))
+
+
+def test_threshold_alerts_clear_only_past_the_clear_level():
+    source = _feed()
+    engine = alerts.AlertEngine(source, [alerts.Rule("icu_full", "icu_occupancy", ">", 0.9, clear=0.85)])
+
+    _tick(engine, source, _row(0, "H001", total_icu_beds=20, icu_occupied_beds=19),
+          _row(0, "H002", total_icu_beds=20, icu_occupied_beds=10))
+    assert [a["hospital_id"] for a in engine.alerts()] == ["H001"]
+    assert engine.alerts()[0]["display"] == "95%"
+
+    _tick(engine, source, _row(1, "H001", total_icu_beds=20, icu_occupied_beds=18))   # 90%: still above clear
+    assert engine.alerts(hospital="ruby")[0]["value"] == 0.9
+
+    _tick(engine, source, _row(2, "H001", total_icu_beds=20, icu_occupied_beds=17))   # 85%: cleared
+    assert engine.alerts() == []
+    assert (engine.stats["fired"], engine.stats["cleared"]) == (1, 1)
+
+
+def test_rate_alerts_compare_with_the_recent_mean():
+    source = _feed()
+    rule = alerts.Rule("spike", "critical_cases_ed", ">", 0.5, "critical", kind="rate", window=3, min_delta=3)
+    engine = alerts.AlertEngine(source, [rule])
+    for hour, cases in enumerate([4, 4, 4]):
+        _tick(engine, source, _row(hour, "H001", critical_cases_ed=cases))
+    assert engine.alerts() == []
+
+    _tick(engine, source, _row(3, "H001", critical_cases_ed=5))                          # +25%, +1
+    assert engine.alerts() == []
+
+    _tick(engine, source, _row(4, "H001", critical_cases_ed=9))
+    (alert,) = engine.alerts(severity="critical")
+    assert alert["baseline"] == pytest.approx(4.33, abs=0.01) and alert["value"] == 9
+
+
+def test_query_orders_by_how_far_past_the_threshold():
+    source = _feed()
+    engine = alerts.AlertEngine(source, [])
+    source.ingest([
+        _row(0, "H001", available_oxygen_liters=300, estimated_daily_consumption_oxygen_liters=200),
+        _row(0, "H002", available_oxygen_liters=100, estimated_daily_consumption_oxygen_liters=200),
+        _row(0, "H003", available_oxygen_liters=900, estimated_daily_consumption_oxygen_liters=0),
+    ])
+
+    hits = engine.query("oxygen_days", "<", 2.0)
+
+    assert [(h["hospital_id"], h["display"]) for h in hits] == [("H002", "0.5 days"), ("H001", "1.5 days")]
+
+
+@pytest.mark.parametrize("metric, value, text", [
+    ("icu_occupancy", 0.934, "93%"),
+    ("oxygen_days", 1.25, "1.2 days"),
+    ("ed_wait_minutes", 72.4, "72 min"),
+    ("critical_cases_ed", 7.0, "7"),
+])
+def test_format_value(metric, value, text):
+    assert alerts.format_value(metric, value) == text
+
+
+def test_load_rules_replaces_and_extends_defaults(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps([{"name": "oxygen_low", "metric": "oxygen_days", "op": "<", "threshold": 1.0},
+                                {"name": "beds_critical", "metric": "bed_occupancy", "threshold": 0.97}]))
+
+    rules = {r.name: r for r in alerts.load_rules(str(path))}
+
+    assert rules["oxygen_low"].threshold == 1.0
+    assert rules["beds_critical"].op == ">"
+    assert len(rules) == len(alerts.DEFAULT_RULES) + 1
+
+    path.write_text(json.dumps([{"name": "x", "metric": "parking_spaces"}]))
+    with pytest.raises(ValueError, match="parking_spaces"):
+        alerts.load_rules(str(path))
@@ -0,0 +1,125 @@
+import pytest
+
+from server import answer_cache
+
+
+@pytest.fixture(autouse=True)
+def no_hospital_aliases(monkeypatch):
+    # Alias loading reads MySQL; these tests only cover the text normalisation
+    monkeypatch.setattr(answer_cache.aliases, "canonicalize", lambda text: text)
+
+
+def key(question):
+    return answer_cache.AnswerCache.key_for(answer_cache.normalize(question), None)
+
+
+def test_greater_and_less_than_get_different_keys():
+    assert key("hospitals with ICU occupancy > 90%") != key("hospitals with ICU occupancy < 90%")
+
+
+def test_inclusive_comparisons_get_different_keys():
+    assert key("hospitals with oxygen >= 500 liters") != key("hospitals with oxygen <= 500 liters")
+
+
+def test_signs_get_different_keys():
+    assert key("hospitals whose revenue changed +5%") != key("hospitals whose revenue changed -5%")
+
+
+def test_operators_normalise_to_words():
+    assert answer_cache.normalize("Show occupancy >= 90%!") == "occupancy ge 90"
+    assert key("occupancy > 90") == key("occupancy  >  90 ?")
+
+
+def test_hyphens_in_names_and_dates_are_not_signs():
+    assert answer_cache.normalize("Multi-speciality beds on 2024-01-05") == "multi speciality beds on 2024 01 05"
+
+
+def test_threshold_questions_are_not_contextual():
+    assert not answer_cache.is_contextual("Which hospitals have ICU above 90%?")
+    assert not answer_cache.is_contextual("Hospitals with the same ventilator count as last week")
+    assert answer_cache.is_contextual("what about them?")
+
+
+class Route:
+    def __init__(self, verdicts):
+        self.verdicts = verdicts
+
+
+@pytest.mark.parametrize("verdicts, stored", [(["Correct"], 1), (["Partial", "Correct"], 1), (["Partial"], 0),
+                                              (["Unknown"], 0), ([], 0)])
+def test_store_requires_explicit_correct(verdicts, stored):
+    cache = answer_cache.AnswerCache()
+    pending = answer_cache.Pending("k", "q", "q", tables={"hospitals": "1"})
+    cache.store(pending, "answer", Route(verdicts))
+    assert cache.stats["stored"] == stored
+    cache.store(pending, "answer", None)
+    assert cache.stats["stored"] == stored
+
+
+class FakeWatermarks:
+    def __init__(self, values, known=None):
+        self.values = values
+        self.tables = known
+
+    def known(self):
+        return self.tables
+
+    def get(self, tables):
+        found = {}
+        for table in tables:
+            if isinstance(self.values[table], Exception):
+                raise self.values[table]
+            found[table] = self.values[table]
+        return found
+
+
+def run_with(pending, tables):
+    answer_cache.begin(pending)
+    try:
+        answer_cache.note_tables(tables)
+    finally:
+        answer_cache.begin(None)
+
+
+def test_watermark_is_taken_when_the_table_is_noted(monkeypatch):
+    marks = FakeWatermarks({"hospitals": "v1"})
+    monkeypatch.setattr(answer_cache, "watermarks", marks)
+    cache = answer_cache.AnswerCache()
+    pending = answer_cache.Pending(cache.key_for("q", None), "q", "q")
+    run_with(pending, ["`hospital_data`.`hospitals`"])
+    marks.values["hospitals"] = "v2"  # rows written while the agent was still running
+    run_with(pending, ["hospitals"])
+    cache.store(pending, "answer", Route(["Correct"]))
+    assert cache._entries[pending.key]["tables"] == {"hospitals": "v1"}
+    assert cache.lookup("q", None)[0] is None
+    assert cache.stats["stale"] == 1
+
+
+def test_unknown_and_unreadable_tables_are_left_out(monkeypatch):
+    marks = FakeWatermarks({"hospitals": "v1", "hospital_finance_monthly": RuntimeError("gone")},
+                           known={"hospitals", "hospital_finance_monthly"})
+    monkeypatch.setattr(answer_cache, "watermarks", marks)
+    pending = answer_cache.Pending("k", "q", "q")
+    run_with(pending, ["hospitals", "latest", "timestamp", "hospital_finance_monthly"])
+    assert pending.tables == {"hospitals": "v1"}
+    cache = answer_cache.AnswerCache()
+    cache.store(pending, "answer", Route(["Correct"]))
+    assert cache.stats["stored"] == 1
+
+
+def test_alias_load_backs_off_after_a_failure(monkeypatch):
+    calls = []
+
+    def unreachable():
+        calls.append(1)
+        raise ConnectionError("mysql down")
+
+    aliases = answer_cache.HospitalAliases()
+    monkeypatch.setattr(aliases, "_load_names", unreachable)
+    with pytest.raises(ConnectionError):
+        aliases.canonicalize("ruby hill icu")
+    assert aliases.canonicalize("ruby hill icu") == "ruby hill icu"
+    assert len(calls) == 1
+    monkeypatch.setattr(aliases, "_failed_at", aliases._failed_at - answer_cache.ANSWER_CACHE_WATERMARK_TTL - 1)
+    monkeypatch.setattr(aliases, "_load_names", lambda: {"H001": "Ruby Hill Hospital, Pune"})
+    assert aliases.canonicalize("ruby hill icu") == "h001 icu"
@@ -0,0 +1,23 @@
+import pytest
+
+from functions.db_tools import with_time_limit
+
+HINT = "/*+ MAX_EXECUTION_TIME(500) */"
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM hospitals", f"SELECT {HINT} * FROM hospitals"),
+    ("  select 1", f"  select {HINT} 1"),
+    ("WITH latest AS (SELECT hospital_id FROM t) SELECT * FROM latest",
+     f"WITH latest AS (SELECT hospital_id FROM t) SELECT {HINT} * FROM latest"),
+    ("WITH RECURSIVE a (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM a WHERE n < 5), b AS (SELECT 'select (') "
+     "SELECT n FROM a",
+     f"WITH RECURSIVE a (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM a WHERE n < 5), b AS (SELECT 'select (') "
+     f"SELECT {HINT} n FROM a"),
+    ("(SELECT a FROM t) UNION (SELECT a FROM u)", f"(SELECT {HINT} a FROM t) UNION (SELECT a FROM u)"),
+    ("SELECT /*+ MAX_EXECUTION_TIME(100) */ 1", "SELECT /*+ MAX_EXECUTION_TIME(100) */ 1"),
+    ("SHOW TABLES", "SHOW TABLES"),
+    ("UPDATE t SET a = (SELECT 1)", "UPDATE t SET a = (SELECT 1)"),
+])
+def test_with_time_limit(sql, expected):
+    assert with_time_limit(sql, 500) == expected
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from server import forecast
+from server.resource_feed import COLUMNS, ResourceFeed
+
+HOUR = 3600.0
+
+
+def _window(series, columns=len(COLUMNS)):
+    """One hospital, hourly snapshots of ``series`` in column 0, newest last."""
+    values = np.full((1, len(series), columns), np.nan)
+    values[0, :, 0] = series
+    times = np.arange(len(series), dtype=float)[None, :] * HOUR
+    return values, times
+
+
+def test_fit_trends_recovers_a_linear_slope():
+    values, times = _window([10.0, 12.0, 14.0, 16.0, 18.0])
+
+    fit = forecast.fit_trends(values, times, [0])
+
+    assert fit["slope"][0, 0] == pytest.approx(2.0)
+    assert fit["last"][0, 0] == 18.0
+    assert fit["sigma"][0, 0] == pytest.approx(0.0, abs=1e-9)
+    assert fit["points"][0, 0] == 5 and fit["fitted"][0, 0]
+
+
+def test_fit_trends_skips_gaps_and_anchors_at_the_newest_value():
+    values, times = _window([10.0, np.nan, 14.0, 16.0, np.nan])
+    times[0, 1] = np.nan
+
+    fit = forecast.fit_trends(values, times, [0])
+
+    assert fit["slope"][0, 0] == pytest.approx(2.0)
+    assert fit["last"][0, 0] == 16.0
+    assert fit["points"][0, 0] == 3
+
+
+def test_fit_trends_is_flat_with_too_little_history():
+    values, times = _window([np.nan, np.nan, np.nan, 5.0, 9.0])
+
+    fit = forecast.fit_trends(values, times, [0])
+
+    assert not fit["fitted"][0, 0]
+    assert fit["slope"][0, 0] == 0.0 and fit["sigma"][0, 0] == 0.0
+    assert fit["last"][0, 0] == 9.0
+
+
+def test_fit_trends_weights_recent_snapshots_more():
+    # Flat for a day, then rising: a short half-life follows the recent rise
+    series = [10.0] * 24 + [12.0, 14.0, 16.0, 18.0]
+    values, times = _window(series)
+
+    short = forecast.fit_trends(values, times, [0], half_life=2)["slope"][0, 0]
+    long = forecast.fit_trends(values, times, [0], half_life=1000)["slope"][0, 0]
+
+    assert short > long > 0
+
+
+def test_fit_trends_without_observations():
+    values, times = _window([np.nan] * 4)
+
+    fit = forecast.fit_trends(values, times, [0])
+
+    assert np.isnan(fit["last"][0, 0])
+    assert fit["points"][0, 0] == 0 and not fit["fitted"][0, 0]
+
+
+def test_oxygen_hours_left_at_constant_consumption():
+    hours = forecast.oxygen_hours_left(np.array([2400.0]), np.array([240.0]), np.array([0.0]))
+
+    assert hours[0] == pytest.approx(240.0)
+
+
+def test_oxygen_hours_left_with_rising_consumption():
+    liters, per_day, growth = 2400.0, 240.0, 2.0
+
+    hours = forecast.oxygen_hours_left(np.array([liters]), np.array([per_day]), np.array([growth]))[0]
+
+    assert hours < 240.0
+    assert (per_day * hours + growth * hours ** 2 / 2) / 24 == pytest.approx(liters)
+
+
+def test_oxygen_hours_left_with_falling_consumption():
+    liters = np.array([2400.0, 2400.0])
+    # The first burns out before consumption reaches zero, the second never does
+    hours = forecast.oxygen_hours_left(liters, np.array([240.0, 240.0]), np.array([-0.5, -2.0]))
+
+    burned = (240.0 * hours[0] - 0.5 * hours[0] ** 2 / 2) / 24
+    assert 240.0 < hours[0] < np.inf and burned == pytest.approx(2400.0)
+    assert hours[1] == np.inf
+
+
+def test_oxygen_hours_left_edge_cases():
+    hours = forecast.oxygen_hours_left(np.array([0.0, 100.0, np.nan]), np.array([50.0, 0.0, 50.0]),
+                                       np.array([0.0, 0.0, 0.0]))
+
+    assert hours[0] == 0.0
+    assert hours[1] == np.inf
+    assert np.isnan(hours[2])
+
+
+def _row(hour, hospital_id="H001", **values):
+    row = {c: 0.0 for c in COLUMNS}
+    row.update(total_beds=100, occupied_beds=50, total_ventilators=10, in_use_ventilators=2)
+    row.update(timestamp=datetime(2024, 5, 1) + timedelta(hours=hour), hospital_id=hospital_id, **values)
+    return row
+
+
+def test_forecaster_projects_and_ranks_at_risk():
+    source = ResourceFeed(history=8)
+    source.names = {"H001": "Ruby Hill Hospital", "H002": "Sahyadri General Hospital"}
+    forecaster = forecast.CapacityForecaster(source, horizons=(6, 24))
+    rows = []
+    for hour in range(4):
+        # H001 fills one ICU bed an hour out of 10; H002 stays flat
+        rows.append(_row(hour, total_icu_beds=10, icu_occupied_beds=4 + hour,
+                         available_oxygen_liters=1000, estimated_daily_consumption_oxygen_liters=240))
+        rows.append(_row(hour, "H002", total_icu_beds=10, icu_occupied_beds=5,
+                         available_oxygen_liters=1000, estimated_daily_consumption_oxygen_liters=0))
+    forecaster.refresh(source, source.ingest(rows))
+
+    (ruby,) = forecaster.forecast("ruby", resource="icu")
+    icu = ruby["forecasts"][0]
+    assert icu["current"] == 7 and icu["change_per_day"] == 24.0
+    assert icu["hours_until_exhausted"] == 3.0
+    assert icu["projected_beds"] == {"+6h": 10.0, "+24h": 10.0}
+
+    at_risk = forecaster.at_risk(12)
+    assert [(r["hospital_id"], r["resource"]) for r in at_risk] == [("H001", "icu")]
+    assert forecaster.at_risk(100, resource="oxygen")[0]["hours_until_exhausted"] == 100.0
@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import pytest
+
+from server import history
+
+MESSAGES = [{"sender": "user" if i % 2 == 0 else "bot", "text": f"m{i}"} for i in range(10)]
+
+
+def _indices(page):
+    return [m["index"] for m in page["messages"]]
+
+
+def test_paginate_defaults_to_the_newest_page():
+    page = history.paginate(MESSAGES, limit=3)
+
+    assert _indices(page) == [7, 8, 9]
+    assert page["messages"][0] == {"index": 7, "sender": "bot", "text": "m7"}
+    assert page["total"] == 10
+    assert page["has_more_before"] and not page["has_more_after"]
+
+
+def test_paginate_before_walks_backwards():
+    page = history.paginate(MESSAGES, before=7, limit=3)
+
+    assert _indices(page) == [4, 5, 6]
+    assert page["has_more_before"] and page["has_more_after"]
+    assert _indices(history.paginate(MESSAGES, before=2, limit=3)) == [0, 1]
+
+
+def test_paginate_after_walks_forwards():
+    page = history.paginate(MESSAGES, after=2, limit=3)
+
+    assert _indices(page) == [3, 4, 5]
+    assert page["has_more_before"] and page["has_more_after"]
+    assert _indices(history.paginate(MESSAGES, after=9)) == []
+
+
+def test_paginate_between_cursors_keeps_the_newest():
+    assert _indices(history.paginate(MESSAGES, after=1, before=8, limit=2)) == [6, 7]
+
+
+@pytest.mark.parametrize("before, after", [(0, None), (-5, None), (None, 20), (3, 5)])
+def test_paginate_out_of_range_cursors_give_empty_pages(before, after):
+    page = history.paginate(MESSAGES, before=before, after=after)
+
+    assert page["messages"] == [] and page["total"] == 10
+
+
+def test_paginate_caps_the_limit(monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_MAX_LIMIT", 4)
+
+    assert len(history.paginate(MESSAGES, limit=100)["messages"]) == 4
+    assert len(history.paginate(MESSAGES, limit=0)["messages"]) == 4  # 0 means the default
+    assert len(history.paginate(MESSAGES, limit=-3)["messages"]) == 1
+
+
+def test_make_etag_depends_on_version_and_page():
+    etag = history.make_etag("1:10", None, None, 200)
+
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert etag == history.make_etag("1:10", None, None, 200)
+    assert etag != history.make_etag("1:11", None, None, 200)
+    assert etag != history.make_etag("1:10", 5, None, 200)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ('W/"abc"', True),
+    ('W/"old", W/"abc"', True),
+    ("*", True),
+    ('W/"other"', False),
+])
+def test_etag_matches(header, expected):
+    assert history.etag_matches(header, 'W/"abc"') is expected
+
+
+def _event(event_id, ts, author="user", text=None, call=False, partial=False):
+    parts = []
+    if text:
+        parts.append(SimpleNamespace(text=text, function_call=None, function_response=None))
+    if call:
+        parts.append(SimpleNamespace(text=None, function_call={"name": "run_sql_query"}, function_response=None))
+    return SimpleNamespace(id=event_id, timestamp=ts, author=author, partial=partial,
+                           content=SimpleNamespace(parts=parts) if parts else None)
+
+
+def test_apply_events_skips_tool_calls_and_replays():
+    entry = history.SessionHistory()
+    entry.apply_events([
+        _event("a", 1.0, text="beds in Pune?"),
+        _event("b", 2.0, author="agent", call=True),
+        _event("c", 2.0, author="agent", text="partial", partial=True),
+        _event("d", 3.0, author="agent", text="12 beds"),
+    ])
+    version = entry.version
+
+    # after_timestamp is inclusive, so the newest event comes back with the next batch
+    entry.apply_events([_event("d", 3.0, author="agent", text="12 beds"),
+                        _event("e", 3.0, text="and oxygen?")])
+
+    assert entry.messages == [{"sender": "user", "text": "beds in Pune?"}, {"sender": "bot", "text": "12 beds"},
+                              {"sender": "user", "text": "and oxygen?"}]
+    assert entry.version != version
+
+
+def test_apply_state_resumes_and_rebuilds():
+    entry = history.SessionHistory()
+    entries = [{"sender": "user", "text": "hi"}, {"role": "model", "parts": [{"text": "hello"}]}, {"junk": 1}]
+    entry.apply_state(entries)
+    entry.apply_state(entries + [{"role": "user", "parts": ["more"]}])
+
+    assert [m["text"] for m in entry.messages] == ["hi", "hello", "more"]
+
+    entry.apply_state([{"sender": "bot", "text": "summary"}])
+
+    assert entry.messages == [{"sender": "bot", "text": "summary"}]
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+
+from functions import preference_tools
+
+
+class Request:
+    def __init__(self):
+        self.instructions = []
+
+    def append_instructions(self, instructions):
+        self.instructions += instructions
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    store = preference_tools.PreferenceStore(create_engine(f"sqlite:///{tmp_path}/prefs.db"))
+    monkeypatch.setattr(preference_tools, "preference_store", store)
+    return store
+
+
+def test_callback_uses_the_preferences_loaded_before_the_run(store, monkeypatch):
+    store.set("u1", "ownership", "govt")
+    store.flush()
+    store._cache.clear()
+    loads = store.stats["loads"]
+
+    async def request():
+        preference_tools.begin("u1")
+        await preference_tools.load("u1")
+        assert store.stats["loads"] == loads + 1
+        monkeypatch.setattr(store, "_load", lambda user_id: pytest.fail("table read during the run"))
+        request = Request()
+        preference_tools.before_model_callback(object(), request)
+        return request
+
+    (instruction,) = asyncio.run(request()).instructions
+    assert "- ownership: govt" in instruction
+
+
+def test_callback_without_a_bound_user_adds_nothing(store):
+    request = Request()
+    preference_tools.before_model_callback(object(), request)
+    assert request.instructions == []
+
+
+def test_tools_trust_the_request_user_over_the_model(store):
+    async def request():
+        preference_tools.begin("u1")
+        return preference_tools.update_user_priority("cost: low", user_id="someone_else")
+
+    assert asyncio.run(request())["status"] == "saved"
+    assert store.peek("u1").preferences == {"cost": "low"}
+    assert store.peek("someone_else") is None
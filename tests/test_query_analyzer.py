@@ -0,0 +1,51 @@
+import pytest
+
+from server.query_analyzer import _clause, load_schema, suggest_indexes, suggest_rewrites
+from server.query_log import fingerprint
+
+
+@pytest.fixture(scope="module")
+def schema():
+    return load_schema()
+
+
+def indexes(sql, schema):
+    return {p["ddl"].split(" ON ")[1] for p in suggest_indexes(fingerprint(sql), *schema)}
+
+
+def test_where_clause_runs_past_parentheses():
+    fp = fingerprint("SELECT * FROM hospitals WHERE region IN ('a', 'b') AND date(created_at) >= '2024-01-01' "
+                     "AND hospital_id = 'x' ORDER BY hospital_name")
+    assert _clause(fp, "where") == " region in (?+) and date(created_at) >= ? and hospital_id = ? "
+
+
+def test_subquery_clauses_end_at_their_own_parenthesis():
+    fp = fingerprint("SELECT * FROM t WHERE a = (SELECT MAX(b) FROM u WHERE c = 1 GROUP BY d) AND e = 2")
+    assert _clause(fp, "where").split() == "a = (select max(b) from u where c = ? group by d) and e = ? c = ?".split()
+
+
+def test_latest_snapshot_keeps_the_region_filter(schema):
+    sql = ("SELECT t.hospital_id, t.available_oxygen_liters FROM hospital_resource_timeseries t "
+           "JOIN hospitals h ON h.hospital_id = t.hospital_id WHERE t.timestamp = (SELECT MAX(timestamp) "
+           "FROM hospital_resource_timeseries WHERE hospital_id = t.hospital_id) AND h.region = 'East'")
+    found = indexes(sql, schema)
+    assert "hospitals (region, hospital_id);" in found
+    assert "hospital_resource_timeseries (timestamp, hospital_id);" in found
+
+
+def test_date_filter_suggests_a_rewrite_and_the_index_it_enables(schema):
+    sql = "SELECT * FROM hospital_resource_timeseries WHERE date(timestamp) >= '2024-01-01' AND hospital_id = 'H1'"
+    proposals = suggest_indexes(fingerprint(sql), *schema)
+    assert [p["columns"] for p in proposals] == [["hospital_id", "timestamp"]]
+    assert "after rewriting date(timestamp) as a range" in proposals[0]["reason"]
+    assert not any(p["columns"] == ["timestamp"] for p in proposals)
+    rewrites = suggest_rewrites(fingerprint(sql), schema[0])
+    assert rewrites == ["date(timestamp) on hospital_resource_timeseries cannot use an index on timestamp; "
+                        "filter on the column itself, e.g. timestamp >= ? and timestamp < ? + interval 1 day"]
+
+
+def test_other_functions_suggest_a_functional_index(schema):
+    sql = "SELECT * FROM hospitals WHERE lower(region) = 'east' AND (hospital_id = 'a' OR hospital_id = 'b')"
+    assert indexes(sql, schema) == set()
+    (rewrite,) = suggest_rewrites(fingerprint(sql), schema[0])
+    assert rewrite.endswith("CREATE INDEX idx_hospitals_lower_region ON hospitals ((lower(region)));")
@@ -0,0 +1,29 @@
+import pytest
+
+from server.query_log import fingerprint, tables_touched
+
+
+@pytest.mark.parametrize("sql, tables", [
+    ("SELECT * FROM hospitals", ["hospitals"]),
+    ("SELECT h.hospital_name FROM `hospital_data`.`hospitals` h JOIN hospital_resource_timeseries t "
+     "ON t.hospital_id = h.hospital_id", ["hospital_resource_timeseries", "hospitals"]),
+    ("SELECT EXTRACT(MONTH FROM timestamp) AS m, COUNT(*) FROM hospital_resource_timeseries GROUP BY m",
+     ["hospital_resource_timeseries"]),
+    ("SELECT TRIM(LEADING 'x' FROM hospital_name), SUBSTRING(region FROM 2) FROM hospitals", ["hospitals"]),
+    ("WITH latest AS (SELECT hospital_id, MAX(timestamp) AS ts FROM hospital_resource_timeseries "
+     "GROUP BY hospital_id) SELECT * FROM latest JOIN hospitals USING (hospital_id)",
+     ["hospital_resource_timeseries", "hospitals"]),
+    ("WITH a AS (SELECT * FROM hospitals), b (id) AS (SELECT hospital_id FROM a) SELECT * FROM b", ["hospitals"]),
+    ("SELECT * FROM hospitals WHERE hospital_id IN (SELECT hospital_id FROM hospital_finance_monthly)",
+     ["hospital_finance_monthly", "hospitals"]),
+    ("SELECT * FROM (SELECT * FROM hospitals) AS h", ["hospitals"]),
+    ("SELECT 'from nowhere' FROM dual", []),
+    ("UPDATE user_preferences SET value = 1", ["user_preferences"]),
+])
+def test_tables_touched(sql, tables):
+    assert tables_touched(sql) == tables
+
+
+def test_fingerprint_replaces_literals():
+    assert fingerprint("SELECT * FROM t WHERE a = 'x' AND b IN (1, 2, 3) LIMIT 5;") == \
+        "select * from t where a = ? and b in (?+) limit ?"
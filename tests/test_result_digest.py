@@ -0,0 +1,99 @@
+import datetime
+import decimal
+import json
+
+import pytest
+
+from functions import result_digest
+
+ROWS = [
+    {"hospital_id": f"H{i:03d}", "hospital_name": f"Hospital {i}", "city": "Pune" if i % 3 else "Mumbai",
+     "icu_occupied_beds": i, "oxygen_days": None if i == 4 else decimal.Decimal(i) / 2,
+     "updated_at": datetime.datetime(2024, 5, 1, i)}
+    for i in range(1, 11)
+]
+
+
+def test_label_column_prefers_names_then_ids():
+    kinds = {"city": "text", "hospital_id": "text", "hospital_name": "text", "beds": "numeric"}
+
+    assert result_digest.label_column(["city", "hospital_id", "hospital_name", "beds"], kinds) == "hospital_name"
+    assert result_digest.label_column(["city", "hospital_id", "beds"], kinds) == "hospital_id"
+    assert result_digest.label_column(["city", "beds"], kinds) == "city"
+    assert result_digest.label_column(["beds"], kinds) is None
+
+
+def test_numeric_summary():
+    out = result_digest.digest(ROWS, top_k=3)
+    beds = out["columns"]["icu_occupied_beds"]
+
+    assert out["row_count"] == 10 and out["label_column"] == "hospital_name"
+    assert beds["count"] == 10 and beds["nulls"] == 0
+    assert (beds["sum"], beds["mean"], beds["min"], beds["median"], beds["max"]) == (55, 5.5, 1, 5.5, 10)
+    assert beds["top"] == [["Hospital 10", 10], ["Hospital 9", 9], ["Hospital 8", 8]]
+    assert beds["bottom"] == [["Hospital 1", 1], ["Hospital 2", 2], ["Hospital 3", 3]]
+    assert sum(count for _, _, count in beds["histogram"]) == 10
+    assert "outliers" not in beds
+
+
+def test_numeric_summary_counts_nulls_and_decimals():
+    oxygen = result_digest.digest(ROWS)["columns"]["oxygen_days"]
+
+    assert oxygen["type"] == "numeric"
+    assert oxygen["count"] == 9 and oxygen["nulls"] == 1
+    assert oxygen["sum"] == 25.5 and oxygen["max"] == 5
+
+
+def test_outliers_are_flagged_against_the_iqr():
+    rows = [{"hospital_name": f"H{i}", "wait": 10 + i % 3} for i in range(20)]
+    rows.append({"hospital_name": "Slow", "wait": 90})
+
+    wait = result_digest.digest(rows)["columns"]["wait"]
+
+    assert wait["outliers"]["count"] == 1
+    assert wait["outliers"]["rows"] == [["Slow", 90, "high"]]
+
+
+def test_text_and_temporal_summaries():
+    columns = result_digest.digest(ROWS)["columns"]
+
+    assert columns["city"] == {"type": "text", "count": 10, "nulls": 0, "distinct": 2,
+                               "most_common": [["Pune", 7], ["Mumbai", 3]]}
+    assert "most_common" not in columns["hospital_id"]  # every value unique
+    assert columns["updated_at"]["first"] == "2024-05-01T01:00:00"
+    assert columns["updated_at"]["last"] == "2024-05-01T10:00:00"
+
+
+def test_digest_of_empty_results():
+    assert result_digest.digest([]) == {"row_count": 0, "label_column": None, "columns": {}}
+    out = result_digest.digest([{"note": None}, {"note": None}])
+    assert out["columns"]["note"] == {"type": "empty", "count": 0, "nulls": 2}
+
+
+def test_digest_is_json_serialisable():
+    json.dumps(result_digest.digest(ROWS))
+
+
+def test_booleans_are_not_numeric():
+    assert result_digest.digest([{"flag": True}, {"flag": False}])["columns"]["flag"]["type"] == "text"
+
+
+def test_result_store_evicts_least_recently_used():
+    store = result_digest.ResultStore(size=2)
+    first, second = store.put([{"a": 1}]), store.put([{"a": 2}])
+
+    assert store.get(first) == [{"a": 1}]  # first is now the most recent
+    third = store.put([{"a": 3}])
+
+    assert store.get(second) is None
+    assert store.get(first) is not None and store.get(third) is not None
+
+
+@pytest.mark.parametrize("outcome, expected", [
+    ({"raw_result": "[(1,)]"}, "[(1,)]"),
+    ({"error": "boom"}, "boom"),
+    ({"row_count": 30, "digest": {"columns": {}}, "preview": [], "result_id": "x"},
+     '{"row_count":30,"digest":{"columns":{}},"preview":[]}'),
+])
+def test_result_text(outcome, expected):
+    assert result_digest.result_text(outcome) == expected
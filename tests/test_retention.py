@@ -0,0 +1,89 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from server import retention
+
+
+@pytest.mark.parametrize("text, seconds", [
+    ("30d", 30 * 86400),
+    ("12h", 12 * 3600),
+    ("90m", 90 * 60),
+    ("45s", 45),
+    ("2w", 2 * 604800),
+    ("0", 0),
+    (" 1.5h ", 5400),
+])
+def test_parse_duration(text, seconds):
+    assert retention.parse_duration(text) == seconds
+
+
+@pytest.mark.parametrize("text", ["", "d", "30 days", "-1d", "3y"])
+def test_parse_duration_rejects_other_forms(text):
+    with pytest.raises(ValueError):
+        retention.parse_duration(text)
+
+
+def test_parse_policies():
+    policies = retention.parse_policies("app=archive:30d|compact:7d, app_test=drop:0d,*=archive:90d,keep=")
+
+    assert policies["app"].archive_after == 30 * 86400
+    assert policies["app"].compact_after == 7 * 86400
+    assert not policies["app"].drop
+    assert policies["app_test"].archive_after == 0 and policies["app_test"].drop
+    assert policies["*"].archive_after == 90 * 86400
+    assert policies["keep"] == retention.Policy()
+
+
+def test_parse_policies_rejects_unknown_actions():
+    with pytest.raises(ValueError, match="purge"):
+        retention.parse_policies("app=purge:1d")
+
+
+def test_policy_for_falls_back_to_the_wildcard(tmp_path):
+    maintenance = retention.SessionMaintenance("app=compact:7d,*=archive:90d", str(tmp_path))
+
+    assert maintenance.policy_for("app").archive_after is None
+    assert maintenance.policy_for("other").archive_after == 90 * 86400
+    assert retention.SessionMaintenance("app=", str(tmp_path)).policy_for("other") == retention.Policy()
+
+
+def _event(role=None, text=None, call=False, response=False):
+    if role is None:
+        return SimpleNamespace(content=None)
+    parts = []
+    if text:
+        parts.append({"text": text})
+    if call:
+        parts.append({"function_call": {"name": "run_sql_query"}})
+    if response:
+        parts.append({"function_response": {"name": "run_sql_query"}})
+    return SimpleNamespace(content={"role": role, "parts": parts})
+
+
+def test_turn_boundaries():
+    events = [
+        _event("model", text="greeting before any question"),
+        _event("user", text="beds in Pune?"),
+        _event("model", call=True),
+        _event("user", response=True),
+        _event(),
+        _event("model", text="12 beds"),
+        _event("user", text="and oxygen?"),
+        _event("model", text="4 days"),
+    ]
+
+    assert retention.turn_boundaries(events) == [0, 1, 6]
+    assert retention.turn_boundaries([_event(), _event()]) == []
+
+
+def test_archive_round_trip(tmp_path):
+    writer = retention.ArchiveWriter(str(tmp_path))
+
+    assert writer.write("my app", []) == 0
+    assert writer.write("my app", [{"session_id": "a"}]) > 0
+    assert writer.write("my app", [{"session_id": "b"}, {"session_id": "c"}]) > 0
+
+    assert [r["session_id"] for r in writer.records("my app")] == ["a", "b", "c"]
+    assert writer.path_for("my app", datetime(2024, 3, 9)) == tmp_path / "my_app" / "2024-03.jsonl.gz"
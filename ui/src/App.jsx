@@ -21,6 +21,12 @@ export default function App() {
   const [apiStatus, setApiStatus] = useState("checking");
   const messagesEndRef = useRef(null);
   const hasInitialized = useRef(false);
+  const historyEtags = useRef({});
+  const socketRef = useRef(null);
+  const boundSession = useRef(null);
+  const pendingChats = useRef({});
+  const serverCounts = useRef({});
+  const [stage, setStage] = useState(null);
 
   const THINKING_PREFIX = "Thinking";
 
@@ -41,8 +47,8 @@ export default function App() {
 
   async function checkApiConnection() {
     try {
-      console.log("🔍 Testing API:", `${API_URL}/debug/db-test`);
-      const response = await axios.get(`${API_URL}/debug/db-test`, { timeout: 5000 });
+      console.log("🔍 Testing API:", `${API_URL}/healthz`);
+      const response = await axios.get(`${API_URL}/healthz`, { timeout: 5000 });
       console.log("✅ API OK:", response.data);
       setApiStatus("connected");
       return true;
@@ -53,6 +59,80 @@ export default function App() {
     }
   }
 
+  // One WebSocket per tab: the session is bound once, then chats, pushed history
+  // deltas, stage progress and server status share it. REST is the fallback.
+  function connectSocket(uid, attempt = 0) {
+    const ws = new WebSocket(`${API_URL.replace(/^http/, "ws")}/ws`);
+    ws.onopen = () => {
+      attempt = 0;
+      socketRef.current = ws;
+      setApiStatus("connected");
+      if (boundSession.current) bindSession(uid, boundSession.current);
+    };
+    ws.onmessage = (e) => handleFrame(JSON.parse(e.data));
+    ws.onclose = () => {
+      if (socketRef.current === ws) socketRef.current = null;
+      setApiStatus("disconnected");
+      for (const [id, pending] of Object.entries(pendingChats.current)) {
+        pending.reject(new Error("socket closed"));
+        delete pendingChats.current[id];
+      }
+      setTimeout(() => connectSocket(uid, attempt + 1), Math.min(30000, 1000 * 2 ** attempt));
+    };
+  }
+
+  function socketOpen() {
+    return socketRef.current?.readyState === WebSocket.OPEN;
+  }
+
+  function bindSession(uid, sessionId) {
+    boundSession.current = sessionId;
+    if (!socketOpen()) return false;
+    socketRef.current.send(
+      JSON.stringify({
+        type: "bind",
+        user_id: uid,
+        session_id: sessionId,
+        have: serverCounts.current[sessionId] || 0,
+      })
+    );
+    return true;
+  }
+
+  function handleFrame(frame) {
+    if (frame.type === "history") {
+      serverCounts.current[frame.session_id] = frame.total;
+      const incoming = frame.messages.map(({ sender, text }) => ({ sender, text }));
+      setConversations((prev) => {
+        const current = prev[frame.session_id] || [];
+        // Keep the cached conversation if the server has nothing for this session
+        if (frame.start === 0 && incoming.length === 0 && current.length > 0) return prev;
+        const confirmed = frame.reset ? [] : current.filter((m) => !m.temp && !m.pending).slice(0, frame.start);
+        const thinking = current.filter((m) => m.temp);
+        const next = { ...prev, [frame.session_id]: [...confirmed, ...incoming, ...thinking] };
+        saveConversationsToLocal(next);
+        return next;
+      });
+    } else if (frame.type === "progress") {
+      setStage(frame.phase === "start" ? frame.stage : null);
+    } else if (frame.type === "response" || frame.type === "error") {
+      const pending = pendingChats.current[frame.id];
+      if (!pending) return;
+      delete pendingChats.current[frame.id];
+      if (frame.type === "response") pending.resolve(frame.response);
+      else pending.reject(new Error(frame.error || `error ${frame.status}`));
+    } else if (frame.type === "status") {
+      setApiStatus(frame.status === "ok" ? "connected" : "degraded");
+    }
+  }
+
+  function chatOverSocket(text, id) {
+    return new Promise((resolve, reject) => {
+      pendingChats.current[id] = { resolve, reject };
+      socketRef.current.send(JSON.stringify({ type: "chat", id, text, timeout: 120 }));
+    });
+  }
+
   useEffect(() => {
     if (hasInitialized.current) return;
     hasInitialized.current = true;
@@ -66,6 +146,7 @@ export default function App() {
         localStorage.setItem(USER_ID_KEY, uid);
       }
       setUserId(uid);
+      connectSocket(uid);
 
       const { savedSessions, savedConvs } = loadLocalState();
       setConversations(savedConvs || {});
@@ -125,7 +206,15 @@ export default function App() {
       const url = `${API_URL}/history/${encodeURIComponent(uid)}/${encodeURIComponent(sessionId)}`;
       console.log("📡 Fetching history:", url);
 
-      const res = await axios.get(url, { timeout: 10000 });
+      const etag = historyEtags.current[sessionId];
+      const res = await axios.get(url, {
+        timeout: 10000,
+        headers: etag ? { "If-None-Match": etag } : {},
+        validateStatus: (status) => status === 200 || status === 304,
+      });
+      // 304: nothing changed since the last fetch, keep the cached conversation
+      if (res.status === 304) return null;
+      if (res.headers?.etag) historyEtags.current[sessionId] = res.headers.etag;
       return Array.isArray(res.data.messages) ? res.data.messages : [];
     } catch (err) {
       console.error("❌ fetchHistory error:", err.message);
@@ -136,6 +225,12 @@ export default function App() {
   async function ensureAndLoad(uid, sessionId, opts = { selectAfterLoad: true, showCachedFirst: true }) {
     if (opts.showCachedFirst) setActiveSession(sessionId);
 
+    // On the socket the server ensures the session and pushes its history
+    if (bindSession(uid, sessionId)) {
+      if (opts.selectAfterLoad) setActiveSession(sessionId);
+      return;
+    }
+
     await ensureSessionOnServer(uid, sessionId);
     const serverMsgs = await fetchHistoryFromServer(uid, sessionId);
 
@@ -165,7 +260,7 @@ export default function App() {
       return next;
     });
 
-    if (apiStatus === "connected") {
+    if (apiStatus !== "disconnected") {
       await ensureAndLoad(uid, sessionId, { selectAfterLoad: true, showCachedFirst: true });
     } else {
       setActiveSession(sessionId);
@@ -210,7 +305,9 @@ export default function App() {
       return;
     }
 
-    const userMsg = { sender: "user", text: input };
+    const viaSocket = socketOpen();
+    // Socket turns stay pending until the pushed history confirms them
+    const userMsg = { sender: "user", text: input, pending: viaSocket };
 
     setConversations((prev) => {
       const next = { ...prev };
@@ -240,17 +337,24 @@ export default function App() {
     setLoading(true);
 
     try {
-      console.log("📡 Chat request →", `${API_URL}/chat`, payload);
+      let botText;
+      if (viaSocket) {
+        if (boundSession.current !== activeSession) bindSession(userId, activeSession);
+        botText = await chatOverSocket(payload.user_query, thinkingId);
+      } else {
+        console.log("📡 Chat request →", `${API_URL}/chat`, payload);
 
-      await ensureSessionOnServer(userId, activeSession);
+        await ensureSessionOnServer(userId, activeSession);
 
-      const res = await axios.post(`${API_URL}/chat`, payload, {
-        timeout: 120000,
-        headers: { "Content-Type": "application/json" },
-      });
+        // The server stops working on the request once this deadline passes
+        const res = await axios.post(`${API_URL}/chat`, payload, {
+          timeout: 120000,
+          headers: { "Content-Type": "application/json", "X-Request-Timeout": "120" },
+        });
+        botText = res.data?.response || res.data?.result || res.data?.answer;
+      }
 
-      const botText = res.data?.response || res.data?.result || res.data?.answer || "No response";
-      const aiMsg = { sender: "bot", text: botText };
+      const aiMsg = { sender: "bot", text: botText || "No response", pending: viaSocket };
 
       setConversations((prev) => {
         const prevMessages = prev[activeSession] || [];
@@ -281,6 +385,7 @@ export default function App() {
       });
     } finally {
       setLoading(false);
+      setStage(null);
     }
   }
 
@@ -299,14 +404,14 @@ export default function App() {
         <div
           style={{
             padding: "8px 16px",
-            background: apiStatus === "connected" ? "#d4edda" : "#f8d7da",
-            color: apiStatus === "connected" ? "#155724" : "#721c24",
+            background: apiStatus === "connected" ? "#d4edda" : apiStatus === "degraded" ? "#fff3cd" : "#f8d7da",
+            color: apiStatus === "connected" ? "#155724" : apiStatus === "degraded" ? "#856404" : "#721c24",
             fontSize: "12px",
             borderRadius: "4px",
             margin: "8px",
           }}
         >
-          API: {apiStatus === "connected" ? "✅ Connected" : "❌ Disconnected"}
+          API: {apiStatus === "connected" ? "✅ Connected" : apiStatus === "degraded" ? "⚠ Degraded" : "❌ Disconnected"}
         </div>
 
         <div className="session-list">
@@ -340,7 +445,7 @@ export default function App() {
       <main className="chat-panel">
         <div className="chat-header">
           <h2>{activeSession ? `Session: ${activeSession}` : "No session selected"}</h2>
-          {loading && <div className="loading-indicator">Thinking…</div>}
+          {loading && <div className="loading-indicator">Thinking…{stage ? ` (${stage})` : ""}</div>}
         </div>
 
         <div className="messages">